@@ -0,0 +1,215 @@
+"""
+Contrôle d'admission des générations.
+
+Au-delà de ADMISSION_MAX_IN_FLIGHT générations simultanées, les nouvelles
+requêtes attendent dans une file bornée propre à leur voie :
+- "interactive" : questions de l'interface (/ask, /ask/stream), servies en priorité
+- "batch" : lots et rejeux (/ask/batch, ou en-tête X-Request-Lane: batch), limités
+  à ADMISSION_BATCH_MAX_IN_FLIGHT unités pour laisser de la place aux utilisateurs
+
+Une requête dont la file est pleine, ou qui attend plus que le délai de sa voie,
+est refusée immédiatement (429 avec Retry-After) plutôt que de ralentir toutes
+les autres. Un lot compte pour plusieurs unités (ses générations simultanées).
+
+Le contrôleur s'exécute dans la boucle d'événements de l'API : il n'utilise pas
+de verrou. ADMISSION_MAX_IN_FLIGHT=0 le désactive.
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16"))
+ADMISSION_BATCH_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_BATCH_MAX_IN_FLIGHT", str(max(1, ADMISSION_MAX_IN_FLIGHT // 2))))
+ADMISSION_INTERACTIVE_QUEUE_SIZE = int(os.getenv("ADMISSION_INTERACTIVE_QUEUE_SIZE", "32"))
+ADMISSION_INTERACTIVE_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_INTERACTIVE_QUEUE_TIMEOUT_S", "10"))
+ADMISSION_BATCH_QUEUE_SIZE = int(os.getenv("ADMISSION_BATCH_QUEUE_SIZE", "8"))
+ADMISSION_BATCH_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_BATCH_QUEUE_TIMEOUT_S", "120"))
+# Délai minimal suggéré aux clients refusés (secondes)
+ADMISSION_RETRY_AFTER_S = int(os.getenv("ADMISSION_RETRY_AFTER_S", "2"))
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Ordre de service quand une place se libère
+LANES = (INTERACTIVE, BATCH)
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée faute de capacité (file pleine ou attente trop longue)."""
+
+    def __init__(self, lane: str, reason: str, retry_after: int):
+        super().__init__(f"Capacité atteinte pour la voie '{lane}' ({reason})")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Lane:
+    max_in_flight: int
+    queue_size: int
+    queue_timeout: float
+    in_flight: int = 0
+    queue: Deque[Tuple[asyncio.Future, int]] = field(default_factory=deque)
+    admitted: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+
+
+@dataclass
+class Ticket:
+    """Place accordée à une requête ; release() est sans effet après le premier appel."""
+    lane: str
+    weight: int
+    started: float
+    released: bool = False
+
+
+class AdmissionController:
+    """Limite les générations simultanées avec une file d'attente bornée par voie."""
+
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 batch_max_in_flight: int = ADMISSION_BATCH_MAX_IN_FLIGHT,
+                 interactive_queue_size: int = ADMISSION_INTERACTIVE_QUEUE_SIZE,
+                 interactive_queue_timeout: float = ADMISSION_INTERACTIVE_QUEUE_TIMEOUT_S,
+                 batch_queue_size: int = ADMISSION_BATCH_QUEUE_SIZE,
+                 batch_queue_timeout: float = ADMISSION_BATCH_QUEUE_TIMEOUT_S,
+                 retry_after: int = ADMISSION_RETRY_AFTER_S):
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.lanes: Dict[str, Lane] = {
+            INTERACTIVE: Lane(max_in_flight, interactive_queue_size, interactive_queue_timeout),
+            BATCH: Lane(min(batch_max_in_flight, max_in_flight), batch_queue_size, batch_queue_timeout),
+        }
+        self.in_flight = 0
+        # Durée moyenne (lissée) d'une génération, pour estimer Retry-After
+        self._service_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    def _weight(self, lane: Lane, weight: int) -> int:
+        return max(1, min(weight, lane.max_in_flight))
+
+    def _can_start(self, lane: Lane, weight: int) -> bool:
+        return self.in_flight + weight <= self.max_in_flight and lane.in_flight + weight <= lane.max_in_flight
+
+    def _start(self, name: str, weight: int) -> Ticket:
+        lane = self.lanes[name]
+        self.in_flight += weight
+        lane.in_flight += weight
+        lane.admitted += 1
+        return Ticket(lane=name, weight=weight, started=time.perf_counter())
+
+    def _estimate_retry_after(self, lane: Lane) -> int:
+        waiting = sum(weight for _, weight in lane.queue)
+        estimate = self._service_time * (waiting + 1) / max(1, lane.max_in_flight)
+        return max(self.retry_after, math.ceil(estimate))
+
+    def _dispatch(self) -> None:
+        """Accorde les places libres aux premières requêtes en attente, par ordre de priorité."""
+        for name in LANES:
+            lane = self.lanes[name]
+            while lane.queue:
+                future, weight = lane.queue[0]
+                if future.done():
+                    # Attente abandonnée (délai dépassé ou client parti)
+                    lane.queue.popleft()
+                    continue
+                if not self._can_start(lane, weight):
+                    break
+                lane.queue.popleft()
+                future.set_result(self._start(name, weight))
+            if lane.queue and name == INTERACTIVE:
+                # Les utilisateurs attendent encore : pas de place pour les lots
+                return
+
+    async def acquire(self, name: str = INTERACTIVE, weight: int = 1) -> Optional[Ticket]:
+        """Attend une place dans la voie ; lève AdmissionRejected si ce n'est pas possible."""
+        if not self.enabled:
+            return None
+        lane = self.lanes[name]
+        weight = self._weight(lane, weight)
+
+        # Pas de dépassement de la file : seules les voies prioritaires vides laissent passer
+        ahead = any(self.lanes[other].queue for other in LANES[:LANES.index(name) + 1])
+        if not ahead and self._can_start(lane, weight):
+            return self._start(name, weight)
+
+        if len(lane.queue) >= lane.queue_size:
+            lane.rejected_queue_full += 1
+            raise AdmissionRejected(name, "queue_full", self._estimate_retry_after(lane))
+
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.append((future, weight))
+        try:
+            return await asyncio.wait_for(future, lane.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(lane, future)
+            lane.rejected_timeout += 1
+            raise AdmissionRejected(name, "queue_timeout", self._estimate_retry_after(lane))
+        except asyncio.CancelledError:
+            self._forget(lane, future)
+            # Place accordée au moment où le client est parti : on la rend
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+
+    @staticmethod
+    def _forget(lane: Lane, future: asyncio.Future) -> None:
+        """Retire une attente abandonnée de la file (elle ne compte plus dans sa taille)."""
+        for entry in lane.queue:
+            if entry[0] is future:
+                lane.queue.remove(entry)
+                return
+
+    def release(self, ticket: Optional[Ticket]) -> None:
+        """Rend la place d'une requête terminée et la donne à la suivante."""
+        if ticket is None or ticket.released:
+            return
+        ticket.released = True
+        lane = self.lanes[ticket.lane]
+        self.in_flight -= ticket.weight
+        lane.in_flight -= ticket.weight
+        duration = time.perf_counter() - ticket.started
+        self._service_time = duration if not self._service_time else 0.8 * self._service_time + 0.2 * duration
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, name: str = INTERACTIVE, weight: int = 1) -> AsyncIterator[Optional[Ticket]]:
+        ticket = await self.acquire(name, weight)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Occupation et refus par voie."""
+        return {
+            "enabled": self.enabled,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "service_time_s": self._service_time,
+            "lanes": {
+                name: {
+                    "max_in_flight": lane.max_in_flight,
+                    "in_flight": lane.in_flight,
+                    "queued": len(lane.queue),
+                    "queue_size": lane.queue_size,
+                    "queue_timeout_s": lane.queue_timeout,
+                    "admitted": lane.admitted,
+                    "rejected_queue_full": lane.rejected_queue_full,
+                    "rejected_timeout": lane.rejected_timeout,
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
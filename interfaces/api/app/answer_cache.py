@@ -0,0 +1,142 @@
+"""
+Cache sémantique des réponses.
+
+Mémorise les réponses déjà générées avec l'embedding de leur question. Une
+nouvelle question dont l'embedding est suffisamment proche (similarité cosinus)
+d'une question en cache reçoit directement la réponse mémorisée, sans recherche
+ni appel au LLM. Le cache est vidé dès que la version des vector stores change.
+"""
+
+from collections import OrderedDict
+import copy
+import time
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """Index vectoriel en mémoire des réponses passées, avec éviction LRU et TTL."""
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        # Emplacement dans la matrice -> entrée, dans l'ordre LRU
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._index_version: Optional[str] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version: str) -> None:
+        """Vide le cache si les vector stores ont changé (appelé sous verrou)."""
+        if index_version == self._index_version:
+            return
+        if self._entries:
+            logger.info(f"Version des vector stores modifiée, invalidation de {len(self._entries)} réponses en cache")
+            self.invalidations += 1
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._index_version = index_version
+
+    def _release(self, slot: int) -> None:
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    def lookup(self, embedding: List[float], index_version: str) -> Optional[Dict[str, Any]]:
+        """Renvoie une copie de la réponse la plus proche si elle dépasse le seuil."""
+        query = self._normalize(embedding)
+
+        with self._lock:
+            self._check_version(index_version)
+            if not self._entries or self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+            expired = time.time() - self._created_at[slots] > self.ttl_seconds
+            for slot in slots[expired]:
+                self._release(int(slot))
+                self.evictions += 1
+
+            slots = slots[~expired]
+            if slots.size == 0:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[slots] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(slots[best])
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            entry = self._entries[slot]
+            # Ni la question ni la réponse dans les logs : la similarité et l'identifiant suffisent
+            logger.info(f"Réponse en cache (similarité {similarities[best]:.3f}, "
+                        f"réponse {entry['response'].get('response_id', 'sans identifiant')})")
+            return copy.deepcopy(entry["response"])
+
+    def store(self, question: str, embedding: List[float], index_version: str, response: Dict[str, Any]) -> None:
+        """Ajoute une réponse au cache, en évinçant la moins récemment utilisée si besoin."""
+        if self.max_entries <= 0:
+            return
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            self._check_version(index_version)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries.clear()
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+            if not self._free_slots:
+                oldest = next(iter(self._entries))
+                self._release(oldest)
+                self.evictions += 1
+
+            slot = self._free_slots.pop()
+            self._matrix[slot] = vector
+            self._created_at[slot] = time.time()
+            self._entries[slot] = {"question": question, "response": copy.deepcopy(response)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "index_version": self._index_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
@@ -0,0 +1,126 @@
+"""
+Cache persistant des embeddings de documents, adressé par le contenu.
+
+La clé d'un vecteur est l'empreinte SHA-256 du nom du modèle et du texte du
+document : un texte inchangé d'un export à l'autre n'est jamais revectorisé,
+quel que soit l'endroit où il apparaît. Changer de modèle invalide naturellement
+toutes les entrées.
+
+Chaque lecture ou écriture met à jour la date de dernière utilisation des
+vecteurs : prune() supprime ceux qu'aucune construction n'a utilisés depuis
+max_age_seconds, quel que soit leur modèle. Le fichier peut donc être partagé
+par plusieurs fournisseurs d'embeddings sans qu'une construction avec l'un
+efface les vecteurs (parfois payants) des autres ; purge_other_models() les
+supprime explicitement.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Dict, List, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dimension INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL
+);
+"""
+
+# Nombre maximal de paramètres par requête SQLite
+LOOKUP_CHUNK = 500
+
+
+def content_key(model_name: str, text: str) -> str:
+    """Clé d'un texte pour un modèle donné."""
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class ContentEmbeddingCache:
+    """Vecteurs de documents enregistrés dans un fichier SQLite."""
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(embeddings)")}
+        if "last_used" not in columns:
+            # Cache créé par une version précédente : la date de création tient lieu de dernière utilisation
+            with self._connection:
+                self._connection.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL")
+                self._connection.execute("UPDATE embeddings SET last_used = created_at")
+
+    def key(self, text: str) -> str:
+        return content_key(self.model_name, text)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Vecteurs connus parmi les clés demandées."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._connection:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+                self._connection.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *chunk]
+                )
+        return found
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]) -> None:
+        now = time.time()
+        rows = [(key, self.model_name, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now, now)
+                for key, vector in items]
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dimension, vector, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Supprime les vecteurs inutilisés depuis max_age_seconds ; renvoie le nombre d'entrées supprimées."""
+        with self._connection:
+            removed = self._connection.execute(
+                "DELETE FROM embeddings WHERE last_used < ?", (time.time() - max_age_seconds,)
+            ).rowcount
+        self._reclaim(removed)
+        return removed
+
+    def purge_other_models(self) -> int:
+        """Supprime les vecteurs de tous les autres modèles ; renvoie le nombre d'entrées supprimées."""
+        with self._connection:
+            removed = self._connection.execute(
+                "DELETE FROM embeddings WHERE model != ?", (self.model_name,)
+            ).rowcount
+        self._reclaim(removed)
+        return removed
+
+    def _reclaim(self, removed: int) -> None:
+        if removed:
+            # Rend au système l'espace libéré par les suppressions
+            self._connection.execute("VACUUM")
+            logger.info(f"{removed} embeddings supprimés du cache {self.path}")
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
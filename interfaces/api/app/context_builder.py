@@ -0,0 +1,328 @@
+"""
+Construction du contexte documentaire des prompts.
+
+Les passages retrouvés dans les vector stores (k par base) sont assemblés dans
+la limite d'un budget de tokens par requête (CONTEXT_TOKEN_BUDGET) :
+1. les passages quasi identiques (même extrait présent dans plusieurs bases,
+   fenêtres de découpage qui se recouvrent) ne sont gardés qu'une fois, au rang
+   du premier et dans leur version la plus complète ;
+2. si le contexte complet tient dans le budget, il est envoyé tel quel ;
+3. sinon, les phrases sont classées par pertinence pour la question (BM25 sur
+   les phrases des passages retenus) et les meilleures sont gardées jusqu'au
+   budget. Chaque passage conserve sa citation et ses phrases restent dans
+   l'ordre du texte, les coupures étant signalées par « […] ».
+
+Aucun passage n'est tronqué au milieu d'une phrase ; seule une phrase isolée
+plus longue que tout le budget est coupée, avec le même marqueur.
+"""
+
+import os
+import re
+import math
+import logging
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Sequence, Tuple
+
+from app.tokens import count_tokens
+from app.logging_config import debug_enabled
+
+logger = logging.getLogger(__name__)
+
+# Budget de tokens du contexte d'une requête (0 pour envoyer tous les passages en entier)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Budget réduit de l'appel direct au LLM, utilisé quand les chaînes échouent
+CONTEXT_FALLBACK_TOKEN_BUDGET = int(os.getenv("CONTEXT_FALLBACK_TOKEN_BUDGET", "1000"))
+# Part des trigrammes de mots du plus court des deux passages présente dans l'autre
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.9"))
+
+EMPTY_CONTEXT = "Aucun document pertinent trouvé."
+OMISSION_MARKER = "[…]"
+
+# Fin de phrase suivie d'une majuscule, ou saut de ligne (paragraphes numérotés, lignes de barème)
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;])\s+(?=[A-ZÀ-ÖØ-Þ«\"(•-])|\s*\n\s*")
+_WORD = re.compile(r"\w+")
+
+# Mots sans valeur pour juger de la pertinence d'une phrase
+STOPWORDS = frozenset("""
+a au aux avec ce ces cet cette comment d dans de des du elle en est et etc il ils
+je l la le les leur leurs lui ma mais me mes mon ne ni nos notre nous on ou par pas
+peut plus pour qu quand que quel quelle quelles quels qui sa sans se ses si son sont
+sur ta te tes ton tu un une vos votre vous y etre avoir fait faire comme dont entre
+""".split())
+
+# Préfixe conservé des mots (racinisation grossière : imposable, imposition -> impos)
+_STEM_LENGTH = 6
+
+# Paramètres BM25
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+@dataclass(frozen=True)
+class Passage:
+    """Passage retrouvé, avec la citation de sa source telle qu'elle figure dans le prompt."""
+    citation: str
+    content: str
+
+
+@dataclass(frozen=True)
+class ContextPassage:
+    """Passage retenu dans le contexte ; index est son rang parmi les passages retrouvés."""
+    index: int
+    citation: str
+    text: str
+    compressed: bool
+
+
+@dataclass(frozen=True)
+class BuiltContext:
+    text: str
+    passages: Tuple[ContextPassage, ...]
+    tokens: int
+    # Tokens des passages dédupliqués avant sélection des phrases
+    source_tokens: int
+    duplicates: int
+
+    @property
+    def compressed(self) -> bool:
+        """Contexte réduit pour tenir dans le budget (phrases ou passages entiers écartés)."""
+        return self.tokens < self.source_tokens or any(passage.compressed for passage in self.passages)
+
+
+@dataclass
+class _Sentence:
+    passage: int
+    position: int
+    start: int
+    end: int
+    tokens: int
+    terms: Counter
+
+
+def _fold(text: str) -> str:
+    """Minuscules sans accents."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(_fold(text))
+
+
+def _terms(text: str) -> List[str]:
+    """Mots significatifs, réduits à leur préfixe."""
+    return [word[:_STEM_LENGTH] for word in _words(text) if word not in STOPWORDS and len(word) > 1]
+
+
+def _shingles(text: str) -> FrozenSet[Tuple[str, ...]]:
+    words = _words(text)
+    if len(words) < 3:
+        return frozenset([tuple(words)]) if words else frozenset()
+    return frozenset(zip(words, words[1:], words[2:]))
+
+
+def _overlap(first: FrozenSet, second: FrozenSet) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / min(len(first), len(second))
+
+
+def _header(number: int, citation: str) -> str:
+    return f"Document {number} {citation}:\n"
+
+
+def _sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """Positions (début, fin) des phrases non vides du texte."""
+    spans = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        if text[start:match.start()].strip():
+            spans.append((start, match.start()))
+        start = match.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def _bm25(query: Sequence[str], sentences: List[_Sentence]) -> List[float]:
+    """Score BM25 de chaque phrase pour les termes de la question."""
+    query_terms = set(query)
+    if not query_terms or not sentences:
+        return [0.0] * len(sentences)
+    count = len(sentences)
+    frequencies = Counter(term for sentence in sentences for term in query_terms & sentence.terms.keys())
+    idf = {term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()}
+    average_length = sum(sum(s.terms.values()) for s in sentences) / count or 1.0
+
+    scores = []
+    for sentence in sentences:
+        length = sum(sentence.terms.values())
+        score = 0.0
+        for term, weight in idf.items():
+            tf = sentence.terms.get(term, 0)
+            if tf:
+                score += weight * tf * (_BM25_K1 + 1) / (
+                    tf + _BM25_K1 * (1 - _BM25_B + _BM25_B * length / average_length)
+                )
+        scores.append(score)
+    return scores
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Début du texte, coupé entre deux mots, tenant en max_tokens avec le marqueur de coupure."""
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(" ".join(words[:middle]) + f" {OMISSION_MARKER}") <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + f" {OMISSION_MARKER}" if low else ""
+
+
+def _assemble(kept: List[Tuple[int, Passage]], bodies: Dict[int, Tuple[str, bool]]) -> Tuple[str, Tuple[ContextPassage, ...]]:
+    parts = []
+    passages = []
+    for position, (index, passage) in enumerate(kept):
+        if position not in bodies:
+            continue
+        body, compressed = bodies[position]
+        parts.append(_header(len(parts) + 1, passage.citation) + body)
+        passages.append(ContextPassage(index=index, citation=passage.citation, text=body, compressed=compressed))
+    return "\n\n".join(parts), tuple(passages)
+
+
+def _compressed_bodies(kept: List[Tuple[int, Passage]], sentences: List[_Sentence],
+                       selected: List[int]) -> Dict[int, Tuple[str, bool]]:
+    """Texte de chaque passage réduit aux phrases choisies, dans l'ordre du texte."""
+    by_passage: Dict[int, List[_Sentence]] = {}
+    for number in sorted(selected, key=lambda n: (sentences[n].passage, sentences[n].position)):
+        by_passage.setdefault(sentences[number].passage, []).append(sentences[number])
+
+    bodies = {}
+    for position, chosen in by_passage.items():
+        content = kept[position][1].content
+        total = sum(1 for sentence in sentences if sentence.passage == position)
+        runs = []
+        run_start = run_end = chosen[0]
+        for sentence in chosen[1:]:
+            if sentence.position == run_end.position + 1:
+                run_end = sentence
+            else:
+                runs.append((run_start, run_end))
+                run_start = run_end = sentence
+        runs.append((run_start, run_end))
+
+        # Les suites de phrases contiguës gardent leur mise en forme d'origine
+        pieces = [content[first.start:last.end].strip() for first, last in runs]
+        body = f" {OMISSION_MARKER} ".join(pieces)
+        if chosen[0].position > 0:
+            body = f"{OMISSION_MARKER} {body}"
+        if chosen[-1].position < total - 1:
+            body = f"{body} {OMISSION_MARKER}"
+        bodies[position] = (body, len(chosen) < total)
+    return bodies
+
+
+def _truncated_context(kept: List[Tuple[int, Passage]], sentence: _Sentence, token_budget: int,
+                       source_tokens: int, duplicates: int) -> BuiltContext:
+    """Contexte réduit au début d'une seule phrase, coupée pour tenir dans token_budget."""
+    index, passage = kept[sentence.passage]
+    content = passage.content[sentence.start:sentence.end].strip()
+    room = token_budget - count_tokens(_header(1, passage.citation))
+    while room > 0:
+        body = _truncate(content, room)
+        if not body:
+            break
+        text, built = _assemble([(index, passage)], {0: (body, True)})
+        tokens = count_tokens(text)
+        if tokens <= token_budget:
+            return BuiltContext(text, built, tokens, source_tokens, duplicates)
+        # L'en-tête et le texte comptés ensemble peuvent dépasser la somme des deux
+        room -= tokens - token_budget
+    return BuiltContext(EMPTY_CONTEXT, (), count_tokens(EMPTY_CONTEXT), source_tokens, duplicates)
+
+
+def build_context(question: str, passages: Sequence[Passage],
+                  token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD) -> BuiltContext:
+    """Assemble les passages (dans l'ordre de la recherche) en un contexte tenant dans token_budget."""
+    kept: List[Tuple[int, Passage]] = []
+    kept_shingles: List[FrozenSet] = []
+    duplicates = 0
+    for index, passage in enumerate(passages):
+        content = passage.content.strip()
+        if not content:
+            continue
+        shingles = _shingles(content)
+        duplicate_of = next((position for position, other in enumerate(kept_shingles)
+                             if _overlap(shingles, other) >= duplicate_threshold), None)
+        if duplicate_of is not None:
+            duplicates += 1
+            # Un passage qui englobe le précédent (fenêtre plus large) le remplace à son rang
+            if len(shingles) > len(kept_shingles[duplicate_of]):
+                kept[duplicate_of] = (index, Passage(passage.citation, content))
+                kept_shingles[duplicate_of] = shingles
+            continue
+        kept.append((index, Passage(passage.citation, content)))
+        kept_shingles.append(shingles)
+
+    if not kept:
+        return BuiltContext(EMPTY_CONTEXT, (), count_tokens(EMPTY_CONTEXT), 0, duplicates)
+
+    text, built = _assemble(kept, {position: (passage.content, False) for position, (_, passage) in enumerate(kept)})
+    source_tokens = count_tokens(text)
+    if token_budget <= 0 or source_tokens <= token_budget:
+        return BuiltContext(text, built, source_tokens, source_tokens, duplicates)
+
+    sentences = []
+    for position, (_, passage) in enumerate(kept):
+        for number, (start, end) in enumerate(_sentence_spans(passage.content)):
+            piece = passage.content[start:end]
+            sentences.append(_Sentence(position, number, start, end, count_tokens(piece), Counter(_terms(piece))))
+    scores = _bm25(_terms(question), sentences)
+    # Les plus pertinentes d'abord ; à égalité, les premiers passages et le début des passages
+    ranking = sorted(range(len(sentences)),
+                     key=lambda n: (-scores[n], sentences[n].passage, sentences[n].position))
+
+    # Coût d'un passage ouvert : son en-tête, les séparateurs et les marqueurs de coupure
+    opening_cost = {
+        position: count_tokens(_header(len(kept), passage.citation)) + 2 * count_tokens(f" {OMISSION_MARKER} ") + 1
+        for position, (_, passage) in enumerate(kept)
+    }
+    selected: List[int] = []
+    opened = set()
+    used = 0
+    for number in ranking:
+        sentence = sentences[number]
+        cost = sentence.tokens + count_tokens(f" {OMISSION_MARKER} ")
+        if sentence.passage not in opened:
+            cost += opening_cost[sentence.passage]
+        if used + cost > token_budget:
+            continue
+        selected.append(number)
+        opened.add(sentence.passage)
+        used += cost
+
+    if not selected:
+        # Même la phrase la plus pertinente dépasse le budget : on la coupe explicitement
+        return _truncated_context(kept, sentences[ranking[0]], token_budget, source_tokens, duplicates)
+
+    # Le décompte par morceaux n'est qu'approché : on retire les moins pertinentes si besoin
+    while True:
+        text, built = _assemble(kept, _compressed_bodies(kept, sentences, selected))
+        tokens = count_tokens(text)
+        if tokens <= token_budget:
+            break
+        if len(selected) == 1:
+            # La dernière phrase gardée dépasse encore le budget une fois assemblée
+            return _truncated_context(kept, sentences[selected[0]], token_budget, source_tokens, duplicates)
+        selected.pop()
+
+    if debug_enabled():
+        logger.debug(f"Contexte réduit de {source_tokens} à {tokens} tokens "
+                     f"({len(selected)}/{len(sentences)} phrases, {duplicates} doublons écartés)")
+    return BuiltContext(text, built, tokens, source_tokens, duplicates)
@@ -0,0 +1,192 @@
+"""
+Cache des embeddings de questions.
+
+Enveloppe un modèle d'embedding LangChain et mémorise les vecteurs des questions
+déjà posées (LRU borné avec durée de vie), éventuellement persistés dans un
+fichier local pour survivre aux redémarrages.
+"""
+
+from langchain_core.embeddings import Embeddings
+from app import providers
+from collections import OrderedDict
+import asyncio
+import os
+import re
+import time
+import logging
+import threading
+import unicodedata
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text: str) -> str:
+    """Normalise une question (casse, accents composés, espaces, ponctuation finale)."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Cache LRU avec TTL devant le modèle d'embedding, pour les questions uniquement."""
+
+    def __init__(self, embeddings: Embeddings, model_name: str,
+                 max_entries: int = 1024, ttl_seconds: float = 86400,
+                 persist_path: Optional[str] = None, persist_every: int = 50):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.persist_every = persist_every
+
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Tuple[float, ...]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.persist_path:
+            self.load()
+
+    def _key(self, text: str) -> Tuple[str, str]:
+        return self.model_name, normalize_question(text)
+
+    def _get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def _put(self, key: Tuple[str, str], embedding: List[float], created_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (created_at or time.time(), tuple(float(x) for x in embedding))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+
+    def _should_persist(self) -> bool:
+        with self._lock:
+            if not self.persist_path or not self.persist_every or self._unsaved < self.persist_every:
+                return False
+            self._unsaved = 0
+            return True
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        embedding = self._get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self._put(key, embedding)
+            if self._should_persist():
+                self.save()
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        embedding = self._get(key)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(text)
+            self._put(key, embedding)
+            if self._should_persist():
+                # Écriture du fichier hors de la boucle d'événements
+                asyncio.get_running_loop().run_in_executor(None, self.save)
+        return embedding
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeddings de plusieurs questions : un seul appel au modèle pour celles absentes du cache."""
+        keys = [self._key(text) for text in texts]
+        embeddings = [self._get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = providers.embed_queries(self.embeddings, [texts[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+                self._put(keys[i], embedding)
+            if self._should_persist():
+                self.save()
+        return embeddings
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.embed_queries, texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+    def load(self) -> None:
+        """Recharge les entrées non expirées depuis le fichier de persistance."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                models, texts = data["models"], data["texts"]
+                created, vectors = data["created_at"], data["embeddings"]
+
+            now = time.time()
+            loaded = 0
+            for model, text, created_at, vector in zip(models, texts, created, vectors):
+                if str(model) == self.model_name and now - float(created_at) <= self.ttl_seconds:
+                    self._put((str(model), str(text)), vector.tolist(), float(created_at))
+                    loaded += 1
+            self._unsaved = 0
+            logger.info(f"Cache d'embeddings rechargé: {loaded} entrées depuis {self.persist_path}")
+        except Exception as e:
+            logger.error(f"Impossible de recharger le cache d'embeddings {self.persist_path}: {str(e)}")
+
+    def save(self) -> None:
+        """Écrit le contenu du cache dans le fichier de persistance (écriture atomique)."""
+        if not self.persist_path:
+            return
+
+        with self._lock:
+            entries = list(self._entries.items())
+        if not entries:
+            return
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.persist_path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                models=np.array([key[0] for key, _ in entries]),
+                texts=np.array([key[1] for key, _ in entries]),
+                created_at=np.array([value[0] for _, value in entries], dtype=np.float64),
+                embeddings=np.array([value[1] for _, value in entries], dtype=np.float32)
+            )
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"Cache d'embeddings sauvegardé: {len(entries)} entrées dans {self.persist_path}")
+        except Exception as e:
+            logger.error(f"Impossible de sauvegarder le cache d'embeddings {self.persist_path}: {str(e)}")
@@ -0,0 +1,207 @@
+"""
+Vectorisation hors ligne d'un corpus, par lots, avec reprise après interruption.
+
+Les documents sont découpés en lots de taille fixe ; plusieurs lots sont envoyés
+en parallèle au modèle d'embedding. Les erreurs de quota (HTTP 429) suspendent
+tous les envois pendant un délai croissant avant de réessayer, et un plafond de
+requêtes par minute peut être imposé.
+
+Les vecteurs sont écrits au fil de l'eau dans un fichier .npy projeté en mémoire
+(vectors.npy) et les lots terminés sont enregistrés dans progress.json : une
+exécution interrompue reprend là où elle s'était arrêtée, à condition que le
+corpus, le modèle et la taille des lots n'aient pas changé.
+"""
+
+from langchain_core.documents import Document
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+PROGRESS_FILE = "progress.json"
+
+# Fragments identifiant une erreur de quota, quel que soit le client utilisé
+RATE_LIMIT_MARKERS = ("429", "resourceexhausted", "resource exhausted", "quota", "rate limit", "too many requests")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Détecte une erreur de quota (google.api_core.exceptions.ResourceExhausted, HTTP 429...)."""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+def corpus_fingerprint(texts: List[str], model_name: str, batch_size: int) -> str:
+    """Empreinte du travail à effectuer, pour refuser de reprendre un checkpoint incompatible."""
+    digest = hashlib.sha256(f"{model_name}\n{batch_size}\n{len(texts)}\n".encode("utf-8"))
+    for text in texts:
+        digest.update(hashlib.sha256(text.encode("utf-8")).digest())
+    return digest.hexdigest()
+
+
+class RateLimiter:
+    """Plafond de requêtes par minute et pause commune après une erreur de quota."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class EmbeddingCheckpoint:
+    """Vecteurs déjà calculés (vectors.npy) et lots terminés (progress.json) d'un travail."""
+
+    def __init__(self, work_dir: str, fingerprint: str, n_documents: int, batch_size: int):
+        self.work_dir = work_dir
+        self.fingerprint = fingerprint
+        self.n_documents = n_documents
+        self.batch_size = batch_size
+        self.completed = set()
+        self.vectors = None
+        os.makedirs(work_dir, exist_ok=True)
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.work_dir, VECTORS_FILE)
+
+    @property
+    def progress_path(self) -> str:
+        return os.path.join(self.work_dir, PROGRESS_FILE)
+
+    def resume(self) -> bool:
+        """Rouvre un checkpoint existant s'il correspond au même travail."""
+        if not (os.path.exists(self.progress_path) and os.path.exists(self.vectors_path)):
+            return False
+        with open(self.progress_path, encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("fingerprint") != self.fingerprint:
+            logger.warning(f"Checkpoint de {self.work_dir} ignoré : corpus, modèle ou taille de lot différents")
+            return False
+        self.vectors = np.load(self.vectors_path, mmap_mode="r+")
+        self.completed = set(progress["completed_batches"])
+        return True
+
+    def create(self, dimension: int) -> None:
+        self.vectors = np.lib.format.open_memmap(
+            self.vectors_path, mode="w+", dtype=np.float32, shape=(self.n_documents, dimension)
+        )
+        self.completed = set()
+        self.save_progress()
+
+    def write(self, batch: int, vectors: List[List[float]]) -> None:
+        start = batch * self.batch_size
+        self.vectors[start:start + len(vectors)] = np.asarray(vectors, dtype=np.float32)
+        self.completed.add(batch)
+
+    def save_progress(self) -> None:
+        """Écrit les vecteurs sur disque puis la liste des lots terminés (écriture atomique)."""
+        self.vectors.flush()
+        tmp_path = f"{self.progress_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "n_documents": self.n_documents,
+                       "batch_size": self.batch_size, "dimension": int(self.vectors.shape[1]),
+                       "completed_batches": sorted(self.completed)}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def remove(self) -> None:
+        for path in (self.vectors_path, self.progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def embed_with_retry(embeddings, texts: List[str], limiter: RateLimiter,
+                     max_retries: int = 8, base_delay: float = 2.0, max_delay: float = 60.0) -> List[List[float]]:
+    """Vectorise un lot, en réessayant avec un délai exponentiel après une erreur."""
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if is_rate_limit_error(e):
+                # Tous les lots en cours attendent : inutile d'insister sur le quota
+                limiter.pause(delay)
+                logger.warning(f"Quota atteint, pause de {delay:.1f}s (tentative {attempt + 1}/{max_retries})")
+            else:
+                logger.warning(f"Erreur d'embedding ({str(e)}), nouvel essai dans {delay:.1f}s")
+                time.sleep(delay)
+
+
+def embed_corpus(documents: List[Document], embeddings, work_dir: str, model_name: str = "",
+                 batch_size: int = 100, concurrency: int = 4, requests_per_minute: Optional[float] = None,
+                 max_retries: int = 8, checkpoint_every: int = 10) -> np.ndarray:
+    """
+    Vectorise le contenu des documents et retourne la matrice des vecteurs (projetée en mémoire).
+
+    Les lots déjà présents dans le checkpoint de work_dir ne sont pas recalculés.
+    """
+    texts = [doc.page_content for doc in documents]
+    if not texts:
+        raise ValueError("Aucun document à vectoriser")
+    n_batches = (len(texts) + batch_size - 1) // batch_size
+    checkpoint = EmbeddingCheckpoint(work_dir, corpus_fingerprint(texts, model_name, batch_size),
+                                     len(texts), batch_size)
+    limiter = RateLimiter(requests_per_minute)
+
+    def batch_texts(batch: int) -> List[str]:
+        return texts[batch * batch_size:(batch + 1) * batch_size]
+
+    if checkpoint.resume():
+        logger.info(f"Reprise du checkpoint {work_dir}: {len(checkpoint.completed)}/{n_batches} lots déjà vectorisés")
+    else:
+        # Le premier lot donne la dimension des vecteurs
+        first = embed_with_retry(embeddings, batch_texts(0), limiter, max_retries)
+        checkpoint.create(len(first[0]))
+        checkpoint.write(0, first)
+        checkpoint.save_progress()
+
+    pending = [batch for batch in range(n_batches) if batch not in checkpoint.completed]
+    start = time.perf_counter()
+    done_since_save = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embedding") as executor:
+        futures = {executor.submit(embed_with_retry, embeddings, batch_texts(batch), limiter, max_retries): batch
+                   for batch in pending}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                # Écritures depuis ce seul thread : pas de verrou sur le memmap
+                checkpoint.write(futures[future], future.result())
+                done_since_save += 1
+                if done_since_save >= checkpoint_every:
+                    checkpoint.save_progress()
+                    done_since_save = 0
+                    rate = done * batch_size / (time.perf_counter() - start)
+                    logger.info(f"Lots vectorisés: {len(checkpoint.completed)}/{n_batches} ({rate:.0f} documents/s)")
+        finally:
+            # En cas d'erreur ou d'interruption, les lots terminés restent acquis
+            for future in futures:
+                future.cancel()
+            checkpoint.save_progress()
+
+    logger.info(f"{len(texts)} documents vectorisés ({n_batches} lots)")
+    return checkpoint.vectors
+
@@ -0,0 +1,194 @@
+"""
+Chargement des index FAISS depuis le disque.
+
+Deux modes sont disponibles (variable d'environnement FAISS_LOAD_MODE) :
+- "memory" : l'index est lu entièrement en mémoire (comportement de FAISS.load_local)
+- "mmap" : l'index est ouvert en lecture seule et projeté en mémoire ; les pages
+  sont partagées entre processus via le cache du système et lues à la demande.
+
+FAISS ne sait projeter en mémoire que les listes inversées des index IVF. Les
+autres types (Flat, HNSW...) sont lus en mémoire même en mode "mmap".
+
+Les documents sont lus depuis docstore.sqlite s'il existe (voir sqlite_docstore),
+sinon depuis le docstore LangChain picklé index.pkl.
+
+Les paramètres de recherche des index approximatifs sont lus dans l'environnement,
+globalement ou par store (le suffixe est le nom du store en majuscules) :
+- FAISS_EF_SEARCH / FAISS_EF_SEARCH_BOFIP : efSearch des index HNSW
+- FAISS_NPROBE / FAISS_NPROBE_BOFIP : nombre de listes visitées par les index IVF
+
+LangChain n'offre pas de recherche de plusieurs vecteurs en un appel :
+search_by_vectors interroge directement l'index du store, uniquement pour les
+versions de langchain-community dont les attributs internes ont été vérifiés
+(voir batch_search_supported).
+"""
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from app.sqlite_docstore import SQLiteDocstore, SQLITE_DOCSTORE_FILE
+from importlib.metadata import PackageNotFoundError, version
+import os
+import pickle
+import struct
+import logging
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LOAD_MODES = ("memory", "mmap")
+FAISS_LOAD_MODE = os.getenv("FAISS_LOAD_MODE", "memory").lower()
+if FAISS_LOAD_MODE not in LOAD_MODES:
+    logger.warning(f"FAISS_LOAD_MODE inconnu '{FAISS_LOAD_MODE}', utilisation de 'memory'")
+    FAISS_LOAD_MODE = "memory"
+
+# Répertoire des vector stores servis par l'API, et stores attendus
+VECTOR_STORES_PATH = os.getenv("VECTOR_STORES_PATH", os.path.join(os.path.dirname(__file__), "vector_stores"))
+STORE_NAMES = ("cgi", "bofip", "bofip_bareme")
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+
+# Début commun des fichiers écrits par faiss.write_index : type (fourcc), dimension, nombre de vecteurs
+_INDEX_HEADER = struct.Struct("<4siq")
+# Préfixe des types d'index IVF, seuls projetables en mémoire
+_IVF_FOURCC_PREFIX = "Iw"
+
+# Versions de langchain-community dont le FAISS a les attributs lus par search_by_vectors
+BATCH_SEARCH_VERSIONS = ("0.3.",)
+_BATCH_SEARCH_ATTRIBUTES = ("index", "docstore", "index_to_docstore_id", "_normalize_L2")
+
+
+def _langchain_community_version() -> str:
+    try:
+        return version("langchain-community")
+    except PackageNotFoundError:
+        return ""
+
+
+LANGCHAIN_COMMUNITY_VERSION = _langchain_community_version()
+if not LANGCHAIN_COMMUNITY_VERSION.startswith(BATCH_SEARCH_VERSIONS):
+    logger.warning(f"langchain-community {LANGCHAIN_COMMUNITY_VERSION or 'introuvable'} non vérifié : "
+                   "les lots de questions seront recherchés question par question")
+
+
+def read_faiss_index(index_file: str, mode: str = FAISS_LOAD_MODE):
+    """Lit un fichier index.faiss selon le mode de chargement demandé."""
+    if mode == "mmap":
+        return faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(index_file)
+
+
+def read_index_header(index_file: str) -> Tuple[str, int, int]:
+    """
+    Type (fourcc), dimension et nombre de vecteurs d'un index.faiss, lus dans son
+    en-tête sans charger l'index ; ValueError si le fichier n'est pas un index FAISS.
+    """
+    with open(index_file, "rb") as f:
+        header = f.read(_INDEX_HEADER.size)
+    if len(header) < _INDEX_HEADER.size:
+        raise ValueError(f"Fichier tronqué ({len(header)} octets)")
+    fourcc, dimension, ntotal = _INDEX_HEADER.unpack(header)
+    try:
+        fourcc = fourcc.decode("ascii")
+    except UnicodeDecodeError:
+        raise ValueError("En-tête d'index FAISS invalide")
+    if not fourcc.isalnum() or dimension <= 0 or ntotal < 0:
+        raise ValueError(f"En-tête d'index FAISS invalide ({fourcc!r}, d={dimension}, ntotal={ntotal})")
+    return fourcc, dimension, ntotal
+
+
+def header_supports_mmap(fourcc: str) -> bool:
+    """Équivalent de supports_mmap d'après le type lu dans l'en-tête (index IVF)."""
+    return fourcc.startswith(_IVF_FOURCC_PREFIX)
+
+
+def supports_mmap(index) -> bool:
+    """Indique si FAISS peut projeter cet index en mémoire (index IVF uniquement)."""
+    return faiss.try_extract_index_ivf(index) is not None
+
+
+def _store_setting(key: str, store_name: str) -> Optional[int]:
+    """Lit un paramètre entier, la valeur propre au store prenant le pas sur la valeur globale."""
+    value = os.getenv(f"{key}_{store_name.upper()}", os.getenv(key))
+    return int(value) if value else None
+
+
+def configure_search(index, store_name: str) -> None:
+    """Applique efSearch (HNSW) et nprobe (IVF) configurés pour ce store."""
+    ef_search = _store_setting("FAISS_EF_SEARCH", store_name)
+    if ef_search and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+        logger.info(f"efSearch={ef_search} pour {store_name}")
+
+    nprobe = _store_setting("FAISS_NPROBE", store_name)
+    ivf = faiss.try_extract_index_ivf(index)
+    if nprobe and ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+        logger.info(f"nprobe={ivf.nprobe} pour {store_name}")
+
+
+def has_store_files(path: str) -> bool:
+    """Vérifie la présence de l'index et d'un docstore (SQLite ou pickle) dans un répertoire."""
+    files = os.listdir(path)
+    return INDEX_FILE in files and (SQLITE_DOCSTORE_FILE in files or DOCSTORE_FILE in files)
+
+
+def load_faiss_store(path: str, embeddings, mode: str = FAISS_LOAD_MODE) -> FAISS:
+    """Équivalent de FAISS.load_local prenant en compte le mode de chargement et le docstore SQLite."""
+    index = read_faiss_index(os.path.join(path, INDEX_FILE), mode)
+    if mode == "mmap" and not supports_mmap(index):
+        logger.warning(f"L'index {type(index).__name__} de {path} ne supporte pas le mmap : "
+                       "il est chargé en mémoire")
+
+    sqlite_path = os.path.join(path, SQLITE_DOCSTORE_FILE)
+    if os.path.exists(sqlite_path):
+        docstore = SQLiteDocstore(sqlite_path)
+        index_to_docstore_id = docstore.index_to_docstore_id()
+    else:
+        logger.warning(f"Docstore picklé utilisé pour {path} : "
+                       "convertissez-le avec convert_docstore.py")
+        with open(os.path.join(path, DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+    if len(index_to_docstore_id) != index.ntotal:
+        raise ValueError(f"Docstore incohérent avec l'index dans {path}: "
+                         f"{len(index_to_docstore_id)} documents pour {index.ntotal} vecteurs")
+
+    configure_search(index, os.path.basename(os.path.normpath(path)))
+
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def batch_search_supported(store) -> bool:
+    """Indique si search_by_vectors peut interroger ce store (version vérifiée et attributs présents)."""
+    return (LANGCHAIN_COMMUNITY_VERSION.startswith(BATCH_SEARCH_VERSIONS)
+            and isinstance(store, FAISS)
+            and all(hasattr(store, attribute) for attribute in _BATCH_SEARCH_ATTRIBUTES))
+
+
+def search_by_vectors(store: FAISS, vectors: np.ndarray, k: int) -> List[List[Tuple[Document, float]]]:
+    """
+    Équivalent groupé de FAISS.similarity_search_with_score_by_vector (sans filtre) :
+    une seule recherche FAISS pour toutes les lignes de vectors.
+
+    À n'appeler qu'après batch_search_supported(store).
+    """
+    vectors = np.array(vectors, dtype=np.float32)
+    if store._normalize_L2:
+        faiss.normalize_L2(vectors)
+    distances, indices = store.index.search(vectors, k)
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        docs_with_scores = []
+        for distance, position in zip(row_distances, row_indices):
+            # -1 : la base contient moins de k vecteurs
+            if position == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[position])
+            if isinstance(doc, Document):
+                docs_with_scores.append((doc, float(distance)))
+        results.append(docs_with_scores)
+    return results
@@ -0,0 +1,149 @@
+"""
+Construction des index FAISS des vector stores.
+
+Types d'index disponibles :
+- "flat" : recherche exhaustive exacte (IndexFlatL2)
+- "hnsw" : graphe HNSW (IndexHNSWFlat), paramètres M et efConstruction
+- "ivf_flat" : partitionnement IVF avec vecteurs complets (IndexIVFFlat), paramètre nlist
+- "ivf_pq" : partitionnement IVF avec vecteurs compressés (IndexIVFPQ), paramètres nlist, m et nbits
+
+Tous les index utilisent la distance L2, comme les stores LangChain existants.
+Les paramètres de recherche (efSearch, nprobe) sont appliqués au chargement,
+voir faiss_loader.configure_search.
+"""
+
+from langchain_core.documents import Document
+import os
+import json
+import math
+import uuid
+import logging
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+import numpy as np
+import faiss
+
+from app.sqlite_docstore import write_sqlite_docstore
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+# Nombre minimal de points d'entraînement par liste IVF recommandé par FAISS
+MIN_POINTS_PER_CENTROID = 39
+
+
+def default_nlist(n_vectors: int) -> int:
+    """Nombre de listes IVF par défaut : ~4·√n, borné par la taille du jeu d'entraînement."""
+    nlist = int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID))
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = "flat",
+                      hnsw_m: int = 32, ef_construction: int = 200,
+                      nlist: Optional[int] = None, pq_m: int = 48, pq_nbits: int = 8,
+                      train_size: Optional[int] = None, seed: int = 0):
+    """Construit et remplit un index FAISS du type demandé."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu '{index_type}', attendu: {', '.join(INDEX_TYPES)}")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dimension = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        nlist = nlist or default_nlist(n_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % pq_m != 0:
+                raise ValueError(f"La dimension {dimension} doit être divisible par pq_m={pq_m}")
+            if n_vectors < 2 ** pq_nbits:
+                raise ValueError(f"IVF-PQ avec pq_nbits={pq_nbits} demande au moins {2 ** pq_nbits} "
+                                 f"vecteurs d'entraînement ({n_vectors} disponibles)")
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+
+        # Entraînement sur un échantillon (tout le corpus par défaut)
+        training = vectors
+        if train_size and train_size < n_vectors:
+            rng = np.random.default_rng(seed)
+            training = vectors[rng.choice(n_vectors, train_size, replace=False)]
+        logger.info(f"Entraînement de l'index {index_type} ({nlist} listes) sur {len(training)} vecteurs")
+        index.train(training)
+
+    index.add(vectors)
+    logger.info(f"Index {type(index).__name__} construit: {index.ntotal} vecteurs de dimension {dimension}")
+    return index
+
+
+def read_jsonl_documents(path: str) -> Iterator[Document]:
+    """Lit les documents produits par data_transformation/scripts/bofip_raw_to_jsonl*.py."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Ligne {line_number} invalide dans {path}: {str(e)}")
+                continue
+            if record.get("page_content", "").strip():
+                yield Document(page_content=record["page_content"], metadata=record.get("metadata", {}))
+
+
+def read_store_vectors(store) -> Tuple[np.ndarray, List[Tuple[str, Document]]]:
+    """Extrait les vecteurs et les documents d'un vector store existant, dans l'ordre de l'index."""
+    index = store.index
+    if faiss.try_extract_index_ivf(index) is not None:
+        faiss.extract_index_ivf(index).make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+
+    documents = []
+    for position in range(index.ntotal):
+        doc_id = store.index_to_docstore_id[position]
+        doc = store.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            raise ValueError(f"Document {doc_id} (position {position}) absent du docstore")
+        documents.append((doc_id, doc))
+    return vectors, documents
+
+
+def new_document_ids(documents: List[Document]) -> List[Tuple[str, Document]]:
+    """Associe un identifiant unique à chaque document, comme FAISS.from_documents."""
+    return [(str(uuid.uuid4()), doc) for doc in documents]
+
+
+def save_store(output_dir: str, index, documents: List[Tuple[str, Document]]) -> None:
+    """Écrit index.faiss et docstore.sqlite dans le répertoire attendu par load_vector_stores."""
+    if index.ntotal != len(documents):
+        raise ValueError(f"{index.ntotal} vecteurs pour {len(documents)} documents")
+    os.makedirs(output_dir, exist_ok=True)
+
+    tmp_index = os.path.join(output_dir, "index.faiss.tmp")
+    faiss.write_index(index, tmp_index)
+    write_sqlite_docstore(os.path.join(output_dir, "docstore.sqlite"), documents)
+    os.replace(tmp_index, os.path.join(output_dir, "index.faiss"))
+
+    # Un ancien docstore picklé ne correspondrait plus au nouvel index
+    stale_pickle = os.path.join(output_dir, "index.pkl")
+    if os.path.exists(stale_pickle):
+        os.remove(stale_pickle)
+    logger.info(f"Vector store écrit dans {output_dir}")
+
+
+def index_parameters(index) -> Dict[str, Any]:
+    """Paramètres de recherche courants d'un index, pour les résumés et les rapports."""
+    params: Dict[str, Any] = {}
+    if hasattr(index, "hnsw"):
+        params["ef_search"] = index.hnsw.efSearch
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params["nlist"] = ivf.nlist
+        params["nprobe"] = ivf.nprobe
+    return params
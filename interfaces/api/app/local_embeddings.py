@@ -0,0 +1,161 @@
+"""
+Embeddings locaux, sans appel réseau ni identifiants Vertex AI.
+
+- HashingEmbeddings projette les mots et paires de mots d'un texte dans un vecteur
+  de taille fixe par hachage signé (feature hashing), sans apprentissage.
+- TfidfSvdEmbeddings applique une pondération TF-IDF puis une SVD tronquée
+  apprises sur le corpus JSONL.
+
+La qualité sémantique est bien inférieure à celle d'un vrai modèle, mais le calcul
+est déterministe et rapide : ces modèles servent de substituts pour les benchmarks,
+les tests de charge et les tests hors ligne.
+"""
+
+from langchain_core.embeddings import Embeddings
+import os
+import re
+import hashlib
+import unicodedata
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Nombre de coefficients TF-IDF traités à la fois pendant l'apprentissage de la SVD
+FIT_CHUNK = 100_000
+
+
+def tokenize(text: str) -> List[str]:
+    """Mots en minuscules et sans accents."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return TOKEN_PATTERN.findall(text)
+
+
+class HashingEmbeddings(Embeddings):
+    """Embeddings par hachage des unigrammes et bigrammes de mots."""
+
+    def __init__(self, dimension: int = 768, bigrams: bool = True):
+        self.dimension = dimension
+        self.bigrams = bigrams
+
+    def _features(self, text: str) -> List[str]:
+        tokens = tokenize(text)
+        features = list(tokens)
+        if self.bigrams:
+            features.extend(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        return features
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in self._features(text):
+            # blake2b plutôt que hash() : stable d'un processus à l'autre
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+class TfidfSvdEmbeddings(Embeddings):
+    """
+    Embeddings TF-IDF réduits par SVD (analyse sémantique latente), appris sur le corpus.
+
+    Le modèle (vocabulaire, IDF et axes de la SVD) est appris par fit() puis
+    enregistré dans un fichier .npz, voir train_tfidf_embeddings.py.
+    """
+
+    def __init__(self, vocabulary: List[str], idf: np.ndarray, components: np.ndarray, fingerprint: str = ""):
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.fingerprint = fingerprint
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    def _weights(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Vecteur TF-IDF creux d'un texte : indices des termes et poids normalisés."""
+        counts = Counter(term for term in tokenize(text) if term in self.vocabulary)
+        if not counts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        indices = np.fromiter((self.vocabulary[t] for t in counts), dtype=np.int64, count=len(counts))
+        weights = (1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[indices]
+        return indices, weights / np.linalg.norm(weights)
+
+    def _embed(self, text: str) -> np.ndarray:
+        indices, weights = self._weights(text)
+        vector = self.components[:, indices] @ weights
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+    @classmethod
+    def fit(cls, texts: List[str], dimension: int = 256, max_features: int = 20000, min_df: int = 2,
+            sample_size: int = 20000, power_iterations: int = 2, seed: int = 0) -> "TfidfSvdEmbeddings":
+        """Apprend le vocabulaire et l'IDF sur tous les textes, la SVD sur un échantillon."""
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(set(tokenize(text)))
+        terms = [t for t, df in document_frequency.most_common(max_features) if df >= min_df]
+        if len(terms) <= dimension:
+            raise ValueError(f"Vocabulaire trop petit ({len(terms)} termes) pour {dimension} dimensions")
+        idf = np.log((1 + len(texts)) / (1 + np.array([document_frequency[t] for t in terms], dtype=np.float32))) + 1
+
+        # Matrice TF-IDF creuse (format CSR) de l'échantillon d'apprentissage
+        model = cls(terms, idf, np.zeros((0, len(terms))))
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(texts), min(sample_size, len(texts)), replace=False)
+        rows = [model._weights(texts[i]) for i in sample]
+        indices = np.concatenate([r[0] for r in rows])
+        data = np.concatenate([r[1] for r in rows])
+        row_ids = np.repeat(np.arange(len(rows)), [len(r[0]) for r in rows])
+
+        def multiply(matrix: np.ndarray, transposed: bool = False) -> np.ndarray:
+            """X @ matrix, ou X.T @ matrix, par blocs pour borner la mémoire"""
+            targets, sources = (indices, row_ids) if transposed else (row_ids, indices)
+            result = np.zeros((len(terms) if transposed else len(rows), matrix.shape[1]), dtype=np.float32)
+            for start in range(0, len(data), FIT_CHUNK):
+                block = slice(start, start + FIT_CHUNK)
+                np.add.at(result, targets[block], data[block, None] * matrix[sources[block]])
+            return result
+
+        # SVD tronquée randomisée (Halko et al.) sans matérialiser la matrice dense
+        rank = min(dimension + 10, len(rows))
+        q, _ = np.linalg.qr(multiply(rng.standard_normal((len(terms), rank)).astype(np.float32)))
+        for _ in range(power_iterations):
+            z, _ = np.linalg.qr(multiply(q, transposed=True))
+            q, _ = np.linalg.qr(multiply(z))
+        _, _, vt = np.linalg.svd(multiply(q, transposed=True).T, full_matrices=False)
+        components = vt[:dimension]
+
+        fingerprint = hashlib.sha256(components.tobytes() + "\n".join(terms).encode("utf-8")).hexdigest()[:12]
+        return cls(terms, idf, components, fingerprint)
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path, "wb") as f:
+            np.savez_compressed(f, vocabulary=np.array(vocabulary), idf=self.idf,
+                                components=self.components, fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, path: str) -> "TfidfSvdEmbeddings":
+        with np.load(path) as data:
+            return cls(data["vocabulary"].tolist(), data["idf"], data["components"], str(data["fingerprint"]))
@@ -0,0 +1,81 @@
+"""
+Modèle de langage simulé, sans appel réseau ni identifiants Vertex AI.
+
+FakeLLM attend un délai fixe (temps avant le premier token) puis produit une
+réponse déterministe à un débit de tokens donné, en mode bloquant comme en
+streaming. Il permet de tester et de mettre en charge tout le chemin /ask en
+mesurant le coût propre de l'API, indépendamment de Vertex AI.
+"""
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+# Mots utilisés pour composer les réponses simulées
+FILLER_WORDS = (
+    "selon", "le", "code", "général", "des", "impôts", "et", "la", "doctrine", "du", "BOFiP",
+    "le", "contribuable", "doit", "appliquer", "le", "taux", "prévu", "pour", "cette", "opération",
+)
+
+
+class FakeLLM(LLM):
+    """LLM déterministe avec latence et débit configurables."""
+
+    latency: float = 0.5
+    tokens_per_second: float = 50.0
+    response_tokens: int = 120
+    json_output: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _tokens(self, prompt: str) -> List[str]:
+        """Réponse déterministe : la même invite produit toujours la même réponse."""
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        words = random.Random(seed).choices(FILLER_WORDS, k=self.response_tokens)
+        if self.json_output:
+            half = len(words) // 2
+            text = json.dumps({"reponse": "Réponse simulée : " + " ".join(words[:half]),
+                               "raisonnement": "Raisonnement simulé : " + " ".join(words[half:])},
+                              ensure_ascii=False)
+            # Découpage en morceaux de taille comparable à des tokens
+            return [text[i:i + 4] for i in range(0, len(text), 4)]
+        return ["Réponse simulée :"] + [f" {word}" for word in words]
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        tokens = self._tokens(prompt)
+        time.sleep(self.latency + len(tokens) * self._token_delay())
+        return "".join(tokens)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                     **kwargs: Any) -> str:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.latency + len(tokens) * self._token_delay())
+        return "".join(tokens)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens(prompt):
+            time.sleep(self._token_delay())
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._tokens(prompt):
+            await asyncio.sleep(self._token_delay())
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield GenerationChunk(text=token)
@@ -0,0 +1,179 @@
+"""
+Configuration des logs de l'API.
+
+Les modules de l'application se contentent de logging.getLogger(__name__) ;
+configure_logging, appelée une fois au démarrage, installe un QueueHandler sur
+le logger racine : les requêtes ne font que déposer leurs enregistrements dans
+une file, et un QueueListener écrit sur la sortie standard et dans le fichier
+de logs depuis un thread dédié.
+
+Chaque enregistrement porte l'identifiant de la requête en cours (en-tête
+X-Request-ID repris ou généré par RequestContextMiddleware). Le détail de
+débogage (documents, métadonnées) n'est produit que pour une fraction des
+requêtes, tirée au sort à leur arrivée (LOG_DEBUG_SAMPLE_RATE) : le code du
+chemin critique le protège par debug_enabled().
+
+Réglages par environnement (APP_ENV, "production" par défaut sur Cloud Run) :
+- development : texte lisible, fichier fiscalia_api.log, détail de toutes les requêtes
+- production : JSON sur la sortie standard (champ severity reconnu par Cloud
+  Logging), pas de fichier, détail d'une requête sur cent
+Chaque valeur peut être remplacée par LOG_LEVEL, LOG_FORMAT (json|text),
+LOG_FILE (vide pour désactiver) et LOG_DEBUG_SAMPLE_RATE.
+"""
+
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+APP_ENV = os.getenv("APP_ENV", "production" if os.getenv("K_SERVICE") else "development").lower()
+
+ENVIRONMENTS: Dict[str, Dict[str, Any]] = {
+    "development": {"level": "INFO", "format": "text", "file": "fiscalia_api.log", "debug_sample_rate": 1.0},
+    "production": {"level": "INFO", "format": "json", "file": "", "debug_sample_rate": 0.01},
+}
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Attributs standard d'un LogRecord, exclus des champs supplémentaires du JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_debug_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("debug_sampled", default=False)
+
+_listener: Optional[QueueListener] = None
+_debug_sample_rate = 0.0
+_level = logging.INFO
+
+
+def current_request_id() -> Optional[str]:
+    """Identifiant de la requête en cours (None hors requête)."""
+    return _request_id.get()
+
+
+def debug_enabled() -> bool:
+    """Vrai si la requête en cours a été tirée pour le détail de débogage."""
+    return _debug_sampled.get()
+
+
+def start_request(request_id: Optional[str] = None) -> str:
+    """Associe un identifiant à la requête en cours et tire au sort le détail de débogage."""
+    request_id = request_id or uuid.uuid4().hex
+    _request_id.set(request_id)
+    _debug_sampled.set(_debug_sample_rate > 0 and random.random() < _debug_sample_rate)
+    return request_id
+
+
+class RequestContextFilter(logging.Filter):
+    """Ajoute l'identifiant de requête et écarte le détail des requêtes non tirées."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        # Sous le niveau configuré, seules passent les requêtes tirées au sort
+        return record.levelno >= _level or _debug_sampled.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne ; les champs passés en extra=... sont conservés."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextMiddleware:
+    """
+    Middleware ASGI : reprend ou génère l'en-tête X-Request-ID, l'expose aux logs
+    de la requête et le renvoie dans la réponse.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        header = REQUEST_ID_HEADER.lower().encode()
+        incoming = next((value.decode("latin-1") for name, value in scope["headers"] if name == header), None)
+        # Identifiant client borné pour ne pas polluer les logs
+        request_id = start_request(incoming[:128] if incoming else None)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(header, request_id.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_request_id)
+
+
+def configure_logging(environment: str = APP_ENV) -> None:
+    """Installe la file de logs et ses destinations (sans effet si déjà fait)."""
+    global _listener, _debug_sample_rate, _level
+    if _listener is not None:
+        return
+
+    settings = ENVIRONMENTS.get(environment, ENVIRONMENTS["development"])
+    level = os.getenv("LOG_LEVEL", settings["level"]).upper()
+    _level = logging.getLevelName(level)
+    log_format = os.getenv("LOG_FORMAT", settings["format"]).lower()
+    log_file = os.getenv("LOG_FILE", settings["file"])
+    _debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", settings["debug_sample_rate"]))
+
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    # Les loggers des modules de l'API laissent passer le détail ; le filtre trie par requête
+    if _debug_sample_rate > 0:
+        logging.getLogger("app").setLevel(min(_level, logging.DEBUG))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    logging.getLogger(__name__).info(
+        f"Logs configurés (environnement {environment}, niveau {level}, format {log_format}, "
+        f"fichier {log_file or 'aucun'}, détail échantillonné à {_debug_sample_rate:.0%})"
+    )
+
+
+def shutdown_logging() -> None:
+    """Vide la file et arrête le thread d'écriture."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
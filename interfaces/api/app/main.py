@@ -1,33 +1,80 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from app.rag_predictor import answer_question
+from app.logging_config import configure_logging, current_request_id, RequestContextMiddleware
+
+# Configuration des logs avant l'import des modules qui journalisent à leur chargement
+configure_logging()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Depends, Response, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from app.rag_predictor import answer_question, chatbot, ERROR_ANSWER
+from app.stage_timings import current_timings
+from app.embedding_cache import normalize_question
+from app.singleflight import SingleFlight
+from app.admission import AdmissionController, AdmissionRejected, INTERACTIVE, BATCH, LANES
+from app.metrics import (track_request, register_chatbot, register_admission, render_metrics,
+                         observe_coalesced, observe_admission, observe_rejection)
+from app.profiling import RequestDiagnostics, PROFILE_ID_HEADER
+import os
 import time
-import sys
+import json
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional
 
 
-# Configuration du logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.StreamHandler(sys.stdout),
-                        logging.FileHandler('fiscalia_api.log')
-                    ])
 logger = logging.getLogger(__name__)
 
-# Forcer l'affichage des logs dans le terminal
-for handler in logging.getLogger().handlers:
-    handler.setLevel(logging.INFO)
-
-print("=== DÉMARRAGE DE L'API FISCALIA ===")
 logger.info("Initialisation de l'API Fiscalia")
 
+# Nombre maximal de questions par appel à /ask/batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "200"))
+
+# Taux de succès des caches et taille des vector stores, lus à chaque collecte
+register_chatbot(chatbot)
+
+# Profils à la demande et requêtes lentes
+diagnostics = RequestDiagnostics()
+
+# Questions identiques en cours de traitement : une seule recherche et génération
+coalescer = SingleFlight()
+
+# Générations simultanées bornées, avec priorité aux questions interactives
+admission = AdmissionController()
+register_admission(admission)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Cycle de vie de l'API : chargement en arrière-plan, persistance des caches à l'arrêt"""
+    # Le serveur accepte les connexions pendant le chargement des vector stores
+    startup_task = asyncio.create_task(chatbot.start())
+    yield
+    logger.info("Arrêt de l'API Fiscalia")
+    if not startup_task.done():
+        startup_task.cancel()
+    chatbot.shutdown()
+
 app = FastAPI(
     title="API Fiscalia",
     description="API pour le chatbot fiscal",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+# Identifiant de requête (X-Request-ID) repris dans chaque ligne de log
+app.add_middleware(RequestContextMiddleware)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    """Capacité atteinte : refus immédiat (429) avec le délai conseillé avant un nouvel essai"""
+    observe_rejection(exc.lane, exc.reason)
+    logger.warning(f"Requête refusée par le contrôle d'admission ({exc.lane}, {exc.reason})")
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "L'assistant est très sollicité, veuillez réessayer dans quelques instants",
+                 "lane": exc.lane, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 
 # Modèle pour les sources détaillées
@@ -42,34 +89,155 @@ class QueryRequest(BaseModel):
     question: str
     include_metadata: Optional[bool] = True
 
+class BatchQueryRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_QUESTIONS)
+    include_metadata: Optional[bool] = True
+
+class BatchAnswer(BaseModel):
+    question: str
+    answer: str
+    reasoning: str
+    response_id: Optional[str] = None
+    sources: Optional[List[Any]] = None
+    error: Optional[bool] = False
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchAnswer]
+    errors: int
+    processing_time: float
+    timings: Optional[Dict[str, float]] = None
+
+class ProfilingSettings(BaseModel):
+    enabled: bool
+
 class QueryResponse(BaseModel):
     answer: str
     reasoning: str
+    # Identifiant pour GET /ask/{response_id}/reasoning quand le raisonnement est généré à la demande
+    response_id: Optional[str] = None
     sources: Optional[List[Any]] = None
     processing_time: float
     error: Optional[bool] = False
+    timings: Optional[Dict[str, float]] = None
 
-@app.post("/ask", response_model=QueryResponse)
-def ask_question(payload: QueryRequest):
+class ReasoningResponse(BaseModel):
+    response_id: str
+    reasoning: str
+    processing_time: float
+    error: Optional[bool] = False
+    timings: Optional[Dict[str, float]] = None
+
+def format_sources(sources: List[Any], include_metadata: bool) -> List[Any]:
+    """Renvoie les sources complètes ou simplifiées selon la demande du client."""
+    if include_metadata:
+        # Si inclure les métadonnées complètes
+        return sources
+    
+    # Sinon, inclure uniquement les informations de base
+    simple_sources = []
+    for source in sources:
+        if isinstance(source, dict):
+            simple_sources.append(source.get("source", "Source inconnue"))
+        else:
+            simple_sources.append(str(source))
+    return simple_sources
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Sérialise un événement au format server-sent events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+# Délai suggéré aux clients tant que le chatbot n'est pas prêt
+NOT_READY_RETRY_AFTER = "5"
+
+def ensure_ready():
+    """Refuse la requête (503) tant que les vector stores ne sont pas chargés"""
+    if not chatbot.is_ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"L'assistant est en cours de démarrage ({chatbot.status})",
+            headers={"Retry-After": NOT_READY_RETRY_AFTER}
+        )
+
+def request_lane(x_request_lane: Optional[str] = Header(None)) -> str:
+    """Voie d'admission demandée par l'en-tête X-Request-Lane (interactive par défaut)"""
+    lane = (x_request_lane or INTERACTIVE).strip().lower()
+    if lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"Voie '{x_request_lane}' inconnue (attendu: {', '.join(LANES)})")
+    return lane
+
+async def acquire_admission(lane: str, weight: int = 1):
+    """Attend une place de génération et mesure l'attente"""
+    start = time.perf_counter()
+    ticket = await admission.acquire(lane, weight)
+    observe_admission(lane, time.perf_counter() - start)
+    return ticket
+
+@asynccontextmanager
+async def admitted(lane: str):
+    """Occupe une place de génération le temps du bloc"""
+    ticket = await acquire_admission(lane)
+    try:
+        yield ticket
+    finally:
+        admission.release(ticket)
+
+async def admitted_answer(question: str, lane: str) -> Dict[str, Any]:
+    """
+    Recherche et génération pour une question, dans la limite des générations simultanées.
+    
+    Seule la génération occupe une place : une réponse du cache sémantique est
+    servie sans attendre, même quand la capacité est atteinte.
+    """
+    return await answer_question(question, lambda: admitted(lane))
+
+@app.post("/ask", response_model=QueryResponse, dependencies=[Depends(ensure_ready)])
+async def ask_question(payload: QueryRequest, response: Response,
+                       x_profile: Optional[str] = Header(None),
+                       lane: str = Depends(request_lane)):
     """
     Point d'entrée principal pour répondre aux questions fiscales.
     
     Args:
         payload: Objet contenant la question posée
+        x_profile: En-tête X-Profile: true pour profiler la requête (identifiant
+            du profil renvoyé dans l'en-tête X-Profile-Id)
+        lane: En-tête X-Request-Lane: batch pour les rejeux automatisés, servis
+            après les questions interactives
         
     Returns:
         Un objet contenant la réponse et des métadonnées
+        (429 avec Retry-After si la capacité de génération est atteinte)
     """
+    profile = diagnostics.should_profile(x_profile)
+    with track_request("ask") as tracker, \
+            diagnostics.capture("ask", payload.question, profile, current_request_id()) as capture:
+        if capture["profile_id"]:
+            response.headers[PROFILE_ID_HEADER] = capture["profile_id"]
+        try:
+            result = await answer_payload(payload, capture, lane)
+        except AdmissionRejected:
+            tracker["outcome"] = capture["outcome"] = "rejected"
+            raise
+        if result.get("error"):
+            tracker["outcome"] = capture["outcome"] = "error"
+        return result
+
+async def answer_payload(payload: QueryRequest, capture: Dict[str, Any],
+                         lane: str = INTERACTIVE) -> Dict[str, Any]:
+    """Traite une question de /ask et prépare la réponse."""
     start_time = time.time()
     
     try:
-        print(f"📝 Question reçue: {payload.question}")
         logger.info(f"Question reçue: {payload.question}")
-        logger.info(f"Inclusion des métadonnées: {payload.include_metadata}")
         
-        # Traitement de la question
-        logger.info("Appel de answer_question...")
-        result = answer_question(payload.question)
+        # Traitement de la question, partagé avec les appels identiques déjà en cours
+        # (seul le premier appel occupe une place de génération)
+        key = (normalize_question(payload.question), chatbot.index_version)
+        result, coalesced = await coalescer.do(key, lambda: admitted_answer(payload.question, lane))
+        if coalesced:
+            capture["coalesced"] = True
+            observe_coalesced("ask")
+            logger.info("Réponse partagée avec une question identique en cours de traitement")
         
         processing_time = time.time() - start_time
         
@@ -77,44 +245,28 @@ def ask_question(payload: QueryRequest):
         response = {
             "answer": result["answer"],
             "reasoning": result["reasoning"],
+            "response_id": result.get("response_id"),
             "processing_time": processing_time,
+            "timings": result.get("timings"),
         }
         
         # Ajout des sources avec métadonnées si demandé
         if "sources" in result:
-            if payload.include_metadata:
-                # Si inclure les métadonnées complètes
-                response["sources"] = result["sources"]
-                logger.info(f"Inclus {len(result['sources'])} sources avec métadonnées complètes")
-            else:
-                # Sinon, inclure uniquement les informations de base
-                simple_sources = []
-                for source in result["sources"]:
-                    if isinstance(source, dict):
-                        simple_sources.append(source.get("source", "Source inconnue"))
-                    else:
-                        simple_sources.append(str(source))
-                response["sources"] = simple_sources
-                logger.info(f"Inclus {len(simple_sources)} sources simplifiées")
+            response["sources"] = format_sources(result["sources"], payload.include_metadata)
             
         # Indication d'erreur si applicable
         if "error" in result and result["error"]:
             logger.warning(f"Erreur détectée dans la réponse: {result.get('reasoning', 'Raison inconnue')}")
             response["error"] = True
-            print(f"❌ Erreur: {result.get('reasoning', 'Raison inconnue')}")
-        else:
-            print(f"✅ Réponse générée en {processing_time:.2f} secondes")
             
         logger.info(f"Réponse générée en {processing_time:.2f} secondes")
         return response
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         processing_time = time.time() - start_time
-        logger.error(f"Erreur lors du traitement de la question: {str(e)}")
-        print(f"❌ Exception: {str(e)}")
-        
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.exception(f"Erreur lors du traitement de la question: {str(e)}")
         
         return {
             "answer": "Je suis désolé, mais une erreur s'est produite lors du traitement de votre question.",
@@ -123,8 +275,268 @@ def ask_question(payload: QueryRequest):
             "error": True
         }
 
+async def stream_events(payload: QueryRequest, profile: bool = False, request_id: Optional[str] = None,
+                        ticket=None):
+    """Traduit les étapes de génération du chatbot en événements SSE ; rend la place en fin de flux."""
+    try:
+        with track_request("stream") as tracker, \
+                diagnostics.capture("stream", payload.question, profile, request_id) as capture:
+            async for event in stream_answer_events(payload, tracker):
+                yield event
+            capture["outcome"] = tracker["outcome"]
+    finally:
+        admission.release(ticket)
+
+async def stream_answer_events(payload: QueryRequest, tracker: Dict[str, Any]):
+    """Événements SSE d'une question ; signale un échec dans tracker."""
+    start_time = time.time()
+    answer_parts = []
+    reasoning = ""
+    response_id = None
+    sources = []
+    timings = {}
+    error = False
+    
+    try:
+        async for event, data in chatbot.stream_answer(payload.question):
+            if event == "sources":
+                sources = format_sources(data, payload.include_metadata)
+                yield sse_event("sources", {"sources": sources})
+            elif event == "answer":
+                answer_parts.append(data)
+                yield sse_event("answer", {"token": data})
+            elif event == "reasoning":
+                reasoning = data
+                yield sse_event("reasoning", {"reasoning": data})
+            elif event == "response_id":
+                response_id = data
+            elif event == "timing":
+                timings = data
+    except Exception as e:
+        error = True
+        tracker["outcome"] = "error"
+        logger.error(f"Erreur lors de la diffusion de la réponse: {str(e)}")
+        yield sse_event("error", {"detail": f"Erreur technique: {str(e)}"})
+    
+    processing_time = time.time() - start_time
+    logger.info(f"Réponse diffusée en {processing_time:.2f} secondes")
+    
+    # Dernier événement : la réponse complète et le résumé des durées
+    response = QueryResponse(
+        answer="".join(answer_parts),
+        reasoning=reasoning,
+        response_id=response_id,
+        sources=sources,
+        processing_time=processing_time,
+        error=error,
+        timings=timings
+    )
+    yield sse_event("done", response.model_dump())
+
+@app.post("/ask/stream", dependencies=[Depends(ensure_ready)])
+async def ask_question_stream(payload: QueryRequest, x_profile: Optional[str] = Header(None),
+                              lane: str = Depends(request_lane)):
+    """
+    Version en streaming de /ask (server-sent events).
+    
+    Événements émis dans l'ordre : "sources", "answer" (un par morceau de texte),
+    "reasoning", puis "done" avec les champs de QueryResponse et les durées par étape.
+    En mode REASONING_MODE=lazy, "reasoning" n'est pas émis : "done" porte le
+    response_id à passer à GET /ask/{response_id}/reasoning.
+    Un événement "error" précède "done" en cas d'échec. La place de génération
+    est obtenue avant l'envoi des en-têtes : un refus est un 429 classique.
+    """
+    logger.info(f"Question reçue (stream): {payload.question}")
+    ticket = await acquire_admission(lane)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    # Les en-têtes partent avant la génération : l'identifiant du profil est choisi ici
+    profile = diagnostics.should_profile(x_profile)
+    request_id = current_request_id()
+    if profile:
+        headers[PROFILE_ID_HEADER] = request_id
+    return StreamingResponse(
+        stream_events(payload, profile, request_id, ticket),
+        media_type="text/event-stream",
+        headers=headers,
+        # Rend aussi la place si le flux n'a jamais démarré (client parti avant la réponse)
+        background=BackgroundTask(admission.release, ticket)
+    )
+
+@app.post("/ask/batch", response_model=BatchQueryResponse, dependencies=[Depends(ensure_ready)])
+async def ask_questions_batch(payload: BatchQueryRequest, response: Response,
+                              x_profile: Optional[str] = Header(None)):
+    """
+    Répond à un lot de questions en un seul appel (rejeu de questions en masse).
+    
+    Les résultats sont renvoyés dans l'ordre des questions ; une question en échec
+    est signalée par son propre champ error sans faire échouer le lot.
+    Le lot passe par la voie "batch" du contrôle d'admission et y occupe autant de
+    places que d'appels simultanés au LLM (429 avec Retry-After si elle est saturée).
+    """
+    start_time = time.time()
+    logger.info(f"Lot de {len(payload.questions)} questions reçu")
+    profile = diagnostics.should_profile(x_profile)
+    with track_request("batch") as tracker, \
+            diagnostics.capture("batch", f"{len(payload.questions)} questions", profile, current_request_id()) as capture:
+        if capture["profile_id"]:
+            response.headers[PROFILE_ID_HEADER] = capture["profile_id"]
+        # Une place par appel simultané au LLM (deux chaînes par question en mode eager concurrent)
+        weight = chatbot.batch_generation_slots(len(payload.questions))
+        try:
+            ticket = await acquire_admission(BATCH, weight)
+        except AdmissionRejected:
+            tracker["outcome"] = capture["outcome"] = "rejected"
+            raise
+        try:
+            # Le contrôle d'admission peut accorder moins de places que demandé (plafond de la voie)
+            max_generations = ticket.weight if ticket is not None else None
+            results = await chatbot.generate_answers(payload.questions, max_generations=max_generations)
+        except Exception as e:
+            logger.exception(f"Erreur lors du traitement du lot: {str(e)}")
+            results = [{"answer": ERROR_ANSWER, "reasoning": f"Erreur technique: {str(e)}", "error": True}
+                       for _ in payload.questions]
+        finally:
+            admission.release(ticket)
+        
+        answers = []
+        for question, result in zip(payload.questions, results):
+            answers.append({
+                "question": question,
+                "answer": result["answer"],
+                "reasoning": result["reasoning"],
+                "response_id": result.get("response_id"),
+                "sources": format_sources(result.get("sources", []), payload.include_metadata),
+                "error": bool(result.get("error")),
+            })
+        errors = sum(1 for answer in answers if answer["error"])
+        if errors:
+            tracker["outcome"] = capture["outcome"] = "error"
+        
+        processing_time = time.time() - start_time
+        logger.info(f"Lot de {len(answers)} questions traité en {processing_time:.2f} secondes ({errors} en erreur)")
+        return {
+            "results": answers,
+            "errors": errors,
+            "processing_time": processing_time,
+            "timings": current_timings(),
+        }
+
+@app.get("/ask/{response_id}/reasoning", response_model=ReasoningResponse, dependencies=[Depends(ensure_ready)])
+async def ask_reasoning(response_id: str, response: Response, x_profile: Optional[str] = Header(None)):
+    """
+    Raisonnement détaillé d'une réponse de /ask, généré à la première demande.
+    
+    Le contexte documentaire de la réponse est conservé REASONING_CACHE_TTL
+    secondes (404 au-delà) ; les demandes suivantes reçoivent le raisonnement
+    déjà généré. La génération passe par le contrôle d'admission (429 avec
+    Retry-After si la capacité est atteinte).
+    """
+    start_time = time.time()
+    profile = diagnostics.should_profile(x_profile)
+    with track_request("reasoning") as tracker, \
+            diagnostics.capture("reasoning", response_id, profile, current_request_id()) as capture:
+        if capture["profile_id"]:
+            response.headers[PROFILE_ID_HEADER] = capture["profile_id"]
+        error = False
+        try:
+            reasoning = await chatbot.generate_reasoning(response_id, lambda: admitted(INTERACTIVE))
+        except AdmissionRejected:
+            tracker["outcome"] = capture["outcome"] = "rejected"
+            raise
+        except Exception as e:
+            logger.exception(f"Erreur lors de la génération du raisonnement: {str(e)}")
+            reasoning = f"Erreur technique: {str(e)}"
+            error = True
+            tracker["outcome"] = capture["outcome"] = "error"
+        
+        if reasoning is None:
+            tracker["outcome"] = capture["outcome"] = "not_found"
+            raise HTTPException(status_code=404, detail=f"Raisonnement introuvable ou expiré pour la réponse '{response_id}'")
+        
+        processing_time = time.time() - start_time
+        logger.info(f"Raisonnement fourni en {processing_time:.2f} secondes")
+        return {
+            "response_id": response_id,
+            "reasoning": reasoning,
+            "processing_time": processing_time,
+            "error": error,
+            "timings": current_timings(),
+        }
+
 @app.get("/health")
 def health_check():
-    """Endpoint de vérification de santé de l'API"""
-    logger.info("Vérification de santé")
+    """Sonde de vivacité : le processus répond, même pendant le chargement"""
     return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    """Sonde de disponibilité : 200 uniquement une fois les vector stores chargés (et préchauffés)"""
+    if not chatbot.is_ready:
+        response.status_code = 503
+        response.headers["Retry-After"] = NOT_READY_RETRY_AFTER
+    return chatbot.readiness()
+
+@app.get("/metrics")
+def metrics():
+    """Métriques Prometheus : durées par étape, requêtes en cours, caches, taille du contexte"""
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
+
+
+@app.get("/admin/profiling")
+def profiling_settings():
+    """État du profilage et profils conservés (sans les piles)"""
+    return {"enabled": diagnostics.profile_all, "profiles": diagnostics.profiles()}
+
+@app.put("/admin/profiling")
+def update_profiling(settings: ProfilingSettings):
+    """Active ou désactive le profilage de toutes les requêtes"""
+    diagnostics.profile_all = settings.enabled
+    logger.info(f"Profilage de toutes les requêtes: {'activé' if settings.enabled else 'désactivé'}")
+    return {"enabled": diagnostics.profile_all}
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+def profile_stacks(profile_id: str):
+    """Piles d'un profil au format collapsed (flamegraph.pl, speedscope, inferno)"""
+    profile = diagnostics.profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profil '{profile_id}' introuvable")
+    return PlainTextResponse(profile["collapsed"])
+
+@app.get("/admin/slow-requests")
+def slow_requests():
+    """Requêtes plus longues que SLOW_REQUEST_THRESHOLD_S, avec leur trace par étape"""
+    return {"threshold_s": diagnostics.slow_threshold, "requests": diagnostics.slow_requests()}
+
+
+@app.get("/admin/caches")
+def cache_stats():
+    """Compteurs des caches (taille, hits, misses, évictions) et des questions regroupées"""
+    return {**chatbot.cache_stats(), "single_flight": coalescer.stats()}
+
+@app.get("/admin/admission")
+def admission_stats():
+    """Occupation, files d'attente et refus du contrôle d'admission, par voie"""
+    return admission.stats()
+
+@app.get("/admin/stores", dependencies=[Depends(ensure_ready)])
+def list_stores():
+    """Résumé des vector stores chargés, calculé au démarrage"""
+    return {"stores": list(chatbot.store_summaries.values())}
+
+@app.get("/admin/stores/{name}/metadata", dependencies=[Depends(ensure_ready)])
+def store_metadata(name: str,
+                   offset: int = Query(0, ge=0),
+                   limit: int = Query(20, ge=1, le=500)):
+    """Parcourt les métadonnées d'un vector store page par page"""
+    if name not in chatbot.vector_stores:
+        raise HTTPException(status_code=404, detail=f"Vector store '{name}' introuvable")
+    
+    summary = chatbot.store_summaries[name]
+    return {
+        "store": name,
+        "total": summary["document_count"],
+        "offset": offset,
+        "limit": limit,
+        "documents": chatbot.get_store_metadata(name, offset, limit)
+    }
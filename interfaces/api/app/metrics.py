@@ -0,0 +1,184 @@
+"""
+Métriques Prometheus de l'API, exposées sur /metrics.
+
+- fiscalia_stage_duration_seconds{stage, store} : durée de chaque étape (embed,
+  search par store, normalize, format, answer_llm, reasoning_llm, fused_llm...),
+  alimentée par app.stage_timings
+- fiscalia_request_duration_seconds{endpoint}, fiscalia_requests_total{endpoint, outcome},
+  fiscalia_requests_in_flight{endpoint} et fiscalia_coalesced_requests_total{endpoint}
+- fiscalia_admission_wait_seconds{lane}, fiscalia_admission_rejected_total{lane, reason},
+  fiscalia_admission_in_flight{lane} et fiscalia_admission_queued{lane}
+- fiscalia_retrieved_documents{store} : documents retenus par recherche
+- fiscalia_context_characters / fiscalia_context_tokens : taille du contexte envoyé au LLM
+- fiscalia_context_duplicates_total et fiscalia_context_compressed_total : passages
+  en double écartés et contextes réduits au budget de tokens (app.context_builder)
+- fiscalia_cache_* {cache} et fiscalia_store_documents{store} : lus dans le chatbot
+  au moment de la collecte
+"""
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from app.stage_timings import add_stage_observer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_DURATION = Histogram(
+    "fiscalia_stage_duration_seconds", "Durée des étapes du traitement d'une question",
+    ["stage", "store"], buckets=LATENCY_BUCKETS
+)
+REQUEST_DURATION = Histogram(
+    "fiscalia_request_duration_seconds", "Durée de traitement des questions",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("fiscalia_requests", "Questions traitées", ["endpoint", "outcome"])
+IN_FLIGHT = Gauge("fiscalia_requests_in_flight", "Questions en cours de traitement", ["endpoint"])
+COALESCED = Counter("fiscalia_coalesced_requests", "Questions servies par un traitement identique déjà en cours",
+                    ["endpoint"])
+ADMISSION_WAIT = Histogram(
+    "fiscalia_admission_wait_seconds", "Attente dans la file d'admission avant la génération",
+    ["lane"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter("fiscalia_admission_rejected", "Requêtes refusées par le contrôle d'admission",
+                             ["lane", "reason"])
+RETRIEVED_DOCUMENTS = Histogram(
+    "fiscalia_retrieved_documents", "Documents retenus par recherche dans un vector store",
+    ["store"], buckets=(0, 1, 2, 3, 5, 10, 20, 50)
+)
+CONTEXT_CHARACTERS = Histogram(
+    "fiscalia_context_characters", "Taille du contexte envoyé au LLM (caractères)",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+)
+CONTEXT_TOKENS = Histogram(
+    "fiscalia_context_tokens", "Taille du contexte envoyé au LLM (tokens)",
+    buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+)
+CONTEXT_DUPLICATES = Counter("fiscalia_context_duplicates", "Passages en double écartés du contexte")
+CONTEXT_COMPRESSED = Counter("fiscalia_context_compressed", "Contextes réduits aux phrases les plus pertinentes")
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Reçoit les durées de app.stage_timings ; search_<store> est ventilé par store."""
+    if name.startswith("search_"):
+        STAGE_DURATION.labels(stage="search", store=name[len("search_"):]).observe(seconds)
+    else:
+        STAGE_DURATION.labels(stage=name, store="").observe(seconds)
+
+
+add_stage_observer(observe_stage)
+
+
+def observe_coalesced(endpoint: str) -> None:
+    COALESCED.labels(endpoint=endpoint).inc()
+
+
+def observe_admission(lane: str, wait_seconds: float) -> None:
+    ADMISSION_WAIT.labels(lane=lane).observe(wait_seconds)
+
+
+def observe_rejection(lane: str, reason: str) -> None:
+    ADMISSION_REJECTED.labels(lane=lane, reason=reason).inc()
+
+
+def observe_retrieved(store: str, count: int) -> None:
+    RETRIEVED_DOCUMENTS.labels(store=store).observe(count)
+
+
+def observe_context(context) -> None:
+    """Taille, doublons écartés et réduction d'un contexte construit par app.context_builder."""
+    CONTEXT_CHARACTERS.observe(len(context.text))
+    # Décompte déjà fait par build_context : pas de nouvelle tokenisation
+    CONTEXT_TOKENS.observe(context.tokens)
+    CONTEXT_DUPLICATES.inc(context.duplicates)
+    if context.compressed:
+        CONTEXT_COMPRESSED.inc()
+
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator[Dict[str, Any]]:
+    """
+    Compte une question en cours et mesure sa durée.
+
+    Le dictionnaire renvoyé permet de signaler une réponse en erreur
+    (outcome = "error") ou refusée (outcome = "rejected").
+    """
+    tracker = {"outcome": "ok"}
+    IN_FLIGHT.labels(endpoint=endpoint).inc()
+    start = time.perf_counter()
+    try:
+        yield tracker
+    except BaseException:
+        # Un refus d'admission ("rejected") est déjà signalé par l'appelant
+        if tracker["outcome"] == "ok":
+            tracker["outcome"] = "error"
+        raise
+    finally:
+        IN_FLIGHT.labels(endpoint=endpoint).dec()
+        REQUEST_DURATION.labels(endpoint=endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(endpoint=endpoint, outcome=tracker["outcome"]).inc()
+
+
+class ChatbotCollector:
+    """Valeurs lues dans le chatbot à chaque collecte : caches et vector stores."""
+
+    def __init__(self, chatbot):
+        self.chatbot = chatbot
+
+    def collect(self):
+        ready = GaugeMetricFamily("fiscalia_ready", "1 si le chatbot est prêt à répondre")
+        ready.add_metric([], 1.0 if self.chatbot.is_ready else 0.0)
+        yield ready
+
+        documents = GaugeMetricFamily("fiscalia_store_documents", "Documents indexés par vector store",
+                                      labels=["store"])
+        for name, summary in self.chatbot.store_summaries.items():
+            documents.add_metric([name], summary["document_count"])
+        yield documents
+
+        hits = CounterMetricFamily("fiscalia_cache_hits", "Succès des caches", labels=["cache"])
+        misses = CounterMetricFamily("fiscalia_cache_misses", "Échecs des caches", labels=["cache"])
+        ratio = GaugeMetricFamily("fiscalia_cache_hit_ratio", "Taux de succès des caches", labels=["cache"])
+        size = GaugeMetricFamily("fiscalia_cache_entries", "Entrées des caches", labels=["cache"])
+        for name, stats in self.chatbot.cache_stats().items():
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], stats["hit_ratio"])
+            size.add_metric([name], stats["size"])
+        yield from (hits, misses, ratio, size)
+
+
+class AdmissionCollector:
+    """Occupation des voies du contrôle d'admission, lue à chaque collecte."""
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def collect(self):
+        stats = self.controller.stats()
+        in_flight = GaugeMetricFamily("fiscalia_admission_in_flight", "Unités de génération occupées par voie",
+                                      labels=["lane"])
+        queued = GaugeMetricFamily("fiscalia_admission_queued", "Requêtes en attente d'admission par voie",
+                                   labels=["lane"])
+        for name, lane in stats["lanes"].items():
+            in_flight.add_metric([name], lane["in_flight"])
+            queued.add_metric([name], lane["queued"])
+        yield from (in_flight, queued)
+
+
+def register_chatbot(chatbot) -> None:
+    REGISTRY.register(ChatbotCollector(chatbot))
+
+
+def register_admission(controller) -> None:
+    REGISTRY.register(AdmissionCollector(controller))
+
+
+def render_metrics():
+    """Contenu et type MIME de la réponse /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
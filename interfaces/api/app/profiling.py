@@ -0,0 +1,212 @@
+"""
+Diagnostic des requêtes lentes.
+
+- Profilage à la demande : une requête portant l'en-tête X-Profile (ou toutes les
+  requêtes tant que le profilage est activé par /admin/profiling) est suivie par
+  un profileur par échantillonnage. Le profil est produit au format « collapsed
+  stacks » (une pile par ligne suivie du nombre d'échantillons), lisible par
+  flamegraph.pl, speedscope ou inferno.
+- Capture des requêtes lentes : toute requête plus longue que
+  SLOW_REQUEST_THRESHOLD_S est conservée avec ses durées et sa trace par étape
+  (app.stage_timings) dans un tampon circulaire consultable sur
+  /admin/slow-requests.
+
+Le profileur échantillonne tous les threads du processus (boucle d'événements et
+pool de recherche FAISS) : sous charge, un profil contient aussi le travail des
+requêtes concurrentes. Les threads inactifs (pool en attente, boucle en attente
+d'entrées/sorties) sont comptés à part et exclus des piles.
+"""
+
+import os
+import sys
+import time
+import uuid
+import logging
+import threading
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.stage_timings import start_request_timings, current_timings, current_trace
+
+logger = logging.getLogger(__name__)
+
+# Durée au-delà de laquelle une requête est conservée (secondes)
+SLOW_REQUEST_THRESHOLD_S = float(os.getenv("SLOW_REQUEST_THRESHOLD_S", "5"))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "50"))
+
+# Profilage de toutes les requêtes dès le démarrage (sinon via l'en-tête ou /admin/profiling)
+PROFILE_ALL_REQUESTS = os.getenv("PROFILE_ALL_REQUESTS", "false").lower() == "true"
+PROFILE_SAMPLE_INTERVAL_S = float(os.getenv("PROFILE_SAMPLE_INTERVAL_S", "0.005"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Fonctions feuilles d'un thread qui attend du travail ou des entrées/sorties
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    # Chemin relatif au paquet pour le code de l'API, nom du fichier sinon
+    marker = os.sep + "app" + os.sep
+    short = filename[filename.rfind(marker) + 1:] if marker in filename else os.path.basename(filename)
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """Échantillonne périodiquement les piles de tous les threads dans un thread dédié."""
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL_S, max_depth: int = PROFILE_MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="fiscalia-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.samples += 1
+                if _is_idle(frame):
+                    self.idle_samples += 1
+                    continue
+                labels = []
+                while frame is not None and len(labels) < self.max_depth:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def collapsed(self) -> str:
+        """Piles au format collapsed, des plus fréquentes aux plus rares."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class RequestDiagnostics:
+    """Profils à la demande et tampon circulaire des requêtes lentes."""
+
+    def __init__(self, slow_threshold: float = SLOW_REQUEST_THRESHOLD_S,
+                 slow_buffer_size: int = SLOW_REQUEST_BUFFER_SIZE,
+                 profile_buffer_size: int = PROFILE_BUFFER_SIZE,
+                 profile_all: bool = PROFILE_ALL_REQUESTS):
+        self.slow_threshold = slow_threshold
+        self.profile_all = profile_all
+        self._slow_requests: deque = deque(maxlen=slow_buffer_size)
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._profile_buffer_size = profile_buffer_size
+        self._lock = threading.Lock()
+
+    def should_profile(self, header_value: Optional[str]) -> bool:
+        """Profilage demandé par l'en-tête X-Profile ou activé pour toutes les requêtes."""
+        if header_value is not None and header_value.strip().lower() in ("1", "true", "yes", "on"):
+            return True
+        return self.profile_all
+
+    @contextmanager
+    def capture(self, endpoint: str, question: str, profile: bool = False,
+                request_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Suit une requête : profil si demandé, conservation si elle est lente.
+
+        L'enregistrement renvoyé contient l'identifiant du profil (profile_id)
+        dès l'entrée ; request_id permet de le choisir avant la requête (réponses
+        en streaming dont les en-têtes partent avant la génération).
+        Mettre "outcome" à "error" signale un échec sans lever d'exception.
+        """
+        record = {
+            "id": request_id or uuid.uuid4().hex,
+            "endpoint": endpoint,
+            "question": question,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "outcome": "ok",
+            "profile_id": None,
+        }
+        profiler = None
+        if profile:
+            profiler = SamplingProfiler()
+            record["profile_id"] = record["id"]
+            profiler.start()
+        # Durées propres à cette requête, même si elle échoue avant le chatbot
+        start_request_timings()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            if record["outcome"] == "ok":
+                record["outcome"] = "error"
+            raise
+        finally:
+            record["duration_s"] = time.perf_counter() - start
+            if profiler is not None:
+                profiler.stop()
+                self._store_profile(record, profiler)
+            if record["duration_s"] >= self.slow_threshold:
+                record["timings"] = current_timings()
+                record["trace"] = current_trace()
+                with self._lock:
+                    self._slow_requests.append(record)
+                logger.warning(f"Requête lente ({endpoint}, {record['duration_s']:.2f}s) conservée: {record['id']}")
+
+    def _store_profile(self, record: Dict[str, Any], profiler: SamplingProfiler) -> None:
+        profile = {
+            "id": record["id"],
+            "endpoint": record["endpoint"],
+            "question": record["question"],
+            "started_at": record["started_at"],
+            "duration_s": profiler.duration,
+            "interval_s": profiler.interval,
+            "samples": profiler.samples,
+            "idle_samples": profiler.idle_samples,
+            "collapsed": profiler.collapsed(),
+        }
+        with self._lock:
+            self._profiles[record["id"]] = profile
+            while len(self._profiles) > self._profile_buffer_size:
+                self._profiles.popitem(last=False)
+        logger.info(f"Profil {record['id']} enregistré ({profiler.samples} échantillons)")
+
+    def profiles(self) -> List[Dict[str, Any]]:
+        """Profils conservés, sans les piles, du plus récent au plus ancien."""
+        with self._lock:
+            return [{k: v for k, v in p.items() if k != "collapsed"} for p in reversed(self._profiles.values())]
+
+    def profile(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def slow_requests(self) -> List[Dict[str, Any]]:
+        """Requêtes lentes conservées, de la plus récente à la plus ancienne."""
+        with self._lock:
+            return list(reversed(self._slow_requests))
@@ -0,0 +1,100 @@
+"""
+Choix des fournisseurs d'embeddings et de LLM.
+
+Variables d'environnement :
+- EMBEDDING_PROVIDER : "vertex" (défaut, VertexAIEmbeddings), "hashing"
+  (HashingEmbeddings, sans apprentissage) ou "tfidf" (TfidfSvdEmbeddings, modèle
+  appris par train_tfidf_embeddings.py et lu dans TFIDF_MODEL_PATH)
+- LLM_PROVIDER : "vertex" (défaut, VertexAI) ou "fake" (FakeLLM, réglé par
+  FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SECOND et FAKE_LLM_RESPONSE_TOKENS)
+
+Les fournisseurs locaux permettent de faire tourner, tester et mettre en charge
+l'API sans identifiants GCP ni accès réseau. Les vector stores doivent avoir été
+construits avec le même fournisseur d'embeddings (voir embed_corpus.py).
+"""
+
+import os
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_PROVIDERS = ("vertex", "hashing", "tfidf")
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "vertex").lower()
+if EMBEDDING_PROVIDER not in EMBEDDING_PROVIDERS:
+    logger.warning(f"EMBEDDING_PROVIDER inconnu '{EMBEDDING_PROVIDER}', utilisation de 'vertex'")
+    EMBEDDING_PROVIDER = "vertex"
+
+LLM_PROVIDERS = ("vertex", "fake")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "vertex").lower()
+if LLM_PROVIDER not in LLM_PROVIDERS:
+    logger.warning(f"LLM_PROVIDER inconnu '{LLM_PROVIDER}', utilisation de 'vertex'")
+    LLM_PROVIDER = "vertex"
+
+HASHING_EMBEDDING_DIMENSION = int(os.getenv("HASHING_EMBEDDING_DIMENSION", "768"))
+TFIDF_MODEL_PATH = os.getenv("TFIDF_MODEL_PATH", os.path.join(os.path.dirname(__file__), "local_models", "tfidf_svd.npz"))
+
+
+def create_embeddings():
+    """Modèle d'embedding du fournisseur configuré."""
+    if EMBEDDING_PROVIDER == "hashing":
+        from app.local_embeddings import HashingEmbeddings
+        return HashingEmbeddings(dimension=HASHING_EMBEDDING_DIMENSION)
+    if EMBEDDING_PROVIDER == "tfidf":
+        from app.local_embeddings import TfidfSvdEmbeddings
+        if not os.path.exists(TFIDF_MODEL_PATH):
+            raise FileNotFoundError(f"Modèle TF-IDF introuvable: {TFIDF_MODEL_PATH} "
+                                    "(à créer avec train_tfidf_embeddings.py)")
+        return TfidfSvdEmbeddings.load(TFIDF_MODEL_PATH)
+
+    from langchain_google_vertexai import VertexAIEmbeddings
+    return VertexAIEmbeddings(
+        model_name=os.getenv("MODEL_NAME_EMBEDDING", "text-embedding-004"),
+        project=os.getenv("PROJECT_ID"),
+        location=os.getenv("LOCATION")
+    )
+
+
+def embedding_model_name(embeddings=None) -> str:
+    """Nom identifiant le modèle d'embedding, utilisé dans les clés de cache."""
+    if EMBEDDING_PROVIDER == "hashing":
+        return f"hashing-{HASHING_EMBEDDING_DIMENSION}"
+    if EMBEDDING_PROVIDER == "tfidf":
+        fingerprint = getattr(embeddings, "fingerprint", None)
+        return f"tfidf-svd-{fingerprint}" if fingerprint else "tfidf-svd"
+    return os.getenv("MODEL_NAME_EMBEDDING", "text-embedding-004")
+
+
+def embed_queries(embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeddings de plusieurs questions en un seul appel au fournisseur.
+
+    embed_documents ne convient pas tel quel avec Vertex AI : il calcule des
+    embeddings de type RETRIEVAL_DOCUMENT, alors que les questions sont
+    indexées en RETRIEVAL_QUERY par embed_query.
+    """
+    if EMBEDDING_PROVIDER == "vertex" and hasattr(embeddings, "embed"):
+        return embeddings.embed(texts, embeddings_task_type="RETRIEVAL_QUERY")
+    # Modèles locaux : question et document sont projetés de la même façon
+    return embeddings.embed_documents(texts)
+
+
+def create_llm(**kwargs):
+    """LLM du fournisseur configuré (les kwargs surchargent la configuration)."""
+    if LLM_PROVIDER == "fake":
+        from app.local_llm import FakeLLM
+        return FakeLLM(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.5")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+            response_tokens=int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "120")),
+            json_output=kwargs.get("response_mime_type") == "application/json"
+        )
+
+    from langchain_google_vertexai import VertexAI
+    return VertexAI(
+        model_name=os.getenv("MODEL_NAME_LLM", "gemini-1.5-flash"),
+        project=os.getenv("PROJECT_ID"),
+        location=os.getenv("LOCATION"),
+        temperature=float(os.getenv("TEMPERATURE_LLM", "0.1")),
+        **kwargs
+    )
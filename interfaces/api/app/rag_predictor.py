@@ -1,50 +1,119 @@
-from langchain_google_vertexai import VertexAI, VertexAIEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.documents import Document
+from app.embedding_cache import CachedQueryEmbeddings
+from app.providers import create_embeddings, create_llm, embedding_model_name, embed_queries, EMBEDDING_PROVIDER, LLM_PROVIDER
+from app.answer_cache import SemanticAnswerCache
+from app.reasoning_store import ReasoningStore
+from app.admission import AdmissionRejected
+from app.context_builder import BuiltContext, Passage, build_context, CONTEXT_TOKEN_BUDGET, CONTEXT_FALLBACK_TOKEN_BUDGET
+from app.faiss_loader import (load_faiss_store, has_store_files, supports_mmap, batch_search_supported,
+                              search_by_vectors, FAISS_LOAD_MODE,
+                              VECTOR_STORES_PATH, STORE_NAMES)
+from app.sqlite_docstore import SQLiteDocstore
+from app.index_builder import index_parameters
+from app.store_manifest import read_manifest
+from app.stage_timings import start_request_timings, record_stage, stage, timed, run_in_context
+from app.metrics import observe_retrieved, observe_context
+from app.tokens import load_encoding
+from app.logging_config import debug_enabled
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from types import MappingProxyType
+import asyncio
 import os
-import sys
+import re
+import time
+import hashlib
+import json
 import logging
-from typing import Dict, List, Any
-
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('fiscalia_api.log')
-    ]
-)
-logger = logging.getLogger(__name__)
+from typing import Dict, List, Any, Optional, Tuple, AsyncIterator, AsyncContextManager, Callable, Mapping
 
-# Forcer l'affichage des logs dans le terminal
-for handler in logging.getLogger().handlers:
-    handler.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
-print("=== Démarrage du module rag_predictor ===")
 logger.info("Initialisation du module rag_predictor")
 
 # Configuration des chemins
-BASE_PATH = os.path.join(os.path.dirname(__file__), "vector_stores")
+BASE_PATH = VECTOR_STORES_PATH
 logger.info(f"Chemin de base pour les vector stores: {BASE_PATH}")
 
+# Nombre maximal de recherches FAISS exécutées en parallèle
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "4"))
+
+# Mode de génération de la réponse et du raisonnement :
+# - "sequential" : deux appels au LLM l'un après l'autre
+# - "concurrent" : deux appels au LLM lancés en même temps
+# - "fused" : un seul appel au LLM produisant une sortie JSON structurée
+GENERATION_MODES = ("sequential", "concurrent", "fused")
+GENERATION_MODE = os.getenv("GENERATION_MODE", "concurrent").lower()
+if GENERATION_MODE not in GENERATION_MODES:
+    logger.warning(f"GENERATION_MODE inconnu '{GENERATION_MODE}', utilisation de 'concurrent'")
+    GENERATION_MODE = "concurrent"
+
+# Génération du raisonnement :
+# - "eager" : avec la réponse, à chaque question
+# - "lazy" : à la demande (GET /ask/{response_id}/reasoning), la plupart des
+#   utilisateurs ne l'affichant jamais
+# Le mode "fused" produit les deux en un seul appel : le raisonnement y reste immédiat.
+REASONING_MODES = ("eager", "lazy")
+REASONING_MODE = os.getenv("REASONING_MODE", "lazy").lower()
+if REASONING_MODE not in REASONING_MODES:
+    logger.warning(f"REASONING_MODE inconnu '{REASONING_MODE}', utilisation de 'lazy'")
+    REASONING_MODE = "lazy"
+LAZY_REASONING = REASONING_MODE == "lazy" and GENERATION_MODE != "fused"
+
+# Contextes conservés pour les raisonnements à la demande
+REASONING_CACHE_SIZE = int(os.getenv("REASONING_CACHE_SIZE", "1024"))
+REASONING_CACHE_TTL = float(os.getenv("REASONING_CACHE_TTL", "3600"))
+
+# Cache des embeddings de questions (EMBEDDING_CACHE_SIZE=0 pour le désactiver)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+EMBEDDING_CACHE_PERSIST_EVERY = int(os.getenv("EMBEDDING_CACHE_PERSIST_EVERY", "50"))
+
+# Cache sémantique des réponses (ANSWER_CACHE_SIZE=0 pour le désactiver)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+# Appels simultanés au LLM, par chaîne, pour les lots de questions (/ask/batch)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Préchauffage optionnel (embedding, recherche et LLM) avant de se déclarer prêt
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+WARMUP_QUESTION = os.getenv("WARMUP_QUESTION", "Comment fonctionne la TVA en France?")
+
+# Initialisation du modèle d'embedding
+def initialize_embeddings():
+    """Initialise le modèle d'embedding partagé par tous les vector stores."""
+    embeddings = create_embeddings()
+    model_name = embedding_model_name(embeddings)
+    if EMBEDDING_CACHE_SIZE <= 0:
+        return embeddings
+    
+    return CachedQueryEmbeddings(
+        embeddings,
+        model_name=model_name,
+        max_entries=EMBEDDING_CACHE_SIZE,
+        ttl_seconds=EMBEDDING_CACHE_TTL,
+        persist_path=EMBEDDING_CACHE_PATH,
+        persist_every=EMBEDDING_CACHE_PERSIST_EVERY
+    )
+
 # Chargement des FAISS locaux
-def load_vector_stores():
-    """Charge tous les vecteurs stores."""
+def load_vector_stores(embeddings=None):
+    """Charge tous les vecteurs stores avec un modèle d'embedding commun."""
     try:
         logger.info("Début du chargement des vector stores")
-        embeddings = VertexAIEmbeddings(
-            model_name=os.getenv("MODEL_NAME_EMBEDDING", "text-embedding-004"),
-            project=os.getenv("PROJECT_ID"),
-            location=os.getenv("LOCATION")
-        )
+        if embeddings is None:
+            embeddings = initialize_embeddings()
         
         vector_stores = {}
         # Liste des noms de vector stores à charger
-        store_names = ["cgi", "bofip", "bofip_bareme"]
+        store_names = STORE_NAMES
         
         # Vérifier que le chemin existe
         if not os.path.exists(BASE_PATH):
@@ -62,15 +131,11 @@ def load_vector_stores():
                     files = os.listdir(path)
                     logger.info(f"Fichiers trouvés dans {path}: {files}")
                     
-                    if "index.faiss" in files and "index.pkl" in files:
-                        vector_stores[name] = FAISS.load_local(
-                            path,
-                            embeddings,
-                            allow_dangerous_deserialization=True
-                        )
-                        logger.info(f"Vector store '{name}' chargé avec succès.")
+                    if has_store_files(path):
+                        vector_stores[name] = load_faiss_store(path, embeddings)
+                        logger.info(f"Vector store '{name}' chargé avec succès (mode {FAISS_LOAD_MODE}).")
                     else:
-                        logger.error(f"Fichiers index.faiss et/ou index.pkl introuvables dans {path}")
+                        logger.error(f"Fichiers index.faiss et/ou docstore (docstore.sqlite, index.pkl) introuvables dans {path}")
                 else:
                     logger.warning(f"Chemin du vector store '{name}' introuvable: {path}")
             except Exception as e:
@@ -84,15 +149,68 @@ def load_vector_stores():
         logger.error(f"Erreur globale lors du chargement des vector stores: {str(e)}")
         return {}
 
+def _json_safe_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Convertit les valeurs non sérialisables en JSON en chaînes."""
+    safe = {}
+    for key, value in metadata.items():
+        try:
+            json.dumps({key: value})
+            safe[key] = value
+        except (TypeError, OverflowError):
+            safe[key] = str(value)
+    return safe
+
+def compute_index_version(vector_stores: Dict[str, Any]) -> str:
+    """Calcule une empreinte des vector stores chargés (contenu et fichiers sur disque)."""
+    fingerprint = []
+    for name in sorted(vector_stores):
+        store = vector_stores[name]
+        entry = [name, type(store.index).__name__, store.index.ntotal, store.index.d]
+        index_file = os.path.join(BASE_PATH, name, "index.faiss")
+        if os.path.exists(index_file):
+            stat = os.stat(index_file)
+            entry.extend([stat.st_size, stat.st_mtime_ns])
+        fingerprint.append(entry)
+    return hashlib.sha256(json.dumps(fingerprint).encode("utf-8")).hexdigest()[:16]
+
+def summarize_vector_store(name: str, store) -> Dict[str, Any]:
+    """Construit au démarrage un résumé des métadonnées d'un vector store."""
+    metadata_keys = set()
+    if isinstance(store.docstore, SQLiteDocstore):
+        # Résumé calculé à la conversion : pas de lecture du corpus
+        metadata_keys.update(store.docstore.info().get("metadata_keys", []))
+    else:
+        docstore_dict = getattr(store.docstore, '_dict', {})
+        for doc in docstore_dict.values():
+            if isinstance(getattr(doc, 'metadata', None), dict):
+                metadata_keys.update(doc.metadata.keys())
+    
+    return {
+        "name": name,
+        "document_count": len(store.index_to_docstore_id),
+        "index_type": type(store.index).__name__,
+        "dimension": store.index.d,
+        "load_mode": FAISS_LOAD_MODE if supports_mmap(store.index) else "memory",
+        "docstore": type(store.docstore).__name__,
+        "search_params": index_parameters(store.index),
+        "version": read_manifest(os.path.join(BASE_PATH, name)).get("version"),
+        "metadata_keys": sorted(metadata_keys)
+    }
+
 # Initialisation du LLM
-def initialize_llm():
-    """Initialise le modèle de langage."""
-    return VertexAI(
-        model_name=os.getenv("MODEL_NAME_LLM", "gemini-1.5-flash"),
-        project=os.getenv("PROJECT_ID"),
-        location=os.getenv("LOCATION"),
-        temperature=float(os.getenv("TEMPERATURE_LLM", "0.1"))
-    )
+def initialize_llm(**kwargs):
+    """Initialise le modèle de langage (les kwargs surchargent la configuration)."""
+    return create_llm(**kwargs)
+
+# Schéma de la sortie structurée du mode "fused"
+FUSED_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "reponse": {"type": "STRING"},
+        "raisonnement": {"type": "STRING"}
+    },
+    "required": ["reponse", "raisonnement"]
+}
 
 # Prompt pour la génération de réponse
 prompt_template = """
@@ -145,13 +263,110 @@ Explique ton raisonnement et comment tu es arrivé à cette conclusion, y compri
 Raisonnement en français :
 """
 
+# Prompt unique produisant la réponse et le raisonnement (mode "fused")
+fused_template = """
+Tu es un assistant fiscal expert du Code Général des Impôts et du BOFiP.
+Tu dois répondre aux questions de manière claire, structurée et précise EN FRANÇAIS,
+puis décrire le processus de réflexion que tu as suivi pour y répondre.
+
+La question est : {question}
+
+Utilise les informations des documents suivants pour répondre :
+{context}
+
+IMPORTANT: Quand tu cites des sources, NE FAIS PAS RÉFÉRENCE aux documents par leur numéro (ex: "Document 1").
+À la place, utilise TOUJOURS les métadonnées disponibles pour citer les sources de manière précise.
+
+Pour les citations de sources, utilise le format Markdown suivant pour les mettre en évidence:
+- Pour les sources du CGI: "*<span style='color:#3366CC'>Article [title] du Code Général des Impôts</span>*"
+- Pour les sources du BOFIP: "*<span style='color:#339933'>[title_head] (BOFIP du [date])</span>*"
+- Pour les barèmes: "*<span style='color:#993399'>[title_head] (Barème du [date])</span>*"
+
+Si la question nécessite un calcul (par exemple des montants ou des indemnités), explique comment effectuer ce calcul étape par étape.
+
+Si les documents fournis ne contiennent pas suffisamment d'informations pour répondre précisément, indique-le clairement et propose ce que tu sais sur le sujet en précisant que c'est une information générale.
+
+Le raisonnement doit préciser :
+- Les sources des informations utilisées avec leurs références précises (y compris la section)
+- Les éléments clés que tu as identifiés
+- Le processus logique suivi pour formuler la réponse
+
+Réponds UNIQUEMENT avec un objet JSON de la forme :
+{{"reponse": "<réponse en français>", "raisonnement": "<raisonnement en français>"}}
+"""
+
+@dataclass(frozen=True)
+class RetrievedDocument:
+    """Document trouvé dans un vector store, avec son score et ses métadonnées enrichies."""
+    document: Document
+    store: str
+    score: Optional[float]
+    metadata: Mapping[str, Any]
+    content_preview: str
+
+@dataclass(frozen=True)
+class RetrievalResult:
+    """
+    Résultat immuable d'une recherche, propre à une requête.
+    
+    Il est transmis explicitement au formatage et à la génération, ce qui permet
+    à une même instance de FiscalChatbot de servir plusieurs requêtes en parallèle.
+    """
+    query: str
+    hits: Tuple[RetrievedDocument, ...] = ()
+    
+    @property
+    def documents(self) -> List[Document]:
+        return [hit.document for hit in self.hits]
+    
+    @property
+    def scores(self) -> List[Optional[float]]:
+        return [hit.score for hit in self.hits]
+    
+    def __len__(self) -> int:
+        return len(self.hits)
+
+# Réponse renvoyée lorsqu'aucun document n'est trouvé
+NO_DOCUMENT_ANSWER = "Je n'ai pas pu trouver d'informations pertinentes pour répondre à votre question. Pourriez-vous reformuler ou poser une question différente sur la fiscalité française?"
+NO_DOCUMENT_REASONING = "Aucun document pertinent n'a été trouvé dans les bases de données."
+# Réponse renvoyée en cas d'erreur technique
+ERROR_ANSWER = "Je suis désolé, mais je ne peux pas répondre à cette question pour le moment en raison d'une erreur technique."
+
 class FiscalChatbot:
     """Chatbot spécialisé dans la fiscalité française."""
     
     def __init__(self):
-        """Initialise le chatbot avec tous les composants nécessaires."""
-        self.vector_stores = load_vector_stores()
-        self.llm = initialize_llm()
+        """
+        Prépare le chatbot sans charger les vector stores.
+        
+        Le chargement (embeddings, index FAISS, LLM) est fait par load(), appelé en
+        arrière-plan au démarrage de l'API via start().
+        """
+        self.status = "starting"
+        self.load_error = None
+        self.warm_up_result = None
+        
+        self.embeddings = None
+        self.vector_stores = {}
+        self.store_summaries = {}
+        self.index_version = None
+        self.llm = None
+        self.search_executor = None
+        self.answer_chain = None
+        self.reasoning_chain = None
+        self.fused_chain = None
+        
+        self.answer_cache = None
+        if ANSWER_CACHE_SIZE > 0:
+            self.answer_cache = SemanticAnswerCache(
+                threshold=ANSWER_CACHE_THRESHOLD,
+                max_entries=ANSWER_CACHE_SIZE,
+                ttl_seconds=ANSWER_CACHE_TTL
+            )
+        self.reasoning_store = ReasoningStore(
+            max_entries=REASONING_CACHE_SIZE,
+            ttl_seconds=REASONING_CACHE_TTL
+        )
         self.answer_prompt = PromptTemplate(
             template=prompt_template,
             input_variables=["question", "context"]
@@ -160,7 +375,92 @@ class FiscalChatbot:
             template=reasoning_template,
             input_variables=["question", "context"]
         )
+    
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+    
+    def load(self) -> None:
+        """Charge tous les composants nécessaires (opération bloquante)."""
+        self.status = "loading"
+        started = time.perf_counter()
+        
+        logger.info(f"Fournisseurs: embeddings '{EMBEDDING_PROVIDER}', LLM '{LLM_PROVIDER}'")
+        self.embeddings = initialize_embeddings()
+        vector_stores = load_vector_stores(self.embeddings)
+        self.store_summaries = {
+            name: summarize_vector_store(name, store)
+            for name, store in vector_stores.items()
+        }
+        self.index_version = compute_index_version(vector_stores)
+        self.llm = initialize_llm()
+        # Le premier usage de l'encodage peut le télécharger : pas pendant une requête
+        load_encoding()
+        # Pool borné dédié aux recherches FAISS (seule étape liée au CPU)
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=max(1, min(RETRIEVAL_MAX_WORKERS, len(vector_stores))),
+            thread_name_prefix="faiss-search"
+        )
+        self.answer_chain = self.answer_prompt | self.llm | StrOutputParser()
+        self.reasoning_chain = self.reasoning_prompt | self.llm | StrOutputParser()
         
+        # Chaîne à sortie structurée, créée uniquement si le mode "fused" est actif
+        if GENERATION_MODE == "fused":
+            fused_prompt = PromptTemplate(
+                template=fused_template,
+                input_variables=["question", "context"]
+            )
+            fused_llm = initialize_llm(
+                response_mime_type="application/json",
+                response_schema=FUSED_RESPONSE_SCHEMA
+            )
+            self.fused_chain = fused_prompt | fused_llm | StrOutputParser()
+        
+        # Publié en dernier : les requêtes ne voient les stores qu'une fois tout prêt
+        self.vector_stores = vector_stores
+        logger.info(f"Chatbot chargé en {time.perf_counter() - started:.2f} secondes "
+                    f"({len(vector_stores)} vector stores)")
+    
+    async def warm_up(self, question: str = WARMUP_QUESTION) -> Dict[str, Any]:
+        """Fait passer une question témoin par l'embedding, la recherche et le LLM."""
+        started = time.perf_counter()
+        retrieval = await self._retrieve_relevant_documents(question)
+        await self._generate_texts(question, self._format_documents(question, retrieval.documents).text)
+        return {"documents": len(retrieval), "duration": time.perf_counter() - started}
+    
+    async def start(self, warm_up: bool = WARMUP_ON_STARTUP) -> None:
+        """Charge le chatbot sans bloquer la boucle d'événements, puis le préchauffe si demandé."""
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.load)
+        except Exception as e:
+            logger.error(f"Échec du chargement du chatbot: {str(e)}")
+            self.load_error = str(e)
+            self.status = "failed"
+            return
+        
+        if warm_up:
+            self.status = "warming_up"
+            try:
+                self.warm_up_result = await self.warm_up()
+                logger.info(f"Préchauffage terminé en {self.warm_up_result['duration']:.2f} secondes")
+            except Exception as e:
+                # Les stores sont chargés : on accepte le trafic malgré l'échec du préchauffage
+                logger.warning(f"Échec du préchauffage: {str(e)}")
+                self.warm_up_result = {"error": str(e)}
+        
+        self.status = "ready"
+    
+    def readiness(self) -> Dict[str, Any]:
+        """État de préparation du chatbot, pour la sonde /ready."""
+        return {
+            "status": self.status,
+            "stores": sorted(self.vector_stores),
+            "index_version": self.index_version,
+            "warm_up": self.warm_up_result,
+            "error": self.load_error
+        }
+    
     def _normalize_documents(self, docs):
         """Normalise les documents pour s'assurer qu'ils ont une structure uniforme."""
         normalized = []
@@ -171,152 +471,231 @@ class FiscalChatbot:
                     normalized.append(doc)
                 elif isinstance(doc, str):
                     # Convertir en objet Document simple
-                    from langchain_core.documents import Document
                     normalized.append(Document(page_content=doc, metadata={"source": "Vector Store"}))
                 elif isinstance(doc, dict):
                     # Convertir un dict en objet Document
-                    from langchain_core.documents import Document
                     page_content = doc.get('page_content', str(doc))
                     metadata = doc.get('metadata', {"source": "Vector Store"})
                     normalized.append(Document(page_content=page_content, metadata=metadata))
                 else:
                     # Fallback - convertir en string puis en Document
-                    from langchain_core.documents import Document
                     normalized.append(Document(page_content=str(doc), metadata={"source": "Vector Store"}))
                 
-                logger.info(f"Document normalisé: {type(normalized[-1])}")
-                
-                # Log détaillé des métadonnées
-                if hasattr(normalized[-1], 'metadata'):
-                    logger.info(f"Métadonnées: {normalized[-1].metadata}")
+                # Détail par document, uniquement pour les requêtes échantillonnées
+                if debug_enabled():
+                    logger.debug(f"Document normalisé: {type(normalized[-1])}, métadonnées: {normalized[-1].metadata}")
                 
             except Exception as e:
                 logger.error(f"Erreur lors de la normalisation d'un document: {str(e)}")
         
         return normalized
         
-    def _retrieve_relevant_documents(self, query: str, k: int = 3) -> List[Any]:
-        """Recherche les documents pertinents dans toutes les bases."""
-        all_docs = []
-        document_metadata = []
+    def cache_stats(self) -> Dict[str, Any]:
+        """Compteurs des caches utilisés par le chatbot."""
+        stats = {}
+        if isinstance(self.embeddings, CachedQueryEmbeddings):
+            stats["query_embeddings"] = self.embeddings.stats()
+        if self.answer_cache is not None:
+            stats["answers"] = self.answer_cache.stats()
+        stats["reasonings"] = self.reasoning_store.stats()
+        return stats
+    
+    def shutdown(self) -> None:
+        """Persiste les caches et libère les ressources à l'arrêt de l'API."""
+        if isinstance(self.embeddings, CachedQueryEmbeddings):
+            self.embeddings.save()
+        if self.search_executor is not None:
+            # Les recherches en cours se terminent avant la fermeture des docstores
+            self.search_executor.shutdown(wait=True)
+        for store in self.vector_stores.values():
+            if isinstance(store.docstore, SQLiteDocstore):
+                store.docstore.close()
+    
+    def get_store_metadata(self, name: str, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
+        """Parcourt une page du docstore d'un vector store, à la demande."""
+        store = self.vector_stores[name]
+        if isinstance(store.docstore, SQLiteDocstore):
+            # Une seule requête SQL pour toute la page
+            documents = store.docstore.page(offset, limit)
+        else:
+            total = len(store.index_to_docstore_id)
+            documents = [
+                (position, store.docstore.search(store.index_to_docstore_id[position]))
+                for position in range(offset, min(offset + limit, total))
+            ]
         
+        page = []
+        for position, doc in documents:
+            doc_id = store.index_to_docstore_id[position]
+            if isinstance(doc, str):
+                # Le docstore renvoie un message d'erreur si l'identifiant est absent
+                page.append({"position": position, "doc_id": str(doc_id), "error": doc})
+                continue
+            content = doc.page_content
+            page.append({
+                "position": position,
+                "doc_id": str(doc_id),
+                "metadata": _json_safe_metadata(doc.metadata),
+                "content_preview": content[:200] + '...' if len(content) > 200 else content
+            })
+        return page
+    
+    async def _embed_query(self, query: str) -> Optional[List[float]]:
+        """Calcule une seule fois l'embedding de la question."""
         try:
-            # Vérification que des vector stores sont chargés
-            if not self.vector_stores:
-                logger.error("Aucun vector store disponible pour la recherche.")
-                return []
-                
-            logger.info(f"Recherche de documents pertinents pour la requête: {query}")
-            
-            # Recherche dans chaque base et combine les résultats
-            for name, store in self.vector_stores.items():
+            with stage("embed"):
+                return await self.embeddings.aembed_query(query)
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul de l'embedding de la question: {str(e)}")
+            return None
+    
+    def _search_store(self, name: str, store, query: str, query_embedding: Optional[List[float]], k: int) -> List[Tuple[Any, Optional[float]]]:
+        """Recherche les k plus proches voisins (document, score) dans une base à partir de l'embedding de la question."""
+        with stage(f"search_{name}"):
+            if query_embedding is not None:
                 try:
-                    # Tentative d'extraction directe des métadonnées
-                    try:
-                        logger.info(f"Tentative d'extraction directe des métadonnées pour {name}")
-                        # Accéder aux docstore du vectorstore FAISS
-                        if hasattr(store, 'docstore') and hasattr(store.docstore, '_dict'):
-                            logger.info(f"Accès au docstore de {name}, {len(store.docstore._dict)} documents trouvés")
-                            # Extraction des métadonnées brutes
-                            raw_metadata = []
-                            for doc_id, doc in store.docstore._dict.items():
-                                if hasattr(doc, 'metadata'):
-                                    raw_metadata.append({
-                                        'doc_id': doc_id,
-                                        'metadata': doc.metadata,
-                                        'content': doc.page_content[:200] + '...' if len(doc.page_content) > 200 else doc.page_content
-                                    })
-                            logger.info(f"Métadonnées brutes extraites pour {len(raw_metadata)} documents dans {name}")
-                            
-                            # Sauvegarde des métadonnées pour débuggage
-                            import json
-                            with open(f"metadata_{name}_raw.json", "w", encoding="utf-8") as f:
-                                # Convertir les objets non sérialisables en chaînes
-                                simplified_data = []
-                                for item in raw_metadata[:10]:  # Limiter à 10 documents pour éviter des fichiers trop volumineux
-                                    simplified_item = {
-                                        'doc_id': str(item['doc_id']),
-                                        'metadata': {k: str(v) for k, v in item['metadata'].items()},
-                                        'content': item['content']
-                                    }
-                                    simplified_data.append(simplified_item)
-                                json.dump(simplified_data, f, ensure_ascii=False, indent=2)
-                                logger.info(f"Échantillon de métadonnées sauvegardé dans metadata_{name}_raw.json")
-                    except Exception as e:
-                        logger.error(f"Erreur lors de l'extraction directe des métadonnées de {name}: {str(e)}")
-                    
-                    # Essayer d'abord avec similarity_search
-                    try:
-                        logger.info(f"Utilisation de similarity_search pour {name}")
-                        docs = store.similarity_search(query, k=k)
-                    except Exception as e1:
-                        logger.warning(f"similarity_search a échoué pour {name}: {str(e1)}")
-                        try:
-                            # Essayer avec similarity_search_with_score
-                            logger.info(f"Essai avec similarity_search_with_score pour {name}")
-                            docs_with_scores = store.similarity_search_with_score(query, k=k)
-                            docs = [doc for doc, score in docs_with_scores]
-                        except Exception as e2:
-                            logger.warning(f"similarity_search_with_score a échoué pour {name}: {str(e2)}")
-                            try:
-                                # Dernier essai avec similarity_search_by_vector
-                                logger.info(f"Essai avec similarity_search_by_vector pour {name}")
-                                embedding = store._embedding.embed_query(query)
-                                docs = store.similarity_search_by_vector(embedding, k=k)
-                            except Exception as e3:
-                                logger.error(f"Toutes les méthodes de recherche ont échoué pour {name}: {str(e3)}")
-                                docs = []
-                    
-                    logger.info(f"Documents trouvés dans {name}: {len(docs)}")
-                    
-                    # Inspecter le premier document pour debug
-                    if docs and len(docs) > 0:
-                        logger.info(f"Premier document type: {type(docs[0])}")
-                        logger.info(f"Premier document contenu: {str(docs[0])[:100]}...")
-                        
-                        # Extraction avancée des métadonnées
-                        for doc in docs:
-                            try:
-                                # Vérifier et enrichir les métadonnées
-                                meta = {}
-                                if hasattr(doc, 'metadata'):
-                                    meta = doc.metadata.copy() if isinstance(doc.metadata, dict) else {'raw_metadata': str(doc.metadata)}
-                                
-                                # Ajouter des informations contextuelles
-                                meta['source_vectorstore'] = name
-                                
-                                # Créer une structure enrichie
-                                doc_meta = {
-                                    'document': doc,
-                                    'metadata': meta,
-                                    'content_preview': doc.page_content[:100] if hasattr(doc, 'page_content') else str(doc)[:100]
-                                }
-                                document_metadata.append(doc_meta)
-                            except Exception as e:
-                                logger.error(f"Erreur lors de l'extraction des métadonnées d'un document: {str(e)}")
-                    
-                    all_docs.extend(docs)
+                    return store.similarity_search_with_score_by_vector(query_embedding, k=k)
                 except Exception as e:
-                    logger.error(f"Erreur lors de la recherche dans {name}: {str(e)}")
+                    logger.warning(f"similarity_search_with_score_by_vector a échoué pour {name}: {str(e)}")
             
-            logger.info(f"Total de documents trouvés: {len(all_docs)}")
+            try:
+                # Repli sur la recherche textuelle (recalcule l'embedding)
+                logger.info(f"Repli sur similarity_search_with_score pour {name}")
+                return store.similarity_search_with_score(query, k=k)
+            except Exception as e:
+                logger.error(f"Toutes les méthodes de recherche ont échoué pour {name}: {str(e)}")
+                return []
+    
+    async def _retrieve_relevant_documents(self, query: str, k: int = 3,
+                                           query_embedding: Optional[List[float]] = None) -> RetrievalResult:
+        """Recherche les documents pertinents dans toutes les bases."""
+        try:
+            # Vérification que des vector stores sont chargés
+            if not self.vector_stores:
+                logger.error("Aucun vector store disponible pour la recherche.")
+                return RetrievalResult(query=query)
             
-            # Normaliser les documents avant de les retourner
-            normalized_docs = self._normalize_documents(all_docs)
-            logger.info(f"Documents normalisés: {len(normalized_docs)}")
+            # Un seul embedding de la question, partagé par toutes les bases
+            if query_embedding is None:
+                query_embedding = await self._embed_query(query)
             
-            # Attacher les métadonnées enrichies
-            self.last_search_metadata = document_metadata
+            # Recherches FAISS en parallèle sur toutes les bases, hors de la boucle d'événements
+            loop = asyncio.get_running_loop()
+            names = list(self.vector_stores)
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self.search_executor, run_in_context(self._search_store),
+                                     name, self.vector_stores[name], query, query_embedding, k)
+                for name in names
+            ))
             
-            return normalized_docs
+            return self._collect_hits(query, names, results)
         except Exception as e:
             logger.error(f"Erreur dans _retrieve_relevant_documents: {str(e)}")
-            self.last_search_metadata = []
+            return RetrievalResult(query=query)
+    
+    async def _embed_queries(self, queries: List[str]) -> List[Optional[List[float]]]:
+        """Calcule les embeddings de toutes les questions d'un lot en un seul appel au modèle."""
+        try:
+            with stage("embed"):
+                if isinstance(self.embeddings, CachedQueryEmbeddings):
+                    return await self.embeddings.aembed_queries(queries)
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, embed_queries, self.embeddings, queries)
+        except Exception as e:
+            logger.error(f"Erreur lors du calcul des embeddings du lot: {str(e)}")
+            return [None] * len(queries)
+    
+    def _search_store_batch(self, name: str, store, queries: List[str],
+                            query_embeddings: List[Optional[List[float]]], k: int) -> List[List[Tuple[Any, Optional[float]]]]:
+        """Recherche toutes les questions d'un lot dans une base avec une seule matrice de requêtes FAISS."""
+        batch = {}
+        positions = [i for i, embedding in enumerate(query_embeddings) if embedding is not None]
+        if positions and batch_search_supported(store):
+            with stage(f"search_{name}"):
+                try:
+                    results = search_by_vectors(store, [query_embeddings[i] for i in positions], k)
+                    batch = dict(zip(positions, results))
+                except Exception as e:
+                    logger.warning(f"Recherche groupée échouée pour {name}: {str(e)}")
+                    batch = {}
+        
+        # Questions sans embedding ou recherche groupée en échec : une recherche par question
+        return [
+            batch[i] if i in batch else self._search_store(name, store, query, query_embeddings[i], k)
+            for i, query in enumerate(queries)
+        ]
+    
+    async def _retrieve_batch(self, queries: List[str], query_embeddings: List[Optional[List[float]]],
+                              k: int = 3) -> List[RetrievalResult]:
+        """Recherche les documents pertinents de plusieurs questions, base par base."""
+        if not queries:
             return []
+        try:
+            if not self.vector_stores:
+                logger.error("Aucun vector store disponible pour la recherche.")
+                return [RetrievalResult(query=query) for query in queries]
+            
+            loop = asyncio.get_running_loop()
+            names = list(self.vector_stores)
+            per_store = await asyncio.gather(*(
+                loop.run_in_executor(self.search_executor, run_in_context(self._search_store_batch),
+                                     name, self.vector_stores[name], queries, query_embeddings, k)
+                for name in names
+            ))
+            return [
+                self._collect_hits(query, names, [store_results[j] for store_results in per_store])
+                for j, query in enumerate(queries)
+            ]
+        except Exception as e:
+            logger.error(f"Erreur dans _retrieve_batch: {str(e)}")
+            return [RetrievalResult(query=query) for query in queries]
+    
+    def _collect_hits(self, query: str, names: List[str],
+                      results: List[List[Tuple[Any, Optional[float]]]]) -> RetrievalResult:
+        """Combine les résultats des bases, dans leur ordre, en un résultat de recherche."""
+        hits = []
+        for name, docs_with_scores in zip(names, results):
+            if debug_enabled():
+                logger.debug(f"Documents trouvés dans {name}: {len(docs_with_scores)}")
+            observe_retrieved(name, len(docs_with_scores))
+            
+            for doc, score in docs_with_scores:
+                try:
+                    with stage("normalize"):
+                        normalized = self._normalize_documents([doc])
+                    if not normalized:
+                        continue
+                    doc = normalized[0]
+                    
+                    # Copie des métadonnées enrichie de la base d'origine
+                    meta = doc.metadata.copy() if isinstance(doc.metadata, dict) else {'raw_metadata': str(doc.metadata)}
+                    meta['source_vectorstore'] = name
+                    
+                    hits.append(RetrievedDocument(
+                        document=doc,
+                        store=name,
+                        score=float(score) if score is not None else None,
+                        metadata=MappingProxyType(meta),
+                        content_preview=doc.page_content[:100]
+                    ))
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'extraction des métadonnées d'un document: {str(e)}")
+        
+        if debug_enabled():
+            logger.debug(f"Total de documents trouvés: {len(hits)}")
+        return RetrievalResult(query=query, hits=tuple(hits))
     
-    def _format_documents(self, docs: List[Any]) -> str:
-        """Formate les documents pour les utiliser dans le prompt."""
-        formatted_docs = []
+    def _format_documents(self, question: str, docs: List[Any],
+                          token_budget: int = CONTEXT_TOKEN_BUDGET) -> BuiltContext:
+        """
+        Formate les documents pour les utiliser dans le prompt.
+        
+        Chaque document garde sa citation ; les doublons sont écartés et le contexte
+        est réduit aux phrases les plus pertinentes pour la question s'il dépasse
+        token_budget (voir app.context_builder). Le texte du prompt est context.text ;
+        context.tokens en donne le décompte.
+        """
+        passages = []
         
         for i, doc in enumerate(docs):
             try:
@@ -355,7 +734,6 @@ class FiscalChatbot:
                         # Extraire des informations du contenu si les métadonnées sont insuffisantes
                         if not title or title == "":
                             # Essayer d'extraire un numéro d'article ou une section du contenu
-                            import re
                             article_match = re.search(r'Article (\d+[A-Z]?)', content)
                             if article_match:
                                 title = article_match.group(1)
@@ -392,178 +770,358 @@ class FiscalChatbot:
                         # Format générique si le type n'est pas reconnu
                         metadata_str = f"*<span style='color:#999999'>{metadata.get('source', 'Inconnue')}</span>*"
                 
-                # Ajouter le document formaté
-                formatted_docs.append(f"Document {i+1} {metadata_str}:\n{content}")
+                # Ajouter le document avec sa citation
+                passages.append(Passage(citation=metadata_str, content=content))
             except Exception as e:
                 logger.error(f"Erreur lors du formatage du document {i}: {str(e)}")
         
-        if not formatted_docs:
-            return "Aucun document pertinent trouvé."
-            
-        return "\n\n".join(formatted_docs)
+        context = build_context(question, passages, token_budget)
+        if debug_enabled():
+            logger.debug(f"Contexte: {len(context.passages)}/{len(passages)} documents, {context.tokens} tokens "
+                         f"sur {context.source_tokens} ({context.duplicates} doublons écartés)")
+        return context
     
-    def generate_answer(self, question: str) -> Dict[str, str]:
-        """Génère une réponse et le raisonnement associé à une question."""
+    def _build_sources(self, retrieval: RetrievalResult) -> List[Dict[str, Any]]:
+        """Construit la liste détaillée des sources renvoyée au client."""
+        detailed_sources = []
+        
+        for i, hit in enumerate(retrieval.hits):
+            try:
+                # Copie locale : les métadonnées du résultat de recherche restent intactes
+                metadata = dict(hit.metadata)
+                content_preview = hit.content_preview
+                
+                # Enrichir les métadonnées pour les sources CGI
+                if 'source' in metadata and "Code Général des Impôts" in metadata['source']:
+                    # Essayer d'extraire des informations significatives du contenu
+                    content = content_preview
+                    
+                    # Chercher des numéros d'articles
+                    article_match = re.search(r'Article (\d+[A-Z]?)', content)
+                    if article_match:
+                        metadata['article'] = article_match.group(1)
+                    
+                    # Chercher des sections thématiques
+                    for keyword in ["TVA", "impôt sur le revenu", "impôt sur les sociétés", 
+                                    "taxe foncière", "IS", "IR", "taxe d'habitation"]:
+                        if keyword.lower() in content.lower():
+                            metadata['theme'] = keyword
+                            break
+                            
+                    # Extraire quelques mots clés du début du document
+                    first_words = " ".join(content.strip().split()[:10]) + "..."
+                    metadata['extrait'] = first_words
+                
+                # Filtrer les clés non sérialisables ou trop volumineuses
+                metadata.pop('embedding', None)
+                
+                # Formatage des métadonnées
+                detailed_sources.append({
+                    "index": i + 1,
+                    "source": metadata.get('source', 'Document ' + str(i+1)),
+                    "metadata": metadata,
+                    "content_preview": content_preview,
+                    "score": hit.score
+                })
+                if debug_enabled():
+                    logger.debug(f"Métadonnées enrichies du document {i+1}: {metadata}")
+                
+            except Exception as e:
+                logger.error(f"Erreur lors de l'extraction des métadonnées enrichies du document {i+1}: {str(e)}")
+                detailed_sources.append({
+                    "index": i + 1,
+                    "source": "Source inaccessible",
+                    "error": str(e)
+                })
+        
+        return detailed_sources
+    
+    @staticmethod
+    def _parse_fused_output(raw: str) -> Tuple[str, str]:
+        """Sépare la réponse et le raisonnement de la sortie JSON du mode "fused"."""
         try:
+            parsed = JsonOutputParser().parse(raw)
+            if isinstance(parsed, dict) and parsed.get("reponse"):
+                return parsed["reponse"], parsed.get("raisonnement", "")
+        except OutputParserException as e:
+            logger.warning(f"Sortie structurée invalide: {str(e)}")
+        
+        # Sortie non structurée : on la renvoie telle quelle comme réponse
+        return raw, "Raisonnement indisponible : la sortie du modèle n'était pas structurée."
+    
+    async def _generate_texts(self, question: str, context: str) -> Tuple[str, Optional[str]]:
+        """
+        Génère la réponse et le raisonnement selon GENERATION_MODE.
+        
+        Le raisonnement vaut None en mode REASONING_MODE=lazy (généré à la demande).
+        """
+        inputs = {"question": question, "context": context}
+        
+        if self.fused_chain is not None:
+            raw = await timed("fused_llm", self.fused_chain.ainvoke(inputs))
+            return self._parse_fused_output(raw)
+        
+        if LAZY_REASONING:
+            return await timed("answer_llm", self.answer_chain.ainvoke(inputs)), None
+        
+        if GENERATION_MODE == "sequential":
+            answer = await timed("answer_llm", self.answer_chain.ainvoke(inputs))
+            reasoning = await timed("reasoning_llm", self.reasoning_chain.ainvoke(inputs))
+            return answer, reasoning
+        
+        # Les deux générations partagent le même contexte : on les lance en même temps
+        answer, reasoning = await asyncio.gather(
+            timed("answer_llm", self.answer_chain.ainvoke(inputs)),
+            timed("reasoning_llm", self.reasoning_chain.ainvoke(inputs))
+        )
+        return answer, reasoning
+    
+    def batch_generation_slots(self, n_questions: int) -> int:
+        """
+        Appels simultanés au LLM au plus pour générer un lot de n_questions questions.
+        
+        Le mode "concurrent" avec raisonnement immédiat lance deux chaînes par
+        question (réponse et raisonnement) ; les autres modes n'en lancent qu'une à la fois.
+        """
+        calls = min(n_questions, BATCH_MAX_CONCURRENCY)
+        if self.fused_chain is None and not LAZY_REASONING and GENERATION_MODE == "concurrent":
+            return 2 * calls
+        return calls
+    
+    @staticmethod
+    async def _abatch(chain, inputs: List[Dict[str, str]], semaphore: asyncio.Semaphore) -> List[Any]:
+        """
+        Exécute la chaîne sur chaque entrée, dans la limite des places du sémaphore.
+        
+        Équivalent de chain.abatch(inputs, return_exceptions=True) : abatch des LLM
+        LangChain (VertexAI comme FakeLLM) découpe le lot en paquets dont les
+        prompts sont envoyés l'un après l'autre, sans concurrence.
+        """
+        async def invoke(item):
+            async with semaphore:
+                try:
+                    return await chain.ainvoke(item)
+                except Exception as e:
+                    return e
+        
+        return await asyncio.gather(*(invoke(item) for item in inputs))
+    
+    async def _generate_texts_batch(self, inputs: List[Dict[str, str]],
+                                    max_generations: Optional[int] = None) -> List[Any]:
+        """
+        Génère réponses et raisonnements d'un lot, dans l'ordre des entrées.
+        
+        Chaque élément est un couple (réponse, raisonnement), ou l'exception levée
+        pour cette entrée ; le raisonnement vaut None en mode REASONING_MODE=lazy.
+        Les chaînes du lot partagent batch_generation_slots places, réduites à
+        max_generations si le contrôle d'admission en a accordé moins.
+        """
+        if not inputs:
+            return []
+        
+        slots = self.batch_generation_slots(len(inputs))
+        if max_generations:
+            slots = min(slots, max_generations)
+        semaphore = asyncio.Semaphore(slots)
+        
+        if self.fused_chain is not None:
+            raws = await timed("fused_llm", self._abatch(self.fused_chain, inputs, semaphore))
+            return [raw if isinstance(raw, Exception) else self._parse_fused_output(raw) for raw in raws]
+        
+        if LAZY_REASONING:
+            answers = await timed("answer_llm", self._abatch(self.answer_chain, inputs, semaphore))
+            return [answer if isinstance(answer, Exception) else (answer, None) for answer in answers]
+        
+        if GENERATION_MODE == "sequential":
+            answers = await timed("answer_llm", self._abatch(self.answer_chain, inputs, semaphore))
+            reasonings = await timed("reasoning_llm", self._abatch(self.reasoning_chain, inputs, semaphore))
+        else:
+            answers, reasonings = await asyncio.gather(
+                timed("answer_llm", self._abatch(self.answer_chain, inputs, semaphore)),
+                timed("reasoning_llm", self._abatch(self.reasoning_chain, inputs, semaphore))
+            )
+        return [
+            answer if isinstance(answer, Exception) else reasoning if isinstance(reasoning, Exception) else (answer, reasoning)
+            for answer, reasoning in zip(answers, reasonings)
+        ]
+    
+    def _build_result(self, question: str, context: str, answer: str, reasoning: Optional[str],
+                      retrieval: RetrievalResult) -> Dict[str, Any]:
+        """
+        Assemble le résultat d'une question.
+        
+        Sans raisonnement (mode lazy), le contexte est conservé sous un identifiant
+        de réponse pour le générer à la demande. Le résultat garde aussi le contexte
+        (clé "context", retirée par _public_result) pour qu'une réponse resservie par
+        le cache puisse encore obtenir son raisonnement.
+        """
+        result = {"answer": answer, "reasoning": reasoning or "", "sources": self._build_sources(retrieval)}
+        if reasoning is None:
+            result["response_id"] = self.reasoning_store.register(question, context)
+            result["context"] = context
+        return result
+    
+    def _public_result(self, result: Dict[str, Any], question: str) -> Dict[str, Any]:
+        """
+        Retire le contexte conservé d'un résultat ; une réponse resservie par le cache
+        dont le contexte a quitté le magasin de raisonnements y est réinscrite.
+        """
+        context = result.pop("context", None)
+        if context is not None and result.get("response_id") not in self.reasoning_store:
+            result["response_id"] = self.reasoning_store.register(question, context)
+        return result
+    
+    async def generate_reasoning(self, response_id: str,
+                                 admit: Optional[Callable[[], AsyncContextManager]] = None) -> Optional[str]:
+        """
+        Raisonnement d'une réponse produite en mode lazy, généré au premier appel.
+        
+        Renvoie None si l'identifiant est inconnu ou expiré. admit fournit, si
+        besoin, le contexte à traverser avant l'appel au LLM (contrôle d'admission) ;
+        un raisonnement déjà généré est resservi sans le traverser.
+        """
+        async def generate(question: str, context: str) -> str:
+            async with (admit() if admit is not None else nullcontext()):
+                inputs = {"question": question, "context": context}
+                return await timed("reasoning_llm", self.reasoning_chain.ainvoke(inputs))
+        
+        return await self.reasoning_store.reasoning(response_id, generate)
+    
+    async def generate_answers(self, questions: List[str], k: int = 3,
+                               max_generations: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Répond à un lot de questions ; les résultats sont dans l'ordre des questions.
+        
+        Le lot partage un seul appel au modèle d'embedding, une recherche FAISS par
+        base (matrice des embeddings des questions) et des générations groupées
+        (batch_generation_slots appels simultanés au LLM, au plus max_generations). Une question
+        en échec reçoit sa propre réponse d'erreur sans interrompre le lot. Les
+        durées par étape du lot sont disponibles via current_timings().
+        """
+        start_request_timings()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+        query_embeddings = await self._embed_queries(questions)
+        
+        # Questions proches de réponses déjà en cache
+        pending = []
+        for i, (question, query_embedding) in enumerate(zip(questions, query_embeddings)):
+            if self.answer_cache is not None and query_embedding is not None:
+                cached = self.answer_cache.lookup(query_embedding, self.index_version)
+                if cached is not None:
+                    results[i] = self._public_result(cached, question)
+                    continue
+            pending.append(i)
+        
+        retrievals = await self._retrieve_batch(
+            [questions[i] for i in pending], [query_embeddings[i] for i in pending], k
+        )
+        to_generate = []
+        for i, retrieval in zip(pending, retrievals):
+            if not retrieval:
+                results[i] = {"answer": NO_DOCUMENT_ANSWER, "reasoning": NO_DOCUMENT_REASONING,
+                              "sources": [], "error": False}
+                continue
+            with stage("format"):
+                context = self._format_documents(questions[i], retrieval.documents)
+            observe_context(context)
+            to_generate.append((i, retrieval, {"question": questions[i], "context": context.text}))
+        
+        generated = await self._generate_texts_batch([inputs for _, _, inputs in to_generate], max_generations)
+        for (i, retrieval, inputs), outcome in zip(to_generate, generated):
+            if isinstance(outcome, Exception):
+                logger.error(f"Erreur de génération pour la question {i + 1} du lot: {str(outcome)}")
+                results[i] = {"answer": ERROR_ANSWER, "reasoning": f"Une erreur s'est produite: {str(outcome)}",
+                              "error": True}
+                continue
+            answer, reasoning = outcome
+            result = self._build_result(questions[i], inputs["context"], answer, reasoning, retrieval)
+            if self.answer_cache is not None and query_embeddings[i] is not None:
+                self.answer_cache.store(questions[i], query_embeddings[i], self.index_version, result)
+            results[i] = self._public_result(result, questions[i])
+        
+        logger.info(f"Lot de {len(questions)} questions traité ({len(questions) - len(pending)} depuis le cache, "
+                    f"{sum(1 for r in results if r.get('error'))} en erreur)")
+        return results
+    
+    async def generate_answer(self, question: str,
+                              admit: Optional[Callable[[], AsyncContextManager]] = None) -> Dict[str, str]:
+        """
+        Génère une réponse et le raisonnement associé à une question, avec les durées par étape.
+        
+        admit fournit, si besoin, le contexte à traverser avant les appels au LLM
+        (contrôle d'admission) : une réponse resservie par le cache ou une question
+        sans document ne le traverse pas. AdmissionRejected est propagée à l'appelant.
+        """
+        timings = start_request_timings()
+        try:
+            # Une question proche a-t-elle déjà reçu une réponse ?
+            query_embedding = await self._embed_query(question)
+            if self.answer_cache is not None and query_embedding is not None:
+                cached = self.answer_cache.lookup(query_embedding, self.index_version)
+                if cached is not None:
+                    return {**self._public_result(cached, question), "timings": dict(timings)}
+            
             # Récupération des documents pertinents
-            docs = self._retrieve_relevant_documents(question)
+            retrieval = await self._retrieve_relevant_documents(question, query_embedding=query_embedding)
             
-            if not docs:
+            if not retrieval:
                 logger.warning(f"Aucun document trouvé pour la question: {question}")
                 return {
-                    "answer": "Je n'ai pas pu trouver d'informations pertinentes pour répondre à votre question. Pourriez-vous reformuler ou poser une question différente sur la fiscalité française?",
-                    "reasoning": "Aucun document pertinent n'a été trouvé dans les bases de données.",
+                    "answer": NO_DOCUMENT_ANSWER,
+                    "reasoning": NO_DOCUMENT_REASONING,
                     "sources": [],
-                    "error": False
+                    "error": False,
+                    "timings": dict(timings)
                 }
             
-            # Log de debug pour vérifier le format des documents
-            logger.info(f"Type du premier document avant formatage: {type(docs[0])}")
-            if hasattr(docs[0], 'page_content'):
-                logger.info(f"Premier document page_content: {docs[0].page_content[:100]}...")
-            else:
-                logger.info(f"Premier document sans page_content: {str(docs[0])[:100]}...")
-            
-            # Extraction des métadonnées détaillées
-            detailed_sources = []
-            
-            # Utiliser les métadonnées enrichies si disponibles
-            if hasattr(self, 'last_search_metadata') and self.last_search_metadata:
-                logger.info(f"Utilisation des métadonnées enrichies: {len(self.last_search_metadata)} documents")
-                
-                for i, doc_meta in enumerate(self.last_search_metadata):
-                    try:
-                        metadata = doc_meta.get('metadata', {})
-                        content_preview = doc_meta.get('content_preview', '')
-                        
-                        # Enrichir les métadonnées pour les sources CGI
-                        if 'source' in metadata and "Code Général des Impôts" in metadata['source']:
-                            # Essayer d'extraire des informations significatives du contenu
-                            import re
-                            content = content_preview
-                            
-                            # Chercher des numéros d'articles
-                            article_match = re.search(r'Article (\d+[A-Z]?)', content)
-                            if article_match:
-                                metadata['article'] = article_match.group(1)
-                            
-                            # Chercher des sections thématiques
-                            for keyword in ["TVA", "impôt sur le revenu", "impôt sur les sociétés", 
-                                            "taxe foncière", "IS", "IR", "taxe d'habitation"]:
-                                if keyword.lower() in content.lower():
-                                    metadata['theme'] = keyword
-                                    break
-                                    
-                            # Extraire quelques mots clés du début du document
-                            first_words = " ".join(content.strip().split()[:10]) + "..."
-                            metadata['extrait'] = first_words
-                        
-                        # Formatage des métadonnées
-                        source_info = {
-                            "index": i + 1,
-                            "source": metadata.get('source', 'Document ' + str(i+1)),
-                            "metadata": metadata,
-                            "content_preview": content_preview
-                        }
-                        
-                        # Filtrer les clés non sérialisables ou trop volumineuses
-                        if 'embedding' in source_info['metadata']:
-                            del source_info['metadata']['embedding']
-                        
-                        detailed_sources.append(source_info)
-                        logger.info(f"Métadonnées enrichies du document {i+1}: {metadata}")
-                        
-                    except Exception as e:
-                        logger.error(f"Erreur lors de l'extraction des métadonnées enrichies du document {i+1}: {str(e)}")
-                        detailed_sources.append({
-                            "index": i + 1,
-                            "source": "Source inaccessible",
-                            "error": str(e)
-                        })
-            else:
-                # Fallback sur l'extraction classique
-                logger.info("Utilisation de l'extraction de métadonnées standard")
-                
-                for i, doc in enumerate(docs):
-                    try:
-                        metadata = {}
-                        if hasattr(doc, 'metadata') and isinstance(doc.metadata, dict):
-                            metadata = doc.metadata
-                            
-                        # Formatage des métadonnées
-                        source_info = {
-                            "index": i + 1,
-                            "source": metadata.get('source', 'Document ' + str(i+1)),
-                            "metadata": metadata
-                        }
-                        
-                        # Filtrer les clés non sérialisables ou trop volumineuses
-                        if 'embedding' in source_info['metadata']:
-                            del source_info['metadata']['embedding']
-                        
-                        detailed_sources.append(source_info)
-                        logger.info(f"Métadonnées du document {i+1}: {metadata}")
-                        
-                    except Exception as e:
-                        logger.error(f"Erreur lors de l'extraction des métadonnées du document {i+1}: {str(e)}")
-                        detailed_sources.append({
-                            "index": i + 1,
-                            "source": "Source inaccessible",
-                            "error": str(e)
-                        })
-            
             # Conversion directe en texte pour éviter les problèmes d'attributs
-            context = self._format_documents(docs)
-            logger.info(f"Contexte formaté: {len(context)} caractères")
+            with stage("format"):
+                built = self._format_documents(question, retrieval.documents)
+            context = built.text
+            if debug_enabled():
+                logger.debug(f"Contexte formaté: {len(context)} caractères")
+            observe_context(built)
             
-            try:
-                # Nouvelle approche avec RunnableSequence
-                answer_chain = (
-                    {"question": RunnablePassthrough(), "context": lambda x: context}
-                    | self.answer_prompt
-                    | self.llm
-                    | StrOutputParser()
-                )
-                
-                reasoning_chain = (
-                    {"question": RunnablePassthrough(), "context": lambda x: context}
-                    | self.reasoning_prompt
-                    | self.llm
-                    | StrOutputParser()
-                )
-                
-                # Exécution des chaînes
-                logger.info("Génération de la réponse avec RunnableSequence...")
-                answer = answer_chain.invoke(question)
-                logger.info(f"Réponse générée: {len(answer)} caractères")
-                
-                logger.info("Génération du raisonnement avec RunnableSequence...")
-                reasoning = reasoning_chain.invoke(question)
-                logger.info(f"Raisonnement généré: {len(reasoning)} caractères")
+            # Seule la génération occupe une place d'admission
+            async with (admit() if admit is not None else nullcontext()):
+                try:
+                    answer, reasoning = await self._generate_texts(question, context)
+                    if debug_enabled():
+                        logger.debug(f"Réponse générée ({GENERATION_MODE}): {len(answer)} caractères, "
+                                     f"raisonnement: {len(reasoning) if reasoning is not None else 'à la demande'}")
+                    cacheable = True
                 
-            except Exception as e:
-                logger.error(f"Erreur lors de l'utilisation de RunnableSequence: {str(e)}")
-                logger.info("Tentative avec appel direct au LLM...")
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'utilisation de RunnableSequence: {str(e)}")
+                    logger.info("Tentative avec appel direct au LLM...")
                 
-                # Si tout échoue, utiliser le LLM directement
-                combined_prompt = f"""
+                    # Si tout échoue, utiliser le LLM directement avec un contexte plus court
+                    with stage("format"):
+                        fallback_context = self._format_documents(question, retrieval.documents,
+                                                                  CONTEXT_FALLBACK_TOKEN_BUDGET).text
+                    combined_prompt = f"""
                 Question: {question}
                 
-                Contexte: {context[:4000]}... (tronqué pour la longueur)
+                Contexte: {fallback_context}
                 
                 Réponse:
                 """
                 
-                answer = self.llm.invoke(combined_prompt)
-                reasoning = f"Raisonnement simplifié en raison d'une erreur technique. La réponse a été générée directement à partir du contexte."
+                    answer = await timed("fallback_llm", self.llm.ainvoke(combined_prompt))
+                    reasoning = f"Raisonnement simplifié en raison d'une erreur technique. La réponse a été générée directement à partir du contexte."
+                    # Une réponse dégradée ne doit pas être resservie
+                    cacheable = False
             
-            logger.info(f"Réponse complétée avec {len(detailed_sources)} sources détaillées")
-            return {
-                "answer": answer,
-                "reasoning": reasoning,
-                "sources": detailed_sources
-            }
+            # Le résultat de recherche est propre à la requête et transmis explicitement
+            result = self._build_result(question, context, answer, reasoning, retrieval)
+            if debug_enabled():
+                logger.debug(f"Réponse complétée avec {len(result['sources'])} sources détaillées")
+            if cacheable and self.answer_cache is not None and query_embedding is not None:
+                self.answer_cache.store(question, query_embedding, self.index_version, result)
+            return {**self._public_result(result, question), "timings": dict(timings)}
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             # Gestion des erreurs pour assurer la robustesse
             error_message = f"Une erreur s'est produite: {str(e)}"
@@ -571,15 +1129,81 @@ class FiscalChatbot:
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
             return {
-                "answer": "Je suis désolé, mais je ne peux pas répondre à cette question pour le moment en raison d'une erreur technique.",
+                "answer": ERROR_ANSWER,
                 "reasoning": error_message,
-                "error": True
+                "error": True,
+                "timings": dict(timings)
             }
 
-# Initialisation d'une instance unique du chatbot
+    async def stream_answer(self, question: str) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Génère une réponse sous forme d'événements successifs.
+        
+        Produit dans l'ordre : ("sources", liste), ("answer", morceau de texte) au fil
+        de la génération, ("reasoning", texte) puis ("timing", durées par étape).
+        En mode REASONING_MODE=lazy, ("response_id", identifiant) remplace
+        ("reasoning", texte) : le raisonnement est généré à la demande.
+        Le mode "fused" n'est pas utilisé ici car sa sortie JSON ne peut pas être
+        diffusée morceau par morceau.
+        """
+        lazy = REASONING_MODE == "lazy"
+        start_time = time.perf_counter()
+        timings = start_request_timings()
+        
+        retrieval = await self._retrieve_relevant_documents(question)
+        timings["retrieval_time"] = time.perf_counter() - start_time
+        
+        yield "sources", self._build_sources(retrieval)
+        
+        if not retrieval:
+            logger.warning(f"Aucun document trouvé pour la question: {question}")
+            yield "answer", NO_DOCUMENT_ANSWER
+            yield "reasoning", NO_DOCUMENT_REASONING
+            timings["processing_time"] = time.perf_counter() - start_time
+            yield "timing", timings
+            return
+        
+        with stage("format"):
+            built = self._format_documents(question, retrieval.documents)
+        observe_context(built)
+        inputs = {"question": question, "context": built.text}
+        
+        # Le raisonnement est calculé pendant la diffusion de la réponse
+        reasoning_task = None
+        if not lazy and GENERATION_MODE != "sequential":
+            reasoning_task = asyncio.create_task(timed("reasoning_llm", self.reasoning_chain.ainvoke(inputs)))
+        
+        try:
+            generation_start = time.perf_counter()
+            async for chunk in self.answer_chain.astream(inputs):
+                if "time_to_first_token" not in timings:
+                    timings["time_to_first_token"] = time.perf_counter() - start_time
+                yield "answer", chunk
+            timings["answer_time"] = time.perf_counter() - generation_start
+            record_stage("answer_llm", timings["answer_time"])
+            
+            if lazy:
+                yield "response_id", self.reasoning_store.register(question, inputs["context"])
+            else:
+                if reasoning_task is None:
+                    reasoning = await timed("reasoning_llm", self.reasoning_chain.ainvoke(inputs))
+                else:
+                    reasoning = await reasoning_task
+                timings["reasoning_time"] = time.perf_counter() - generation_start
+                yield "reasoning", reasoning
+        finally:
+            # Client déconnecté ou erreur : on n'attend pas un raisonnement inutile
+            if reasoning_task is not None and not reasoning_task.done():
+                reasoning_task.cancel()
+        
+        timings["processing_time"] = time.perf_counter() - start_time
+        yield "timing", timings
+
+# Instance unique du chatbot, chargée en arrière-plan au démarrage de l'API
 chatbot = FiscalChatbot()
 
-def answer_question(query: str) -> Dict[str, Any]:
-    """Point d'entrée pour répondre aux questions."""
-    return chatbot.generate_answer(query)
+async def answer_question(query: str,
+                          admit: Optional[Callable[[], AsyncContextManager]] = None) -> Dict[str, Any]:
+    """Point d'entrée pour répondre aux questions (admit : voir FiscalChatbot.generate_answer)."""
+    return await chatbot.generate_answer(query, admit)
 
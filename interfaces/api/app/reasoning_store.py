@@ -0,0 +1,111 @@
+"""
+Raisonnements générés à la demande.
+
+En mode REASONING_MODE=lazy, /ask ne génère que la réponse : la question et le
+contexte documentaire de la recherche sont conservés ici sous un identifiant de
+réponse (response_id). Le raisonnement est généré au premier appel de
+GET /ask/{response_id}/reasoning, puis resservi jusqu'à expiration de l'entrée.
+
+Les appels simultanés pour une même réponse partagent une seule génération.
+Le magasin s'exécute dans la boucle d'événements de l'API : il n'utilise pas de
+verrou.
+"""
+
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ReasoningStore:
+    """Contextes des réponses récentes et raisonnements déjà générés, avec éviction LRU et TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        self.hits = 0
+        self.generated = 0
+        self.not_found = 0
+        self.evictions = 0
+
+    def register(self, question: str, context: str) -> str:
+        """Conserve le contexte d'une réponse et renvoie son identifiant."""
+        response_id = uuid.uuid4().hex
+        self._entries[response_id] = {
+            "question": question,
+            "context": context,
+            "created_at": time.time(),
+            "reasoning": None,
+            "task": None,
+        }
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return response_id
+
+    def _get(self, response_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(response_id)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            del self._entries[response_id]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(response_id)
+        return entry
+
+    def __contains__(self, response_id: Optional[str]) -> bool:
+        return response_id is not None and self._get(response_id) is not None
+
+    async def reasoning(self, response_id: str,
+                        generate: Callable[[str, str], Awaitable[str]]) -> Optional[str]:
+        """
+        Renvoie le raisonnement de la réponse, généré par generate(question, contexte)
+        au premier appel ; None si l'identifiant est inconnu ou expiré.
+        """
+        entry = self._get(response_id)
+        if entry is None:
+            self.not_found += 1
+            return None
+        if entry["reasoning"] is not None:
+            self.hits += 1
+            return entry["reasoning"]
+
+        if entry["task"] is None:
+            task = asyncio.ensure_future(generate(entry["question"], entry["context"]))
+            task.add_done_callback(lambda done, entry=entry: self._finish(entry, done))
+            entry["task"] = task
+        # shield : le départ d'un client n'interrompt pas la génération partagée
+        return await asyncio.shield(entry["task"])
+
+    def _finish(self, entry: Dict[str, Any], task: asyncio.Future) -> None:
+        """Mémorise le raisonnement généré ; après un échec, un nouvel appel relancera la génération."""
+        entry["task"] = None
+        if task.cancelled() or task.exception() is not None:
+            return
+        entry["reasoning"] = task.result()
+        # Le contexte n'est plus nécessaire une fois le raisonnement obtenu
+        entry["context"] = None
+        self.generated += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Raisonnements resservis (hits), générés ou introuvables (misses)."""
+        misses = self.generated + self.not_found
+        total = self.hits + misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": misses,
+            "generated": self.generated,
+            "not_found": self.not_found,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,81 @@
+"""
+Regroupement des requêtes identiques en cours (« single flight »).
+
+Quand plusieurs appels de même clé arrivent pendant qu'un premier est en cours
+(boutons d'exemple cliqués en même temps, nouvel essai de l'interface après un
+délai dépassé), seul le premier exécute le calcul ; les suivants attendent son
+résultat au lieu de relancer recherche et génération.
+
+Le calcul s'exécute dans la requête du premier appel (ses durées par étape et
+ses logs restent rattachés à cette requête). Si ce premier appel est annulé
+(client déconnecté), l'un des appels en attente reprend le calcul.
+"""
+
+import copy
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _LeaderCancelled(Exception):
+    """Le calcul partagé a été abandonné avec la requête qui le portait."""
+
+
+class SingleFlight:
+    """Partage un calcul asynchrone entre les appels concurrents de même clé."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Renvoie le résultat de factory() pour cette clé et s'il a été partagé.
+
+        Les appels en attente reçoivent une copie du résultat (ou l'exception)
+        du calcul en cours.
+        """
+        while True:
+            future = self._in_flight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                # shield : l'annulation d'un appel en attente ne doit pas annuler le calcul partagé
+                return copy.deepcopy(await asyncio.shield(future)), True
+            except _LeaderCancelled:
+                self.coalesced -= 1
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.leaders += 1
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._in_flight[key]
+            # Marque l'exception comme lue si personne n'attendait le calcul
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs des calculs exécutés et des appels regroupés."""
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / total if total else 0.0,
+        }
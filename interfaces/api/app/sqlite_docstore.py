@@ -0,0 +1,146 @@
+"""
+Docstore SQLite lu à la demande.
+
+Remplace le docstore LangChain picklé (index.pkl) par un fichier docstore.sqlite
+contenant une ligne par document : position dans l'index FAISS, identifiant,
+contenu et métadonnées (JSON). Seuls les documents retournés par une recherche
+sont lus ; le démarrage ne charge que la table de correspondance position -> id.
+"""
+
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+import os
+import json
+import pickle
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Any, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+SQLITE_DOCSTORE_FILE = "docstore.sqlite"
+
+SCHEMA = """
+CREATE TABLE documents (
+    position INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL UNIQUE,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE info (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class SQLiteDocstore(Docstore):
+    """Docstore en lecture seule adossé à un fichier SQLite."""
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Docstore SQLite introuvable: {path}")
+        self.path = path
+        # Une connexion par thread : les recherches FAISS tournent dans un pool de threads
+        self._local = threading.local()
+        # Toutes les connexions ouvertes, pour les fermer à l'arrêt depuis n'importe quel thread
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Chaque connexion reste propre à son thread ; seule close() la manipule depuis un autre
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self) -> None:
+        """Ferme les connexions de tous les threads (aucune recherche ne doit être en cours)."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    @staticmethod
+    def _to_document(doc_id: str, page_content: str, metadata: str) -> Document:
+        return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._connection().execute(
+            "SELECT doc_id, page_content, metadata FROM documents WHERE doc_id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return self._to_document(*row)
+
+    def index_to_docstore_id(self) -> Dict[int, str]:
+        """Table de correspondance position FAISS -> identifiant de document."""
+        rows = self._connection().execute("SELECT position, doc_id FROM documents")
+        return {position: doc_id for position, doc_id in rows}
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, Document]]:
+        """Documents dans l'ordre de l'index FAISS, par page."""
+        rows = self._connection().execute(
+            "SELECT position, doc_id, page_content, metadata FROM documents "
+            "WHERE position >= ? ORDER BY position LIMIT ?", (offset, limit)
+        )
+        return [(position, self._to_document(*row)) for position, *row in rows]
+
+    def info(self) -> Dict[str, Any]:
+        """Informations calculées à la conversion (nombre de documents, clés de métadonnées)."""
+        rows = self._connection().execute("SELECT key, value FROM info")
+        return {key: json.loads(value) for key, value in rows}
+
+
+def write_sqlite_docstore(path: str, documents: List[Tuple[str, Document]]) -> None:
+    """Écrit un docstore SQLite à partir des couples (id, document) dans l'ordre de l'index."""
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    metadata_keys = set()
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(SCHEMA)
+        rows = []
+        for position, (doc_id, doc) in enumerate(documents):
+            metadata_keys.update(doc.metadata.keys())
+            rows.append((position, str(doc_id), doc.page_content,
+                         json.dumps(doc.metadata, ensure_ascii=False, default=str)))
+        connection.executemany("INSERT INTO documents VALUES (?, ?, ?, ?)", rows)
+        connection.executemany("INSERT INTO info VALUES (?, ?)", [
+            ("document_count", json.dumps(len(rows))),
+            ("metadata_keys", json.dumps(sorted(metadata_keys), ensure_ascii=False)),
+        ])
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+def convert_pickle_docstore(store_dir: str) -> str:
+    """
+    Convertit le index.pkl d'un vector store en docstore.sqlite.
+
+    Le pickle n'est désérialisé qu'ici, hors ligne, sur un fichier de confiance.
+    """
+    with open(os.path.join(store_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    documents = []
+    for position in range(len(index_to_docstore_id)):
+        doc_id = index_to_docstore_id[position]
+        doc = docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            raise ValueError(f"Document {doc_id} (position {position}) absent du docstore")
+        documents.append((doc_id, doc))
+
+    output = os.path.join(store_dir, SQLITE_DOCSTORE_FILE)
+    write_sqlite_docstore(output, documents)
+    logger.info(f"{len(documents)} documents convertis dans {output}")
+    return output
@@ -0,0 +1,90 @@
+"""
+Durées des étapes de traitement d'une requête.
+
+Chaque requête ouvre un dictionnaire de durées (start_request_timings) porté par
+une variable de contexte ; les étapes instrumentées (embedding, recherche par
+store, formatage, appels au LLM) y ajoutent leur durée avec record_stage ou le
+gestionnaire de contexte stage. Les tâches asyncio et les fonctions lancées avec
+run_in_context héritent du dictionnaire de la requête qui les a créées.
+
+La requête garde aussi la trace ordonnée de ses étapes (current_trace) : début
+relatif au lancement de la requête et durée de chaque mesure.
+
+Les observateurs enregistrés avec add_stage_observer (métriques Prometheus)
+reçoivent toutes les durées, y compris hors requête (préchauffage).
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+_current_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+# (instant de début de la requête, étapes dans l'ordre de fin)
+_current_trace: contextvars.ContextVar[Optional[Tuple[float, List[Dict[str, Any]]]]] = contextvars.ContextVar(
+    "request_trace", default=None
+)
+
+_observers: List[Callable[[str, float], None]] = []
+
+
+def add_stage_observer(observer: Callable[[str, float], None]) -> None:
+    """Enregistre une fonction appelée avec (étape, durée) à chaque mesure."""
+    _observers.append(observer)
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Ouvre le dictionnaire des durées de la requête courante."""
+    timings: Dict[str, float] = {}
+    _current_timings.set(timings)
+    _current_trace.set((time.perf_counter(), []))
+    return timings
+
+
+def current_timings() -> Dict[str, float]:
+    """Durées cumulées par étape de la requête courante."""
+    return dict(_current_timings.get() or {})
+
+
+def current_trace() -> List[Dict[str, Any]]:
+    """Étapes de la requête courante : nom, début relatif (s) et durée (s)."""
+    trace = _current_trace.get()
+    return list(trace[1]) if trace is not None else []
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Ajoute la durée d'une étape (cumulée si l'étape se répète dans la requête)."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+    trace = _current_trace.get()
+    if trace is not None:
+        origin, steps = trace
+        end = time.perf_counter() - origin
+        steps.append({"stage": name, "start": round(end - seconds, 6), "duration": round(seconds, 6)})
+    for observer in _observers:
+        observer(name, seconds)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mesure la durée du bloc et l'enregistre sous le nom de l'étape."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def run_in_context(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Enveloppe une fonction exécutée dans un pool de threads pour qu'elle voie la requête courante."""
+    context = contextvars.copy_context()
+    return lambda *args: context.run(function, *args)
+
+
+async def timed(name: str, awaitable: Awaitable[Any]) -> Any:
+    """Attend un résultat asynchrone en enregistrant la durée de l'attente."""
+    with stage(name):
+        return await awaitable
@@ -0,0 +1,114 @@
+"""
+Versions des vector stores et différences entre deux constructions.
+
+Chaque construction écrit dans le répertoire du store un manifest.json (numéro de
+version, modèle, nombre de documents, résumé des changements) et un changes.json
+listant les documents ajoutés, modifiés et supprimés depuis la version précédente.
+
+Un document est identifié par son URL BOFiP/CGI et sa section (avec un numéro
+d'occurrence si la même section apparaît plusieurs fois) ; il est « modifié »
+quand son contenu change sous la même identité.
+"""
+
+from langchain_core.documents import Document
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.sqlite_docstore import SQLiteDocstore, SQLITE_DOCSTORE_FILE
+
+MANIFEST_FILE = "manifest.json"
+CHANGES_FILE = "changes.json"
+
+# Taille des pages lues dans le docstore de la version précédente
+READ_PAGE_SIZE = 1000
+
+
+def content_hash(doc: Document) -> str:
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def document_keys(documents: List[Document]) -> List[str]:
+    """Identité stable de chaque document d'un export, dans l'ordre."""
+    keys = []
+    occurrences: Dict[str, int] = {}
+    for doc in documents:
+        base = f"{doc.metadata.get('url', '')}#{doc.metadata.get('section', '')}"
+        if base == "#":
+            base = f"sha256:{content_hash(doc)}"
+        occurrences[base] = occurrences.get(base, 0) + 1
+        keys.append(f"{base}#{occurrences[base]}")
+    return keys
+
+
+def read_store_documents(store_dir: str) -> Optional[List[Tuple[str, Document]]]:
+    """Documents (id, document) d'un store existant, ou None s'il n'a pas de docstore SQLite."""
+    path = os.path.join(store_dir, SQLITE_DOCSTORE_FILE)
+    if not os.path.exists(path):
+        return None
+    docstore = SQLiteDocstore(path)
+    documents = []
+    while True:
+        page = docstore.page(len(documents), READ_PAGE_SIZE)
+        if not page:
+            return documents
+        documents.extend((doc.id, doc) for _, doc in page)
+
+
+def diff_documents(previous: Optional[List[Tuple[str, Document]]],
+                   documents: List[Document]) -> Tuple[List[str], Dict[str, List[str]]]:
+    """
+    Compare un export à la version précédente du store.
+
+    Retourne les identifiants à utiliser pour les documents (ceux de la version
+    précédente sont conservés pour les documents existants) et les clés des
+    documents ajoutés, modifiés et supprimés.
+    """
+    keys = document_keys(documents)
+    before: Dict[str, Tuple[str, str]] = {}
+    if previous:
+        previous_keys = document_keys([doc for _, doc in previous])
+        before = {key: (doc_id, content_hash(doc)) for key, (doc_id, doc) in zip(previous_keys, previous)}
+
+    ids, changes = [], {"added": [], "changed": [], "removed": []}
+    for key, doc in zip(keys, documents):
+        if key not in before:
+            changes["added"].append(key)
+            ids.append(None)
+            continue
+        doc_id, previous_hash = before[key]
+        if previous_hash != content_hash(doc):
+            changes["changed"].append(key)
+        ids.append(doc_id)
+    current = set(keys)
+    changes["removed"] = [key for key in before if key not in current]
+    return ids, changes
+
+
+def read_manifest(store_dir: str) -> Dict[str, Any]:
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(store_dir: str, changes: Dict[str, List[str]], **info) -> Dict[str, Any]:
+    """Écrit la nouvelle version du store et le détail des changements."""
+    previous = read_manifest(store_dir)
+    manifest = {
+        "version": previous.get("version", 0) + 1,
+        "previous_version": previous.get("version"),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        **info,
+        "changes": {kind: len(keys) for kind, keys in changes.items()},
+    }
+    with open(os.path.join(store_dir, CHANGES_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": manifest["version"], **changes}, f, ensure_ascii=False, indent=2)
+    tmp_path = os.path.join(store_dir, f"{MANIFEST_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(store_dir, MANIFEST_FILE))
+    return manifest
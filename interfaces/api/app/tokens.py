@@ -0,0 +1,53 @@
+"""
+Comptage des tokens d'un texte.
+
+Le décompte utilise l'encodage tiktoken TOKEN_ENCODING (cl100k_base par défaut),
+proche de celui des modèles Gemini pour le français. tiktoken télécharge ses
+encodages au premier usage : sans accès réseau ni cache local, le nombre de
+tokens est estimé à partir du nombre de caractères. L'encodage est chargé par
+load_encoding() au démarrage du chatbot, hors de la boucle d'événements.
+"""
+
+import os
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
+
+# Estimation utilisée quand l'encodage est indisponible
+CHARACTERS_PER_TOKEN = 4.0
+
+_encoding = None
+_encoding_loaded = False
+_lock = threading.Lock()
+
+
+def load_encoding() -> Optional[object]:
+    """
+    Charge l'encodage (téléchargement au premier usage) ; opération bloquante,
+    à appeler au chargement de l'application plutôt que pendant une requête.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                    logger.info(f"Encodage tiktoken '{TOKEN_ENCODING}' chargé")
+                except Exception as e:
+                    logger.warning(f"Encodage tiktoken '{TOKEN_ENCODING}' indisponible ({str(e)}), "
+                                   f"estimation à {CHARACTERS_PER_TOKEN} caractères par token")
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Nombre de tokens du texte (estimé si l'encodage est indisponible)."""
+    encoding = load_encoding()
+    if encoding is None:
+        return int(len(text) / CHARACTERS_PER_TOKEN + 0.5)
+    return len(encoding.encode(text, disallowed_special=()))
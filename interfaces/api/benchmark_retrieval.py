@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""
+Benchmark de la recherche : rappel (recall@k) et latence selon la configuration d'index.
+
+Pour chaque vector store, l'index est reconstruit avec chaque configuration
+demandée puis comparé à une recherche exacte (vérité terrain) sur un jeu de
+questions composé :
+- des exemples de la barre latérale de l'interface web ;
+- d'un fichier de questions annotées (JSONL {"question": ..., "store": ...}
+  ou texte brut, une question par ligne) ;
+- de questions synthétiques tirées des titres et sections des documents.
+
+Mesures par store et par configuration : recall@k, MRR (rang du plus proche
+voisin exact dans les résultats), latence p50/p99 d'une recherche, taille de
+l'index et durée de construction.
+
+Par défaut les documents et les questions sont vectorisés localement
+(app.local_embeddings.HashingEmbeddings) : le benchmark tourne hors ligne, sans
+identifiants Vertex AI. Avec --embedding provider, les vecteurs des stores sont
+réutilisés et seules les questions sont vectorisées par le fournisseur configuré
+(EMBEDDING_PROVIDER, voir app.providers).
+
+Exemples :
+    python benchmark_retrieval.py --output benchmark.json
+    python benchmark_retrieval.py --configs flat hnsw:hnsw_m=16,ef_search=32 ivf_flat:nlist=64,nprobe=4
+    python benchmark_retrieval.py --baseline benchmark.json --max-recall-drop 0.02
+"""
+
+import os
+import ast
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.faiss_loader import has_store_files, load_faiss_store
+from app.index_builder import build_faiss_index, read_store_vectors, index_parameters
+from app.local_embeddings import HashingEmbeddings
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASE_DIR = os.path.join(API_DIR, "app", "vector_stores")
+DEFAULT_SIDEBAR = os.path.join(API_DIR, "..", "web_ui", "components", "sidebar.py")
+DEFAULT_QUERIES = os.path.join(API_DIR, "benchmark_queries.jsonl")
+
+DEFAULT_CONFIGS = [
+    "flat",
+    "hnsw:hnsw_m=32,ef_search=16",
+    "hnsw:hnsw_m=32,ef_search=64",
+    "ivf_flat:nprobe=1",
+    "ivf_flat:nprobe=8",
+    "ivf_pq:pq_m=16,nprobe=8",
+]
+
+# Paramètres passés à build_faiss_index / appliqués à l'index avant les recherches
+BUILD_KEYS = ("hnsw_m", "ef_construction", "nlist", "pq_m", "pq_nbits", "train_size")
+SEARCH_KEYS = ("ef_search", "nprobe")
+
+# Métadonnées utilisées pour générer les questions synthétiques
+TITLE_KEYS = ("title_head", "title_xml", "title")
+GENERIC_SECTIONS = {"Préambule", "Résumé du tableau", "Inconnu"}
+
+
+def parse_config(spec):
+    """Lit une configuration 'type:cle=valeur,cle=valeur'."""
+    index_type, _, params = spec.partition(":")
+    config = {"name": spec, "index_type": index_type, "build": {}, "search": {}}
+    for item in filter(None, params.split(",")):
+        key, _, value = item.partition("=")
+        if key in BUILD_KEYS:
+            config["build"][key] = int(value)
+        elif key in SEARCH_KEYS:
+            config["search"][key] = int(value)
+        else:
+            raise ValueError(f"Paramètre inconnu '{key}' dans la configuration '{spec}'")
+    return config
+
+
+def load_sidebar_questions(path):
+    """Questions d'exemple de la barre latérale, lues sans importer Streamlit."""
+    if not os.path.exists(path):
+        print(f"⚠️ Exemples de la barre latérale introuvables: {path}")
+        return []
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "EXAMPLE_QUESTIONS" for t in node.targets):
+            return [example["description"] for example in ast.literal_eval(node.value)]
+    return []
+
+
+def load_labelled_questions(path):
+    """Questions annotées : JSONL {"question", "store" optionnel} ou une question par ligne."""
+    if not path or not os.path.exists(path):
+        return []
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                questions.append({"question": record["question"], "store": record.get("store")})
+            else:
+                questions.append({"question": line, "store": None})
+    return questions
+
+
+def synthetic_questions(documents, count, seed):
+    """Questions tirées au hasard parmi les titres et sections des documents."""
+    candidates = set()
+    for _, doc in documents:
+        title = next((doc.metadata[key] for key in TITLE_KEYS if doc.metadata.get(key)), None)
+        section = doc.metadata.get("section")
+        if section and section not in GENERIC_SECTIONS:
+            candidates.add(f"{title} : {section}" if title else section)
+        elif title:
+            candidates.add(title)
+    candidates = sorted(candidates)
+    return random.Random(seed).sample(candidates, min(count, len(candidates)))
+
+
+def build_query_set(store_name, documents, sidebar, labelled, synthetic_count, seed):
+    """Liste de couples (origine, question) pour un store."""
+    queries = [("sidebar", q) for q in sidebar]
+    queries += [("labelled", q["question"]) for q in labelled if q["store"] in (None, store_name)]
+    queries += [("synthetic", q) for q in synthetic_questions(documents, synthetic_count, seed)]
+    return queries
+
+
+def apply_search_params(index, search):
+    """Applique efSearch / nprobe comme le fait faiss_loader.configure_search."""
+    if "ef_search" in search and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = search["ef_search"]
+    ivf = faiss.try_extract_index_ivf(index)
+    if "nprobe" in search and ivf is not None:
+        ivf.nprobe = min(search["nprobe"], ivf.nlist)
+
+
+def evaluate(index, query_vectors, ground_truth, ground_truth_distances, k):
+    """Recall@k, rang réciproque et latence de chaque question, recherchée une à une."""
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for vector, exact, distances in zip(query_vectors, ground_truth, ground_truth_distances):
+        start = time.perf_counter()
+        _, ids = index.search(vector[None, :], k)
+        latencies.append(time.perf_counter() - start)
+
+        found = [i for i in ids[0] if i >= 0]
+        recalls.append(len(set(found) & set(exact)) / len(exact))
+        # Les documents en double sont tous des plus proches voisins exacts
+        nearest = {i for i, d in zip(exact, distances) if d <= distances[0] + 1e-6}
+        rank = next((rank for rank, i in enumerate(found, 1) if i in nearest), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return np.array(recalls), np.array(reciprocal_ranks), np.array(latencies)
+
+
+def benchmark_store(name, path, configs, embeddings, args, sidebar, labelled):
+    """Exécute toutes les configurations sur un store."""
+    store = load_faiss_store(path, embeddings=None, mode="memory")
+    stored_vectors, documents = read_store_vectors(store)
+    if args.max_docs and len(documents) > args.max_docs:
+        stored_vectors, documents = stored_vectors[:args.max_docs], documents[:args.max_docs]
+
+    queries = build_query_set(name, documents, sidebar, labelled, args.synthetic, args.seed)
+    sources = np.array([source for source, _ in queries])
+    print(f"\n📚 {name}: {len(documents)} documents, {len(queries)} questions "
+          f"({', '.join(f'{s}={int((sources == s).sum())}' for s in ('sidebar', 'labelled', 'synthetic'))})")
+
+    if args.embedding == "local":
+        start = time.perf_counter()
+        vectors = np.array(embeddings.embed_documents([doc.page_content for _, doc in documents]), dtype=np.float32)
+        print(f"   Documents vectorisés localement en {time.perf_counter() - start:.2f}s")
+    else:
+        vectors = np.ascontiguousarray(stored_vectors, dtype=np.float32)
+    query_vectors = np.array(embeddings.embed_documents([q for _, q in queries]), dtype=np.float32)
+
+    k = min(args.k, len(documents))
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    ground_truth_distances, ground_truth = exact.search(query_vectors, k)
+
+    results = []
+    for config in configs:
+        result = {"store": name, "config": config["name"], "index_type": config["index_type"],
+                  "documents": len(documents), "queries": len(queries), "k": k}
+        try:
+            start = time.perf_counter()
+            index = build_faiss_index(vectors, config["index_type"], **config["build"])
+            result["build_time_s"] = time.perf_counter() - start
+        except (ValueError, RuntimeError) as e:
+            result["error"] = str(e)
+            print(f"   ⚠️ {config['name']}: ignorée ({e})")
+            results.append(result)
+            continue
+
+        apply_search_params(index, config["search"])
+        recalls, reciprocal_ranks, latencies = evaluate(index, query_vectors, ground_truth,
+                                                         ground_truth_distances, k)
+        result.update({
+            "search_params": index_parameters(index),
+            "recall_at_k": float(recalls.mean()),
+            "mrr": float(reciprocal_ranks.mean()),
+            "recall_by_source": {s: float(recalls[sources == s].mean()) for s in sorted(set(sources))},
+            "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "index_size_mb": faiss.serialize_index(index).nbytes / (1024 * 1024),
+        })
+        results.append(result)
+    return results
+
+
+def find_regressions(results, baseline, max_recall_drop, max_latency_ratio):
+    """Compare les résultats à un rapport précédent, configuration par configuration."""
+    previous = {(r["store"], r["config"]): r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for r in results:
+        before = previous.get((r["store"], r["config"]))
+        if before is None or "error" in r:
+            continue
+        if before["recall_at_k"] - r["recall_at_k"] > max_recall_drop:
+            regressions.append(f"{r['store']} / {r['config']}: recall@{r['k']} "
+                               f"{before['recall_at_k']:.3f} -> {r['recall_at_k']:.3f}")
+        if max_latency_ratio and r["latency_p99_ms"] > before["latency_p99_ms"] * max_latency_ratio:
+            regressions.append(f"{r['store']} / {r['config']}: p99 "
+                               f"{before['latency_p99_ms']:.3f} ms -> {r['latency_p99_ms']:.3f} ms")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'store':<14} {'configuration':<30} {'recall@k':>9} {'MRR':>6} {'p50 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'taille (Mo)':>12} {'construction (s)':>17}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['store']:<14} {r['config']:<30} {'ignorée':>9}")
+            continue
+        print(f"{r['store']:<14} {r['config']:<30} {r['recall_at_k']:>9.3f} {r['mrr']:>6.3f} "
+              f"{r['latency_p50_ms']:>9.3f} {r['latency_p99_ms']:>9.3f} {r['index_size_mb']:>12.2f} "
+              f"{r['build_time_s']:>17.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rappel / latence des index FAISS")
+    parser.add_argument("--base-dir", default=DEFAULT_BASE_DIR, help="Répertoire contenant les vector stores")
+    parser.add_argument("--stores", nargs="*", default=None, help="Stores à évaluer (défaut: tous)")
+    parser.add_argument("--configs", nargs="*", default=DEFAULT_CONFIGS,
+                        help="Configurations 'type:cle=valeur,...' (clés: "
+                             f"{', '.join(BUILD_KEYS + SEARCH_KEYS)})")
+    parser.add_argument("--k", type=int, default=10, help="Nombre de résultats par recherche")
+    parser.add_argument("--embedding", choices=("local", "provider"), default="local",
+                        help="local: HashingEmbeddings hors ligne ; provider: fournisseur configuré de l'API")
+    parser.add_argument("--dimension", type=int, default=768, help="Dimension des embeddings locaux")
+    parser.add_argument("--sidebar-file", default=DEFAULT_SIDEBAR, help="Fichier des exemples de l'interface web")
+    parser.add_argument("--queries-file", default=DEFAULT_QUERIES, help="Fichier de questions annotées")
+    parser.add_argument("--synthetic", type=int, default=100, help="Questions synthétiques par store")
+    parser.add_argument("--max-docs", type=int, default=None, help="Limite de documents par store")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du tirage des questions synthétiques")
+    parser.add_argument("--output", default=None, help="Fichier JSON de sortie (optionnel)")
+    parser.add_argument("--baseline", default=None, help="Rapport JSON de référence")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02,
+                        help="Baisse de recall@k tolérée par rapport à la référence")
+    parser.add_argument("--max-latency-ratio", type=float, default=None,
+                        help="Ratio de p99 toléré par rapport à la référence (désactivé par défaut)")
+    args = parser.parse_args()
+
+    configs = [parse_config(spec) for spec in args.configs]
+    if args.embedding == "local":
+        embeddings = HashingEmbeddings(dimension=args.dimension)
+    else:
+        from app.providers import create_embeddings
+        embeddings = create_embeddings()
+
+    sidebar = load_sidebar_questions(args.sidebar_file)
+    labelled = load_labelled_questions(args.queries_file)
+
+    names = args.stores or sorted(
+        name for name in os.listdir(args.base_dir)
+        if os.path.isdir(os.path.join(args.base_dir, name)) and has_store_files(os.path.join(args.base_dir, name))
+    )
+    if not names:
+        print(f"❌ Aucun vector store dans {args.base_dir}")
+        sys.exit(1)
+
+    results = []
+    for name in names:
+        results.extend(benchmark_store(name, os.path.join(args.base_dir, name), configs,
+                                       embeddings, args, sidebar, labelled))
+    print_results(results)
+
+    if args.output:
+        report = {"settings": {"k": args.k, "embedding": args.embedding, "synthetic": args.synthetic,
+                               "seed": args.seed, "max_docs": args.max_docs},
+                  "results": results}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Résultats enregistrés dans '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.max_recall_drop, args.max_latency_ratio)
+        if regressions:
+            print("\n❌ Régressions par rapport à la référence:")
+            for regression in regressions:
+                print(f"   - {regression}")
+            sys.exit(1)
+        print("\n✅ Aucune régression par rapport à la référence")
+
+
+if __name__ == "__main__":
+    main()
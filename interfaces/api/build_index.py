@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Script de construction d'un vector store avec un type d'index FAISS configurable.
+
+Sources possibles :
+- un fichier JSONL produit par data_transformation/scripts/bofip_raw_to_jsonl*.py
+  (les documents sont alors vectorisés avec le modèle d'embedding configuré) ;
+- un vector store existant, dont les vecteurs sont réutilisés tels quels.
+
+Exemples :
+    python build_index.py --from-store app/vector_stores/bofip --output /tmp/bofip_hnsw --index-type hnsw
+    python build_index.py --from-jsonl bofip_documents.jsonl --output app/vector_stores/bofip --index-type ivf_flat
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+import numpy as np
+
+from app.index_builder import (
+    INDEX_TYPES, build_faiss_index, read_jsonl_documents, read_store_vectors,
+    new_document_ids, save_store, index_parameters
+)
+from app.faiss_loader import load_faiss_store
+from app.embedding_pipeline import embed_corpus
+from app.providers import create_embeddings, embedding_model_name
+
+# Configuration du logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("index_builder")
+
+
+def embed_jsonl(path, batch_size, concurrency):
+    """Vectorise les documents d'un JSONL par lots avec le modèle d'embedding de l'API"""
+    embeddings = create_embeddings()
+    documents = list(read_jsonl_documents(path))
+    logger.info(f"{len(documents)} documents lus dans {path}")
+
+    work_dir = os.path.join(".embedding_work", os.path.splitext(os.path.basename(path))[0])
+    vectors = embed_corpus(documents, embeddings, work_dir,
+                           model_name=embedding_model_name(embeddings),
+                           batch_size=batch_size, concurrency=concurrency)
+    return np.array(vectors, dtype=np.float32), new_document_ids(documents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construction d'un vector store FAISS")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-jsonl", help="Fichier JSONL de documents à vectoriser")
+    source.add_argument("--from-store", help="Répertoire d'un vector store existant")
+    parser.add_argument("--output", required=True, help="Répertoire du vector store à produire")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="Type d'index FAISS")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW: nombre de voisins par nœud")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW: efConstruction")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF: nombre de listes (défaut: ~4·√n)")
+    parser.add_argument("--pq-m", type=int, default=48, help="IVF-PQ: nombre de sous-quantificateurs")
+    parser.add_argument("--pq-nbits", type=int, default=8, help="IVF-PQ: bits par sous-quantificateur")
+    parser.add_argument("--train-size", type=int, default=None, help="IVF: taille de l'échantillon d'entraînement")
+    parser.add_argument("--batch-size", type=int, default=100, help="JSONL: taille des lots d'embedding")
+    parser.add_argument("--concurrency", type=int, default=4, help="JSONL: requêtes d'embedding simultanées")
+    args = parser.parse_args()
+
+    if args.from_store:
+        store = load_faiss_store(args.from_store, embeddings=None, mode="memory")
+        vectors, documents = read_store_vectors(store)
+        logger.info(f"{len(documents)} vecteurs repris de {args.from_store}")
+    else:
+        vectors, documents = embed_jsonl(args.from_jsonl, args.batch_size, args.concurrency)
+
+    start = time.perf_counter()
+    index = build_faiss_index(
+        vectors, args.index_type,
+        hnsw_m=args.hnsw_m, ef_construction=args.ef_construction,
+        nlist=args.nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits,
+        train_size=args.train_size
+    )
+    build_time = time.perf_counter() - start
+    save_store(args.output, index, documents)
+
+    print(f"✅ Index {type(index).__name__} ({index.ntotal} vecteurs) construit en {build_time:.2f}s -> {args.output}")
+    print(f"   Paramètres de recherche par défaut: {index_parameters(index)}")
+    print("   Réglage à la recherche: FAISS_EF_SEARCH / FAISS_NPROBE (globalement ou suffixés par le nom du store)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Script de comparaison des modes de chargement des index FAISS (memory / mmap).
+Chaque mode est mesuré dans un processus séparé : durée de chargement, mémoire
+résidente (RSS) après chargement puis après une série de recherches.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_rss():
+    """Mémoire résidente du processus en Mo (anonyme et projetée depuis des fichiers)"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS", "RssAnon", "RssFile")):
+                key, value = line.split(":")
+                values[key] = int(value.split()[0]) / 1024
+    return values
+
+
+def measure(base_dir, mode, queries):
+    """Charge tous les index du répertoire dans le mode donné et mesure le coût"""
+    from app.faiss_loader import read_faiss_index, supports_mmap
+
+    rss_before = read_rss()
+    start = time.perf_counter()
+    indexes = {}
+    for name in sorted(os.listdir(base_dir)):
+        index_file = os.path.join(base_dir, name, "index.faiss")
+        if os.path.exists(index_file):
+            indexes[name] = read_faiss_index(index_file, mode)
+    load_time = time.perf_counter() - start
+    rss_loaded = read_rss()
+
+    rng = np.random.default_rng(0)
+    search_times = []
+    for index in indexes.values():
+        vectors = rng.standard_normal((queries, index.d)).astype("float32")
+        for vector in vectors:
+            t = time.perf_counter()
+            index.search(vector[None, :], 3)
+            search_times.append(time.perf_counter() - t)
+    rss_searched = read_rss()
+
+    return {
+        "mode": mode,
+        "stores": {name: {"type": type(index).__name__, "vectors": index.ntotal,
+                          "mmap": mode == "mmap" and supports_mmap(index)}
+                   for name, index in indexes.items()},
+        "load_time_s": load_time,
+        "rss_load_mb": rss_loaded["VmRSS"] - rss_before["VmRSS"],
+        "rss_search_mb": rss_searched["VmRSS"] - rss_before["VmRSS"],
+        "rss_file_mb": rss_searched.get("RssFile", 0.0),
+        "search_p50_ms": float(np.percentile(search_times, 50) * 1000) if search_times else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparaison des modes de chargement FAISS")
+    parser.add_argument("--base-dir", default=os.path.join(os.path.dirname(__file__), "app", "vector_stores"),
+                        help="Répertoire contenant les vector stores")
+    parser.add_argument("--queries", type=int, default=100, help="Nombre de recherches par index")
+    parser.add_argument("--output", default=None, help="Fichier JSON de sortie (optionnel)")
+    parser.add_argument("--child-mode", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_mode:
+        print(json.dumps(measure(args.base_dir, args.child_mode, args.queries)))
+        return
+
+    results = []
+    for mode in ("memory", "mmap"):
+        # Un processus neuf par mode pour que les mesures de RSS soient indépendantes
+        output = subprocess.run(
+            [sys.executable, __file__, "--base-dir", args.base_dir,
+             "--queries", str(args.queries), "--child-mode", mode],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"\n{'mode':<8} {'chargement (s)':>15} {'RSS chargé (Mo)':>16} {'RSS après recherches (Mo)':>26} {'p50 recherche (ms)':>19}")
+    for r in results:
+        p50 = f"{r['search_p50_ms']:.3f}" if r["search_p50_ms"] is not None else "-"
+        print(f"{r['mode']:<8} {r['load_time_s']:>15.3f} {r['rss_load_mb']:>16.1f} {r['rss_search_mb']:>26.1f} {p50:>19}")
+    for name, store in results[-1]["stores"].items():
+        print(f"  {name}: {store['type']} ({store['vectors']} vecteurs) - mmap {'actif' if store['mmap'] else 'non supporté'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Résultats enregistrés dans '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Script de conversion des docstores picklés (index.pkl) en docstores SQLite (docstore.sqlite).
+Une fois converti, un vector store est chargé sans désérialiser le pickle ni tout le corpus.
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+from app.sqlite_docstore import SQLiteDocstore, convert_pickle_docstore
+
+# Configuration du logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("docstore_converter")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversion des docstores FAISS en SQLite")
+    parser.add_argument("--base-dir", default=os.path.join(os.path.dirname(__file__), "app", "vector_stores"),
+                        help="Répertoire de base contenant les vector stores")
+    parser.add_argument("--index", default=None,
+                        help="Nom spécifique du vector store à convertir (par défaut: tous)")
+    parser.add_argument("--remove-pickle", action="store_true",
+                        help="Supprime index.pkl après une conversion vérifiée")
+    args = parser.parse_args()
+
+    if args.index:
+        indexes = [args.index]
+    else:
+        indexes = [d for d in sorted(os.listdir(args.base_dir))
+                   if os.path.exists(os.path.join(args.base_dir, d, "index.pkl"))]
+
+    for index_name in indexes:
+        store_dir = os.path.join(args.base_dir, index_name)
+        logger.info(f"Conversion du docstore de {index_name}")
+        output = convert_pickle_docstore(store_dir)
+
+        # Vérification : tous les documents sont relisibles
+        docstore = SQLiteDocstore(output)
+        mapping = docstore.index_to_docstore_id()
+        missing = [doc_id for doc_id in mapping.values() if isinstance(docstore.search(doc_id), str)]
+        if missing:
+            logger.error(f"{len(missing)} documents illisibles dans {output}, index.pkl conservé")
+            continue
+
+        print(f"✅ {index_name}: {len(mapping)} documents -> {output}")
+        if args.remove_pickle:
+            os.remove(os.path.join(store_dir, "index.pkl"))
+            logger.info(f"index.pkl supprimé pour {index_name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Script de construction des vector stores à partir des exports JSONL.
+
+Chaque fichier JSONL (bofip_documents.jsonl, bofip_bareme.jsonl, cgi_documents.jsonl...)
+est vectorisé par lots, avec plusieurs requêtes en parallèle, puis écrit dans le
+répertoire attendu par load_vector_stores (index.faiss + docstore.sqlite).
+
+Les vecteurs sont enregistrés au fur et à mesure dans un répertoire de travail :
+relancer la même commande après une interruption reprend la vectorisation là
+où elle s'était arrêtée.
+
+Les embeddings sont aussi conservés dans un cache adressé par le contenu : lors
+d'une reconstruction, seuls les documents nouveaux ou modifiés sont vectorisés.
+Les vecteurs inutilisés depuis --embedding-cache-max-age-days jours en sont
+supprimés à la fin de chaque construction ; ceux des autres modèles sont gardés
+(le cache est partagé entre fournisseurs), sauf avec --purge-other-models.
+Chaque construction incrémente la version du store (manifest.json) et liste les
+documents ajoutés, modifiés et supprimés (changes.json).
+
+Exemples :
+    python embed_corpus.py bofip_documents.jsonl bofip_bareme.jsonl cgi_documents.jsonl
+    python embed_corpus.py bofip=exports/bofip_2025-05-01.jsonl --batch-size 200 --concurrency 8
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+
+import numpy as np
+
+from app.embedding_pipeline import embed_corpus
+from app.providers import create_embeddings, embedding_model_name
+from app.content_embedding_cache import ContentEmbeddingCache
+from app.store_manifest import diff_documents, read_store_documents, write_manifest, CHANGES_FILE
+from app.index_builder import INDEX_TYPES, build_faiss_index, read_jsonl_documents, new_document_ids, save_store
+
+# Configuration du logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("embed_corpus")
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "vector_stores")
+
+
+def store_name(source):
+    """Nom du store : préfixe 'nom=' explicite, sinon nom du fichier sans '_documents.jsonl'."""
+    if "=" in source:
+        name, path = source.split("=", 1)
+        return name, path
+    name = os.path.splitext(os.path.basename(source))[0]
+    if name.endswith("_documents"):
+        name = name[:-len("_documents")]
+    return name, source
+
+
+def embed_with_cache(name, documents, embeddings, model_name, args):
+    """Vectorise uniquement les textes absents du cache, puis assemble les vecteurs dans l'ordre."""
+    cache = ContentEmbeddingCache(args.embedding_cache, model_name) if args.embedding_cache else None
+    work_dir = os.path.join(args.work_dir, name)
+    pipeline_options = dict(model_name=model_name, batch_size=args.batch_size, concurrency=args.concurrency,
+                            requests_per_minute=args.requests_per_minute, max_retries=args.max_retries)
+    if cache is None:
+        return embed_corpus(documents, embeddings, work_dir, **pipeline_options), len(documents)
+
+    try:
+        keys = [cache.key(doc.page_content) for doc in documents]
+        known = cache.get_many(keys)
+        # Un seul embedding par texte distinct absent du cache
+        missing = {}
+        for key, doc in zip(keys, documents):
+            if key not in known and key not in missing:
+                missing[key] = doc
+        logger.info(f"{len(documents) - sum(key not in known for key in keys)} documents trouvés dans le cache, "
+                    f"{len(missing)} textes à vectoriser")
+
+        if missing:
+            vectors = embed_corpus(list(missing.values()), embeddings, work_dir, **pipeline_options)
+            new_vectors = list(zip(missing.keys(), np.array(vectors)))
+            cache.put_many(new_vectors)
+            known.update(new_vectors)
+        if args.embedding_cache_max_age_days > 0:
+            cache.prune(args.embedding_cache_max_age_days * 86400)
+        if args.purge_other_models:
+            cache.purge_other_models()
+        return np.stack([known[key] for key in keys]), len(missing)
+    finally:
+        cache.close()
+
+
+def build_store(name, path, embeddings, model_name, args):
+    """Vectorise un fichier JSONL et écrit une nouvelle version du vector store correspondant."""
+    start = time.perf_counter()
+    documents = list(read_jsonl_documents(path))
+    logger.info(f"{len(documents)} documents lus dans {path}")
+
+    vectors, embedded = embed_with_cache(name, documents, embeddings, model_name, args)
+    embed_time = time.perf_counter() - start
+
+    output = os.path.join(args.output_dir, name)
+    ids, changes = diff_documents(read_store_documents(output), documents)
+    # Les documents déjà présents gardent leur identifiant d'une version à l'autre
+    new_ids = iter(doc_id for doc_id, _ in new_document_ids(documents))
+    ids = [doc_id or next(new_ids) for doc_id in ids]
+
+    index = build_faiss_index(vectors, args.index_type)
+    save_store(output, index, list(zip(ids, documents)))
+    manifest = write_manifest(output, changes, source=os.path.abspath(path), model=model_name,
+                              index_type=args.index_type, document_count=len(documents), embedded=embedded)
+
+    if not args.keep_checkpoint:
+        shutil.rmtree(os.path.join(args.work_dir, name), ignore_errors=True)
+
+    print(f"✅ {name} v{manifest['version']}: {len(documents)} documents dont {embedded} vectorisés "
+          f"en {embed_time:.1f}s, store écrit en {time.perf_counter() - start:.1f}s -> {output}")
+    print(f"   Changements: {len(changes['added'])} ajoutés, {len(changes['changed'])} modifiés, "
+          f"{len(changes['removed'])} supprimés (détail dans {os.path.join(output, CHANGES_FILE)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorisation des exports JSONL et construction des vector stores")
+    parser.add_argument("sources", nargs="+", help="Fichiers JSONL, éventuellement préfixés par 'nom_du_store='")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Répertoire des vector stores")
+    parser.add_argument("--work-dir", default=".embedding_work", help="Répertoire des checkpoints de vectorisation")
+    parser.add_argument("--embedding-cache", default=os.path.join(".embedding_work", "embeddings.sqlite"),
+                        help="Cache des embeddings par contenu (chaîne vide pour le désactiver)")
+    parser.add_argument("--embedding-cache-max-age-days", type=float, default=30,
+                        help="Supprime du cache les vecteurs inutilisés depuis ce nombre de jours (0 pour les garder)")
+    parser.add_argument("--purge-other-models", action="store_true",
+                        help="Supprime du cache les vecteurs des autres modèles d'embedding")
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents par requête d'embedding")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requêtes d'embedding simultanées")
+    parser.add_argument("--requests-per-minute", type=float, default=None, help="Plafond de requêtes par minute")
+    parser.add_argument("--max-retries", type=int, default=8, help="Nouvelles tentatives par lot en cas d'erreur")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="Type d'index FAISS (voir build_index.py pour les réglages fins)")
+    parser.add_argument("--keep-checkpoint", action="store_true", help="Conserver les vecteurs intermédiaires")
+    args = parser.parse_args()
+
+    embeddings = create_embeddings()
+    model_name = embedding_model_name(embeddings)
+
+    for source in args.sources:
+        name, path = store_name(source)
+        try:
+            build_store(name, path, embeddings, model_name, args)
+        except KeyboardInterrupt:
+            print(f"\n⏸️ Interrompu : relancez la même commande pour reprendre la vectorisation de '{name}'")
+            sys.exit(130)
+        except Exception as e:
+            logger.error(f"Échec de la construction du store '{name}': {str(e)}")
+            print(f"❌ {name}: {str(e)} (les lots déjà vectorisés sont conservés dans {args.work_dir})")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ import logging
 from typing import Dict, List, Any
 import argparse
 
+from app.sqlite_docstore import SQLiteDocstore, SQLITE_DOCSTORE_FILE
+
 # Configuration du logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,6 +31,20 @@ def load_pickle_safely(file_path):
         logger.error(f"Erreur lors du chargement du fichier pickle {file_path}: {str(e)}")
         return None
 
+def extract_sqlite_metadata(sqlite_path):
+    """Extrait les métadonnées d'un docstore SQLite, sans désérialiser de pickle"""
+    docstore = SQLiteDocstore(sqlite_path)
+    metadata = []
+    for position, doc in docstore.page(0, docstore.info().get("document_count", 0)):
+        content = doc.page_content
+        metadata.append({
+            "doc_id": str(doc.id),
+            "doc_type": str(type(doc)),
+            "content_preview": content[:200] + '...' if len(content) > 200 else content,
+            "metadata": doc.metadata
+        })
+    return metadata
+
 def inspect_faiss_index(base_dir, index_name):
     """Inspecte un index FAISS et extrait ses métadonnées"""
     index_dir = os.path.join(base_dir, index_name)
@@ -38,27 +54,35 @@ def inspect_faiss_index(base_dir, index_name):
         return
     
     pkl_path = os.path.join(index_dir, "index.pkl")
+    sqlite_path = os.path.join(index_dir, SQLITE_DOCSTORE_FILE)
     faiss_path = os.path.join(index_dir, "index.faiss")
     
-    if not os.path.exists(pkl_path) or not os.path.exists(faiss_path):
+    if not os.path.exists(faiss_path) or not (os.path.exists(pkl_path) or os.path.exists(sqlite_path)):
         logger.error(f"Fichiers d'index manquants dans {index_dir}")
         return
     
-    logger.info(f"Chargement de l'index {index_name} depuis {pkl_path}")
-    index_data = load_pickle_safely(pkl_path)
-    
-    if not index_data:
-        logger.error(f"Impossible de charger les données de l'index {index_name}")
-        return
-    
-    # Exploration des données de l'index
-    logger.info(f"Structure de l'index {index_name}: {type(index_data)}")
-    
     # Extraction des métadonnées si disponibles
     metadata = []
     
+    if os.path.exists(sqlite_path):
+        logger.info(f"Lecture du docstore SQLite {sqlite_path}")
+        metadata = extract_sqlite_metadata(sqlite_path)
+        index_data = None
+    else:
+        logger.info(f"Chargement de l'index {index_name} depuis {pkl_path}")
+        index_data = load_pickle_safely(pkl_path)
+        
+        if not index_data:
+            logger.error(f"Impossible de charger les données de l'index {index_name}")
+            return
+        
+        # Exploration des données de l'index
+        logger.info(f"Structure de l'index {index_name}: {type(index_data)}")
+    
     try:
-        if hasattr(index_data, 'docstore') and hasattr(index_data.docstore, '_dict'):
+        if index_data is None:
+            pass
+        elif hasattr(index_data, 'docstore') and hasattr(index_data.docstore, '_dict'):
             logger.info(f"Accès au docstore, {len(index_data.docstore._dict)} documents trouvés")
             
             # Extraction des métadonnées des documents
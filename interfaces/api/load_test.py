@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Test de charge de bout en bout de /ask et /ask/stream.
+
+Par défaut, le script démarre l'API dans un processus uvicorn séparé avec des
+fournisseurs locaux (EMBEDDING_PROVIDER=hashing, LLM_PROVIDER=fake, voir
+app.providers) : la charge passe par tout le chemin de l'API (embedding,
+recherche FAISS, formatage, génération) sans appeler Vertex AI. Avec --url, il
+vise une API déjà démarrée.
+
+Deux modes de charge :
+- concurrence fixe (--concurrency N) : N clients enchaînent les requêtes ;
+- débit d'arrivée (--rate R) : arrivées poissonniennes à R requêtes/s, limitées
+  à --max-in-flight requêtes simultanées.
+
+Le rapport donne le débit, les latences p50/p95/p99, le taux d'erreur, le temps
+avant le premier token (streaming) et les durées par étape renvoyées par l'API
+(embed, search_<store>, format, answer_llm, reasoning_llm...). Il peut être
+enregistré en JSON pour comparer deux exécutions.
+
+Exemples :
+    python load_test.py --concurrency 8 --duration 30 --output load_test.json
+    python load_test.py --endpoint stream --rate 5 --duration 60
+    python load_test.py --server-env FAKE_LLM_LATENCY=1.5 --server-env GENERATION_MODE=fused
+    python load_test.py --url http://localhost:8080 --concurrency 4 --requests 100
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+import numpy as np
+
+from benchmark_retrieval import load_sidebar_questions, load_labelled_questions, DEFAULT_SIDEBAR, DEFAULT_QUERIES
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Environnement de l'API démarrée par le script : fournisseurs locaux, pas de
+# cache de réponses (les questions se répètent pendant le test) et logs de production
+STUB_ENV = {
+    "APP_ENV": "production",
+    "EMBEDDING_PROVIDER": "hashing",
+    "LLM_PROVIDER": "fake",
+    "ANSWER_CACHE_SIZE": "0",
+}
+
+ENDPOINTS = {"ask": "/ask", "stream": "/ask/stream"}
+
+
+def load_questions(path):
+    """Questions du fichier demandé, sinon exemples de l'interface web et questions annotées."""
+    if path:
+        questions = [q["question"] for q in load_labelled_questions(path)]
+    else:
+        questions = load_sidebar_questions(DEFAULT_SIDEBAR)
+        questions += [q["question"] for q in load_labelled_questions(DEFAULT_QUERIES)]
+    if not questions:
+        print("❌ Aucune question disponible pour le test de charge")
+        sys.exit(1)
+    return questions
+
+
+def start_server(port, extra_env, startup_timeout):
+    """Démarre l'API avec les fournisseurs locaux et attend qu'elle soit prête."""
+    env = {**os.environ, **STUB_ENV, **extra_env}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"L'API s'est arrêtée au démarrage (code {process.returncode})")
+        try:
+            if httpx.get(f"{url}/ready", timeout=2).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"L'API n'est pas prête après {startup_timeout}s")
+
+
+async def call_ask(client, url, question):
+    record = {"endpoint": "ask"}
+    start = time.perf_counter()
+    try:
+        response = await client.post(f"{url}/ask", json={"question": question, "include_metadata": False})
+        record["status"] = response.status_code
+        if response.status_code == 200:
+            data = response.json()
+            record["error"] = bool(data.get("error"))
+            record["timings"] = data.get("timings") or {}
+        else:
+            record["error"] = True
+    except httpx.HTTPError as e:
+        record.update(status=None, error=True, detail=str(e))
+    record["latency"] = time.perf_counter() - start
+    return record
+
+
+async def call_stream(client, url, question):
+    record = {"endpoint": "stream", "error": False}
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", f"{url}/ask/stream",
+                                 json={"question": question, "include_metadata": False}) as response:
+            record["status"] = response.status_code
+            if response.status_code != 200:
+                record["error"] = True
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    if event == "answer" and "time_to_first_token" not in record:
+                        record["time_to_first_token"] = time.perf_counter() - start
+                    elif event == "error":
+                        record["error"] = True
+                    elif event == "done":
+                        data = json.loads(line[len("data: "):])
+                        record["error"] = record["error"] or bool(data.get("error"))
+                        record["timings"] = data.get("timings") or {}
+    except httpx.HTTPError as e:
+        record.update(status=None, error=True, detail=str(e))
+    record["latency"] = time.perf_counter() - start
+    return record
+
+
+async def warm_up(call, url, questions, timeout):
+    """Requêtes séquentielles non comptées (connexions, caches, compilation paresseuse)."""
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        for question in questions:
+            await call(client, url, question)
+
+
+async def run_load(call, url, questions, args):
+    """Envoie les requêtes selon le mode choisi et retourne les mesures et la durée totale."""
+    records = []
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    budget = args.requests
+    rng = random.Random(args.seed)
+
+    def next_question():
+        nonlocal budget
+        if (deadline and time.perf_counter() >= deadline) or (budget is not None and budget <= 0):
+            return None
+        if budget is not None:
+            budget -= 1
+        return rng.choice(questions)
+
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.max_in_flight))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        if args.rate:
+            # Boucle ouverte : les arrivées ne dépendent pas des réponses
+            in_flight = asyncio.Semaphore(args.max_in_flight)
+            tasks = []
+
+            async def limited(question):
+                async with in_flight:
+                    records.append(await call(client, url, question))
+
+            while (question := next_question()) is not None:
+                tasks.append(asyncio.create_task(limited(question)))
+                await asyncio.sleep(rng.expovariate(args.rate))
+            await asyncio.gather(*tasks)
+        else:
+            async def worker():
+                while (question := next_question()) is not None:
+                    records.append(await call(client, url, question))
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return records, time.perf_counter() - start
+
+
+def percentiles_ms(values):
+    if not values:
+        return None
+    values = np.array(values) * 1000
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)), "mean": float(values.mean()), "max": float(values.max())}
+
+
+def summarize(records, wall_time):
+    """Débit, latences, erreurs et durées par étape d'une série de requêtes."""
+    ok = [r for r in records if not r["error"]]
+    stages = {}
+    for r in ok:
+        for name, seconds in r.get("timings", {}).items():
+            stages.setdefault(name, []).append(seconds)
+    summary = {
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "error_rate": (len(records) - len(ok)) / len(records) if records else 0.0,
+        "duration_s": wall_time,
+        "throughput_rps": len(ok) / wall_time if wall_time > 0 else 0.0,
+        "latency_ms": percentiles_ms([r["latency"] for r in ok]),
+        "stages_ms": {name: percentiles_ms(values) for name, values in sorted(stages.items())},
+    }
+    first_tokens = [r["time_to_first_token"] for r in ok if "time_to_first_token" in r]
+    if first_tokens:
+        summary["time_to_first_token_ms"] = percentiles_ms(first_tokens)
+    return summary
+
+
+def print_summary(endpoint, summary):
+    print(f"\n📊 {ENDPOINTS[endpoint]}: {summary['requests']} requêtes en {summary['duration_s']:.1f}s, "
+          f"{summary['throughput_rps']:.2f} req/s, {summary['error_rate']:.1%} d'erreurs")
+    rows = [("latence", summary["latency_ms"])]
+    if "time_to_first_token_ms" in summary:
+        rows.append(("premier token", summary["time_to_first_token_ms"]))
+    rows += list(summary["stages_ms"].items())
+    print(f"   {'étape':<28} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    for name, values in rows:
+        if values:
+            print(f"   {name:<28} {values['p50']:>10.1f} {values['p95']:>10.1f} {values['p99']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de /ask et /ask/stream")
+    parser.add_argument("--url", default=None, help="API à tester (défaut: API locale démarrée avec des fournisseurs simulés)")
+    parser.add_argument("--port", type=int, default=8765, help="Port de l'API locale")
+    parser.add_argument("--server-env", action="append", default=[], metavar="CLE=VALEUR",
+                        help="Variable d'environnement supplémentaire pour l'API locale (répétable)")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="Attente maximale du démarrage (s)")
+    parser.add_argument("--endpoint", choices=("ask", "stream", "both"), default="ask", help="Point d'entrée testé")
+    parser.add_argument("--questions", default=None, help="Fichier de questions (JSONL ou une question par ligne)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients simultanés (mode concurrence fixe)")
+    parser.add_argument("--rate", type=float, default=None, help="Requêtes par seconde (mode débit d'arrivée)")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Requêtes simultanées maximales en mode débit")
+    parser.add_argument("--duration", type=float, default=30, help="Durée du test par point d'entrée (s)")
+    parser.add_argument("--requests", type=int, default=None, help="Nombre de requêtes (remplace --duration)")
+    parser.add_argument("--warmup", type=int, default=2, help="Requêtes de préchauffage non comptées")
+    parser.add_argument("--timeout", type=float, default=120, help="Délai maximal d'une requête (s)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du tirage des questions et des arrivées")
+    parser.add_argument("--output", default=None, help="Fichier JSON de sortie (optionnel)")
+    parser.add_argument("--include-raw", action="store_true", help="Inclure chaque requête dans le JSON")
+    args = parser.parse_args()
+    if args.requests:
+        args.duration = None
+
+    questions = load_questions(args.questions)
+    server_env = dict(item.split("=", 1) for item in args.server_env)
+
+    process = None
+    url = args.url
+    if url is None:
+        print(f"🚀 Démarrage de l'API locale ({', '.join(f'{k}={v}' for k, v in {**STUB_ENV, **server_env}.items())})")
+        process, url = start_server(args.port, server_env, args.startup_timeout)
+
+    calls = {"ask": call_ask, "stream": call_stream}
+    endpoints = ["ask", "stream"] if args.endpoint == "both" else [args.endpoint]
+    report = {
+        "settings": {"url": args.url or "local", "server_env": {**STUB_ENV, **server_env} if process else None,
+                     "concurrency": None if args.rate else args.concurrency, "rate": args.rate,
+                     "max_in_flight": args.max_in_flight if args.rate else None, "duration_s": args.duration,
+                     "requests": args.requests, "questions": len(questions), "seed": args.seed},
+        "results": {},
+    }
+    try:
+        for endpoint in endpoints:
+            asyncio.run(warm_up(calls[endpoint], url, questions[:args.warmup], args.timeout))
+            records, wall_time = asyncio.run(run_load(calls[endpoint], url, questions, args))
+            summary = summarize(records, wall_time)
+            print_summary(endpoint, summary)
+            report["results"][endpoint] = {**summary, "raw": records} if args.include_raw else summary
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Résultats enregistrés dans '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,15 +11,13 @@ import logging
 import subprocess
 import uvicorn
 
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('fiscalia_run.log')
-    ]
-)
+from app.faiss_loader import (read_index_header, header_supports_mmap, has_store_files, FAISS_LOAD_MODE,
+                              VECTOR_STORES_PATH, STORE_NAMES, INDEX_FILE)
+from app.sqlite_docstore import SQLITE_DOCSTORE_FILE
+from app.logging_config import configure_logging
+
+# Même configuration que l'API (APP_ENV, LOG_LEVEL, LOG_FORMAT, LOG_FILE)
+configure_logging()
 logger = logging.getLogger("fiscalia_launcher")
 
 # Bannière de démarrage
@@ -40,19 +38,21 @@ banner = """
 
 print(banner)
 
-def check_vector_stores():
-    """Vérifie l'intégrité des vector stores"""
-    logger.info("Vérification des vector stores...")
+def check_vector_stores(mode=FAISS_LOAD_MODE, base_path=VECTOR_STORES_PATH):
+    """
+    Vérifie la présence des vector stores servis par l'API (VECTOR_STORES_PATH) et leur
+    compatibilité avec le mode de chargement. Seul l'en-tête des index est lu : l'API
+    les charge ensuite dans le même processus, sans double lecture.
+    """
+    logger.info(f"Vérification des vector stores de {base_path} (mode de chargement: {mode})...")
     
-    base_path = os.path.join(os.path.dirname(__file__), "app", "vector_stores")
     if not os.path.exists(base_path):
         logger.error(f"Répertoire vector_stores introuvable: {base_path}")
         return False
     
-    stores = ["cgi", "bofip", "bofip_bareme"]
     missing_stores = []
     
-    for store in stores:
+    for store in STORE_NAMES:
         store_path = os.path.join(base_path, store)
         if not os.path.exists(store_path):
             logger.error(f"Vector store {store} introuvable!")
@@ -60,9 +60,25 @@ def check_vector_stores():
             continue
         
         files = os.listdir(store_path)
-        if "index.faiss" not in files or "index.pkl" not in files:
+        if not has_store_files(store_path):
             logger.error(f"Fichiers manquants dans {store}. Trouvés: {files}")
             missing_stores.append(store)
+            continue
+        
+        try:
+            index_type, dimension, ntotal = read_index_header(os.path.join(store_path, INDEX_FILE))
+        except Exception as e:
+            logger.error(f"Index FAISS illisible pour {store}: {str(e)}")
+            missing_stores.append(store)
+            continue
+        
+        if SQLITE_DOCSTORE_FILE not in files:
+            logger.warning(f"Docstore picklé pour {store}: convertissez-le avec convert_docstore.py")
+        
+        if mode == "mmap" and not header_supports_mmap(index_type):
+            logger.warning(f"Index {index_type} de {store} non compatible mmap: il sera chargé en mémoire")
+        else:
+            logger.info(f"Index {index_type} de {store} OK ({ntotal} vecteurs de dimension {dimension})")
     
     if missing_stores:
         logger.error(f"Vector stores manquants ou incomplets: {missing_stores}")
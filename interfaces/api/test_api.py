@@ -40,6 +40,11 @@ def test_api(question):
             # Affichage de la réponse
             print("\n✅ Réponse reçue:")
             print(f"\n🤖 Réponse: {result['answer']}")
+            if not result['reasoning'] and result.get('response_id'):
+                # Raisonnement généré à la demande (REASONING_MODE=lazy)
+                reasoning_response = requests.get(f"{API_URL}/{result['response_id']}/reasoning")
+                if reasoning_response.status_code == 200:
+                    result['reasoning'] = reasoning_response.json()['reasoning']
             print(f"\n🧠 Raisonnement: {result['reasoning']}")
             
             if 'sources' in result and result['sources']:
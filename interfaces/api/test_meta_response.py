@@ -63,6 +63,11 @@ def test_meta_citations(question):
             # Analyse des citations dans la réponse
             answer = result.get("answer", "")
             reasoning = result.get("reasoning", "")
+            if not reasoning and result.get("response_id"):
+                # Raisonnement généré à la demande (REASONING_MODE=lazy)
+                reasoning_response = requests.get(f"{API_URL}/{result['response_id']}/reasoning")
+                if reasoning_response.status_code == 200:
+                    reasoning = reasoning_response.json()["reasoning"]
             
             # Extraction et affichage des citations
             answer_citations = extract_citations(answer)
@@ -0,0 +1,80 @@
+"""Configuration commune des tests de l'API : le paquet app est importé depuis interfaces/api."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Logs JSON sur la sortie standard : pas de fichier fiscalia_api.log créé par les tests
+os.environ.setdefault("APP_ENV", "production")
+
+
+@pytest.fixture
+def api():
+    """Module app.main avec le chatbot considéré comme prêt (les vector stores ne sont pas chargés)"""
+    from app import main
+
+    main.app.dependency_overrides[main.ensure_ready] = lambda: None
+    yield main
+    main.app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def client(api):
+    """Client HTTP de l'API, sans le cycle de vie (pas de chargement du chatbot)"""
+    from fastapi.testclient import TestClient
+
+    return TestClient(api.app)
+
+
+STORE_DOCUMENTS = [
+    ("cgi-278", "Article 278 : le taux normal de la taxe sur la valeur ajoutée est fixé à 20 %.",
+     {"source": "Code Général des Impôts", "title": "278"}),
+    ("cgi-1380", "Article 1380 : la taxe foncière est établie annuellement sur les propriétés bâties.",
+     {"source": "Code Général des Impôts", "title": "1380"}),
+    ("cgi-779", "Article 779 : un abattement de 100 000 euros s'applique aux successions en ligne directe.",
+     {"source": "Code Général des Impôts", "title": "779"}),
+]
+
+
+@pytest.fixture
+def loaded_chatbot(api, monkeypatch, tmp_path):
+    """
+    Chatbot réellement chargé, installé à la place de l'instance de l'API : embeddings
+    par hachage, LLM simulé sans latence et un vector store "cgi" de quelques articles.
+    """
+    import faiss
+    import numpy as np
+    from langchain_core.documents import Document
+
+    from app import providers, rag_predictor, tokens
+    from app.index_builder import save_store
+    from app.local_embeddings import HashingEmbeddings
+
+    monkeypatch.setattr(providers, "EMBEDDING_PROVIDER", "hashing")
+    monkeypatch.setattr(providers, "HASHING_EMBEDDING_DIMENSION", 64)
+    monkeypatch.setattr(providers, "LLM_PROVIDER", "fake")
+    monkeypatch.setenv("FAKE_LLM_LATENCY", "0")
+    monkeypatch.setenv("FAKE_LLM_TOKENS_PER_SECOND", "0")
+    monkeypatch.setenv("FAKE_LLM_RESPONSE_TOKENS", "8")
+    # Décompte estimé : pas de téléchargement d'encodage pendant les tests
+    monkeypatch.setattr(tokens, "_encoding", None)
+    monkeypatch.setattr(tokens, "_encoding_loaded", True)
+
+    vectors = np.array(HashingEmbeddings(dimension=64).embed_documents([text for _, text, _ in STORE_DOCUMENTS]),
+                       dtype=np.float32)
+    index = faiss.IndexFlatL2(64)
+    index.add(vectors)
+    save_store(str(tmp_path / "cgi"), index,
+               [(doc_id, Document(page_content=text, metadata=metadata)) for doc_id, text, metadata in STORE_DOCUMENTS])
+    monkeypatch.setattr(rag_predictor, "BASE_PATH", str(tmp_path))
+
+    chatbot = rag_predictor.FiscalChatbot()
+    chatbot.load()
+    chatbot.status = "ready"
+    monkeypatch.setattr(rag_predictor, "chatbot", chatbot)
+    monkeypatch.setattr(api, "chatbot", chatbot)
+    yield chatbot
+    chatbot.shutdown()
@@ -0,0 +1,288 @@
+import asyncio
+
+import pytest
+
+from app import admission
+from app.admission import AdmissionController, AdmissionRejected, BATCH, INTERACTIVE
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+def controller(**options):
+    settings = dict(max_in_flight=2, batch_max_in_flight=1, interactive_queue_size=4,
+                    interactive_queue_timeout=5, batch_queue_size=4, batch_queue_timeout=5, retry_after=1)
+    settings.update(options)
+    return AdmissionController(**settings)
+
+
+async def settle():
+    """Laisse la boucle traiter les places accordées et les annulations en cours"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def waiting(controller, lane, count=1, weight=1):
+    """Lance count demandes qui restent en file d'attente"""
+    tasks = [asyncio.create_task(controller.acquire(lane, weight)) for _ in range(count)]
+    await settle()
+    return tasks
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge des durées de génération contrôlée par le test"""
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "perf_counter", lambda: now[0])
+    return now
+
+
+class TestAdmissionController:
+
+    def test_disabled(self):
+        async def scenario():
+            return await controller(max_in_flight=0).acquire(INTERACTIVE)
+
+        assert run(scenario) is None
+
+    def test_admits_within_capacity(self):
+        async def scenario():
+            gate = controller()
+            tickets = [await gate.acquire(INTERACTIVE), await gate.acquire(INTERACTIVE)]
+            return gate, tickets
+
+        gate, tickets = run(scenario)
+        assert all(ticket.lane == INTERACTIVE for ticket in tickets)
+        assert gate.in_flight == 2
+        assert gate.stats()["lanes"][INTERACTIVE]["admitted"] == 2
+
+    def test_interactive_served_before_batch(self):
+        """Une place libérée va d'abord aux questions interactives, même arrivées après le lot"""
+        async def scenario():
+            gate = controller()
+            first, second = await gate.acquire(INTERACTIVE), await gate.acquire(INTERACTIVE)
+            batch = await waiting(gate, BATCH)
+            interactive = await waiting(gate, INTERACTIVE)
+            gate.release(first)
+            await settle()
+            served_first = (interactive[0].done(), batch[0].done())
+            gate.release(second)
+            await settle()
+            return served_first, batch[0].result(), interactive[0].result()
+
+        served_first, batch_ticket, interactive_ticket = run(scenario)
+        assert served_first == (True, False)
+        assert (interactive_ticket.lane, batch_ticket.lane) == (INTERACTIVE, BATCH)
+
+    def test_batch_blocked_while_interactive_waits(self):
+        """Tant qu'une question interactive attend, aucun lot ne démarre, même s'il tient dans la place libre"""
+        async def scenario():
+            gate = controller(max_in_flight=2, batch_max_in_flight=2)
+            held = await gate.acquire(INTERACTIVE)
+            await gate.acquire(INTERACTIVE)
+            interactive = await waiting(gate, INTERACTIVE, weight=2)
+            batch = await waiting(gate, BATCH, weight=1)
+            gate.release(held)
+            await settle()
+            lanes = gate.stats()["lanes"]
+            return interactive[0].done(), batch[0].done(), lanes[INTERACTIVE]["queued"], lanes[BATCH]["queued"]
+
+        assert run(scenario) == (False, False, 1, 1)
+
+    def test_batch_lane_limit(self):
+        """Un lot ne dépasse pas batch_max_in_flight, même avec de la place libre"""
+        async def scenario():
+            gate = controller(max_in_flight=4, batch_max_in_flight=1)
+            await gate.acquire(BATCH)
+            batch = await waiting(gate, BATCH)
+            interactive = await gate.acquire(INTERACTIVE)
+            return batch[0].done(), interactive
+
+        batch_done, interactive = run(scenario)
+        assert not batch_done
+        assert interactive.lane == INTERACTIVE
+
+    def test_no_overtaking_queued_requests(self):
+        """Une nouvelle demande ne passe pas devant la file, même si une place semble libre"""
+        async def scenario():
+            gate = controller(max_in_flight=3, batch_max_in_flight=3)
+            await gate.acquire(INTERACTIVE, 1)
+            queued = await waiting(gate, BATCH, weight=3)
+            late = await waiting(gate, BATCH, weight=1)
+            return queued[0].done(), late[0].done()
+
+        assert run(scenario) == (False, False)
+
+    def test_queue_full_rejected(self):
+        async def scenario():
+            gate = controller(max_in_flight=1, interactive_queue_size=1)
+            await gate.acquire(INTERACTIVE)
+            await waiting(gate, INTERACTIVE)
+            with pytest.raises(AdmissionRejected) as rejected:
+                await gate.acquire(INTERACTIVE)
+            return gate, rejected.value
+
+        gate, rejected = run(scenario)
+        assert (rejected.lane, rejected.reason) == (INTERACTIVE, "queue_full")
+        assert rejected.retry_after >= 1
+        assert gate.stats()["lanes"][INTERACTIVE]["rejected_queue_full"] == 1
+
+    def test_queue_timeout_rejected(self):
+        """Une attente plus longue que le délai de la voie est refusée et quitte la file"""
+        async def scenario():
+            gate = controller(max_in_flight=1, interactive_queue_timeout=0.01)
+            await gate.acquire(INTERACTIVE)
+            with pytest.raises(AdmissionRejected) as rejected:
+                await gate.acquire(INTERACTIVE)
+            return gate, rejected.value
+
+        gate, rejected = run(scenario)
+        assert (rejected.lane, rejected.reason) == (INTERACTIVE, "queue_timeout")
+        lane = gate.stats()["lanes"][INTERACTIVE]
+        assert (lane["rejected_timeout"], lane["queued"]) == (1, 0)
+
+    def test_cancelled_waiter_leaves_queue(self):
+        async def scenario():
+            gate = controller(max_in_flight=1)
+            ticket = await gate.acquire(INTERACTIVE)
+            (task,) = await waiting(gate, INTERACTIVE)
+            task.cancel()
+            await settle()
+            queued = gate.stats()["lanes"][INTERACTIVE]["queued"]
+            gate.release(ticket)
+            return gate, queued
+
+        gate, queued = run(scenario)
+        assert queued == 0
+        assert gate.in_flight == 0
+
+    def test_release_is_idempotent(self):
+        """Rendre deux fois la même place ne libère pas de capacité supplémentaire"""
+        async def scenario():
+            gate = controller(max_in_flight=1)
+            ticket = await gate.acquire(INTERACTIVE)
+            (task,) = await waiting(gate, INTERACTIVE)
+            gate.release(ticket)
+            await settle()
+            gate.release(ticket)
+            gate.release(None)
+            return gate, await task
+
+        gate, next_ticket = run(scenario)
+        assert gate.in_flight == 1
+        assert gate.stats()["lanes"][INTERACTIVE]["in_flight"] == 1
+        assert not next_ticket.released
+
+    def test_admit_releases_on_error(self):
+        async def scenario():
+            gate = controller()
+            with pytest.raises(RuntimeError):
+                async with gate.admit(INTERACTIVE) as ticket:
+                    raise RuntimeError("génération en échec")
+            return gate, ticket
+
+        gate, ticket = run(scenario)
+        assert ticket.released
+        assert gate.in_flight == 0
+
+    def test_service_time_is_smoothed(self, clock):
+        """La durée moyenne d'une génération est lissée (EWMA de poids 0,2)"""
+        async def scenario():
+            gate = controller()
+            for duration in (10.0, 20.0):
+                ticket = await gate.acquire(INTERACTIVE)
+                clock[0] += duration
+                gate.release(ticket)
+            return gate
+
+        assert run(scenario).stats()["service_time_s"] == pytest.approx(0.8 * 10 + 0.2 * 20)
+
+    def test_retry_after_follows_service_time(self, clock):
+        """Retry-After : durée moyenne x (demandes en attente + 1) / places de la voie"""
+        async def scenario():
+            gate = controller(max_in_flight=2, interactive_queue_size=3, retry_after=1)
+            ticket = await gate.acquire(INTERACTIVE)
+            clock[0] += 10
+            gate.release(ticket)
+            await gate.acquire(INTERACTIVE)
+            await gate.acquire(INTERACTIVE)
+            await waiting(gate, INTERACTIVE, count=3)
+            with pytest.raises(AdmissionRejected) as rejected:
+                await gate.acquire(INTERACTIVE)
+            return rejected.value
+
+        # 10 s x (3 + 1) / 2 places
+        assert run(scenario).retry_after == 20
+
+    def test_retry_after_minimum(self):
+        """Sans durée mesurée, le délai minimal configuré est proposé"""
+        async def scenario():
+            gate = controller(max_in_flight=1, interactive_queue_size=0, retry_after=3)
+            await gate.acquire(INTERACTIVE)
+            with pytest.raises(AdmissionRejected) as rejected:
+                await gate.acquire(INTERACTIVE)
+            return rejected.value
+
+        assert run(scenario).retry_after == 3
+
+
+class TestAdmissionEndpoints:
+
+    @pytest.fixture
+    def lanes(self, api, loaded_chatbot, monkeypatch):
+        """Voies demandées au contrôle d'admission, refusées aussitôt (le chatbot chargé atteint la génération)"""
+        requested = []
+
+        async def reject(lane, weight=1):
+            requested.append(lane)
+            raise AdmissionRejected(lane, "queue_full", 7)
+
+        monkeypatch.setattr(api, "acquire_admission", reject)
+        return requested
+
+    @pytest.mark.parametrize("path", ["/ask", "/ask/stream"])
+    @pytest.mark.parametrize("header, lane", [(None, INTERACTIVE), ("batch", BATCH), ("Interactive", INTERACTIVE)])
+    def test_request_lane_header(self, client, lanes, path, header, lane):
+        """X-Request-Lane choisit la voie de /ask comme de /ask/stream ; un refus est un 429 avec Retry-After"""
+        headers = {"X-Request-Lane": header} if header else {}
+        response = client.post(path, json={"question": "Quel est le taux de TVA ?"}, headers=headers)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+        assert response.json()["lane"] == lane
+        assert lanes == [lane]
+
+    @pytest.mark.parametrize("path", ["/ask", "/ask/stream"])
+    def test_unknown_lane(self, client, lanes, path):
+        response = client.post(path, json={"question": "TVA ?"}, headers={"X-Request-Lane": "urgent"})
+        assert response.status_code == 400
+        assert lanes == []
+
+    def test_cached_answer_served_without_admission(self, api, client, loaded_chatbot, monkeypatch):
+        """Une réponse du cache sémantique est servie même quand la capacité est atteinte"""
+        question = "Quel est le taux normal de la taxe sur la valeur ajoutée ?"
+        first = client.post("/ask", json={"question": question})
+        assert first.status_code == 200
+        assert not first.json()["error"]
+
+        requested = []
+
+        async def reject(lane, weight=1):
+            requested.append(lane)
+            raise AdmissionRejected(lane, "queue_full", 7)
+
+        monkeypatch.setattr(api, "acquire_admission", reject)
+        cached = client.post("/ask", json={"question": question})
+        assert cached.status_code == 200
+        assert cached.json()["answer"] == first.json()["answer"]
+        assert requested == []
+        # Une question nouvelle atteint la génération et demande une place
+        assert client.post("/ask", json={"question": "Quand la taxe foncière est-elle établie ?"}).status_code == 429
+        assert requested == [INTERACTIVE]
+
+    def test_no_document_answer_without_admission(self, client, loaded_chatbot, lanes, monkeypatch):
+        """Sans document trouvé, aucune génération : pas de place demandée"""
+        monkeypatch.setattr(loaded_chatbot, "vector_stores", {})
+        response = client.post("/ask", json={"question": "Quel est le taux de TVA ?"})
+        assert response.status_code == 200
+        assert lanes == []
@@ -0,0 +1,134 @@
+import pytest
+
+from app import answer_cache
+from app.answer_cache import SemanticAnswerCache
+
+
+VERSION = "v1"
+
+
+def response(text):
+    return {"answer": text, "reasoning": "", "sources": [{"source": "BOFIP"}]}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge du cache contrôlée par le test"""
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    return now
+
+
+class TestSemanticAnswerCache:
+
+    def test_hit_above_threshold(self):
+        """Une question d'embedding très proche reçoit la réponse en cache"""
+        cache = SemanticAnswerCache(threshold=0.95, max_entries=4)
+        cache.store("taux de TVA", [1.0, 0.0, 0.0], VERSION, response("20 %"))
+
+        assert cache.lookup([0.99, 0.05, 0.0], VERSION)["answer"] == "20 %"
+        assert cache.stats()["hits"] == 1
+
+    def test_hit_log_omits_question(self, caplog):
+        """Un succès du cache journalise la similarité et l'identifiant de réponse, pas la question posée"""
+        cache = SemanticAnswerCache(threshold=0.95, max_entries=4)
+        cache.store("taux de TVA sur ma résidence", [1.0, 0.0, 0.0], VERSION,
+                    {**response("20 %"), "response_id": "r-42"})
+
+        with caplog.at_level("DEBUG", logger="app.answer_cache"):
+            cache.lookup([0.99, 0.05, 0.0], VERSION)
+        assert "r-42" in caplog.text
+        assert "similarité 0.999" in caplog.text
+        assert "résidence" not in caplog.text
+        assert "20 %" not in caplog.text
+
+    def test_miss_below_threshold(self):
+        """Une question trop éloignée ne reçoit pas une réponse fiscale erronée"""
+        cache = SemanticAnswerCache(threshold=0.95, max_entries=4)
+        cache.store("taux de TVA", [1.0, 0.0, 0.0], VERSION, response("20 %"))
+
+        assert cache.lookup([0.7, 0.7, 0.0], VERSION) is None
+        assert cache.lookup([0.0, 1.0, 0.0], VERSION) is None
+        assert cache.stats()["misses"] == 2
+
+    def test_returns_closest_entry(self):
+        """Parmi plusieurs réponses au-dessus du seuil, la plus proche est renvoyée"""
+        cache = SemanticAnswerCache(threshold=0.9, max_entries=4)
+        cache.store("a", [1.0, 0.1, 0.0], VERSION, response("a"))
+        cache.store("b", [1.0, 0.0, 0.1], VERSION, response("b"))
+
+        assert cache.lookup([1.0, 0.0, 0.09], VERSION)["answer"] == "b"
+
+    def test_lookup_returns_independent_copy(self):
+        """Modifier la réponse renvoyée ne modifie pas l'entrée en cache"""
+        cache = SemanticAnswerCache(max_entries=4)
+        cache.store("q", [1.0, 0.0], VERSION, response("r"))
+
+        first = cache.lookup([1.0, 0.0], VERSION)
+        first["sources"].append("modifiée")
+        first["answer"] = "modifiée"
+
+        assert cache.lookup([1.0, 0.0], VERSION) == response("r")
+
+    def test_store_copies_response(self):
+        """Modifier la réponse après l'avoir mise en cache ne modifie pas l'entrée"""
+        cache = SemanticAnswerCache(max_entries=4)
+        stored = response("r")
+        cache.store("q", [1.0, 0.0], VERSION, stored)
+        stored["answer"] = "modifiée"
+
+        assert cache.lookup([1.0, 0.0], VERSION)["answer"] == "r"
+
+    def test_invalidated_when_index_version_changes(self):
+        """Une nouvelle version des vector stores vide le cache"""
+        cache = SemanticAnswerCache(max_entries=4)
+        cache.store("q", [1.0, 0.0], VERSION, response("r"))
+
+        assert cache.lookup([1.0, 0.0], "v2") is None
+        assert cache.stats()["invalidations"] == 1
+        assert cache.stats()["size"] == 0
+        # Le retour à l'ancienne version ne ressuscite pas l'entrée
+        assert cache.lookup([1.0, 0.0], VERSION) is None
+
+    def test_lru_eviction(self):
+        """Cache plein : la réponse la moins récemment utilisée est évincée"""
+        cache = SemanticAnswerCache(threshold=0.99, max_entries=2)
+        cache.store("a", [1.0, 0.0, 0.0], VERSION, response("a"))
+        cache.store("b", [0.0, 1.0, 0.0], VERSION, response("b"))
+        # "a" redevient la plus récente
+        assert cache.lookup([1.0, 0.0, 0.0], VERSION)["answer"] == "a"
+        cache.store("c", [0.0, 0.0, 1.0], VERSION, response("c"))
+
+        assert cache.lookup([0.0, 1.0, 0.0], VERSION) is None
+        assert cache.lookup([1.0, 0.0, 0.0], VERSION)["answer"] == "a"
+        assert cache.lookup([0.0, 0.0, 1.0], VERSION)["answer"] == "c"
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self, clock):
+        """Une réponse plus ancienne que la durée de vie n'est plus servie"""
+        cache = SemanticAnswerCache(max_entries=4, ttl_seconds=60)
+        cache.store("q", [1.0, 0.0], VERSION, response("r"))
+
+        clock[0] += 59
+        assert cache.lookup([1.0, 0.0], VERSION) is not None
+        clock[0] += 2
+        assert cache.lookup([1.0, 0.0], VERSION) is None
+        assert cache.stats()["size"] == 0
+        assert cache.stats()["evictions"] == 1
+
+    def test_dimension_change_resets_cache(self):
+        """Un changement de modèle d'embedding (autre dimension) ne produit pas de faux succès"""
+        cache = SemanticAnswerCache(max_entries=4)
+        cache.store("q", [1.0, 0.0], VERSION, response("r"))
+
+        assert cache.lookup([1.0, 0.0, 0.0], VERSION) is None
+        cache.store("q", [1.0, 0.0, 0.0], VERSION, response("r3"))
+        assert cache.lookup([1.0, 0.0, 0.0], VERSION)["answer"] == "r3"
+        assert cache.stats()["size"] == 1
+
+    def test_disabled_cache(self):
+        """max_entries=0 : rien n'est mis en cache"""
+        cache = SemanticAnswerCache(max_entries=0)
+        cache.store("q", [1.0, 0.0], VERSION, response("r"))
+
+        assert cache.lookup([1.0, 0.0], VERSION) is None
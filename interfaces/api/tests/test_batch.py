@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app import rag_predictor
+from app.admission import AdmissionController
+
+QUESTIONS = [
+    "Quel est le taux normal de la taxe sur la valeur ajoutée ?",
+    "Quand la taxe foncière est-elle établie ?",
+    "Quel abattement pour une succession en ligne directe ?",
+    "Quelles propriétés sont soumises à la taxe foncière ?",
+]
+
+
+class Chain:
+    """Chaîne de génération qui mesure le nombre d'appels simultanés (partagé entre chaînes)"""
+
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    async def ainvoke(self, inputs):
+        self.calls["current"] += 1
+        self.calls["max"] = max(self.calls["max"], self.calls["current"])
+        await asyncio.sleep(0.01)
+        self.calls["current"] -= 1
+        return f"{self.name} : {inputs['question']}"
+
+
+@pytest.fixture
+def calls(loaded_chatbot, monkeypatch):
+    calls = {"current": 0, "max": 0}
+    monkeypatch.setattr(loaded_chatbot, "answer_chain", Chain("Réponse", calls))
+    monkeypatch.setattr(loaded_chatbot, "reasoning_chain", Chain("Raisonnement", calls))
+    return calls
+
+
+@pytest.fixture
+def eager(monkeypatch):
+    """Raisonnement généré avec la réponse, les deux chaînes en même temps"""
+    monkeypatch.setattr(rag_predictor, "LAZY_REASONING", False)
+    monkeypatch.setattr(rag_predictor, "GENERATION_MODE", "concurrent")
+
+
+class TestBatchGenerationSlots:
+
+    @pytest.mark.parametrize("lazy, mode, expected", [
+        (True, "concurrent", 3),
+        (False, "concurrent", 6),
+        (False, "sequential", 3),
+    ])
+    def test_slots_per_mode(self, loaded_chatbot, monkeypatch, lazy, mode, expected):
+        monkeypatch.setattr(rag_predictor, "LAZY_REASONING", lazy)
+        monkeypatch.setattr(rag_predictor, "GENERATION_MODE", mode)
+        assert loaded_chatbot.batch_generation_slots(3) == expected
+
+    def test_capped_by_batch_concurrency(self, loaded_chatbot, eager, monkeypatch):
+        monkeypatch.setattr(rag_predictor, "BATCH_MAX_CONCURRENCY", 2)
+        assert loaded_chatbot.batch_generation_slots(10) == 4
+
+    def test_generation_within_slots(self, loaded_chatbot, calls, eager, monkeypatch):
+        """En mode eager concurrent, les deux chaînes d'un lot se partagent les mêmes places"""
+        monkeypatch.setattr(rag_predictor, "BATCH_MAX_CONCURRENCY", 1)
+        results = asyncio.run(loaded_chatbot.generate_answers(QUESTIONS))
+        assert [result["reasoning"] for result in results] == [f"Raisonnement : {q}" for q in QUESTIONS]
+        assert calls["max"] == 2
+
+
+class TestBatchAdmission:
+
+    @pytest.fixture
+    def weights(self, api, monkeypatch):
+        """Places demandées par /ask/batch à un contrôle d'admission plafonné à 3 places de lot"""
+        gate = AdmissionController(max_in_flight=8, batch_max_in_flight=3, interactive_queue_size=4,
+                                   interactive_queue_timeout=5, batch_queue_size=4, batch_queue_timeout=5,
+                                   retry_after=1)
+        monkeypatch.setattr(api, "admission", gate)
+        requested = []
+        acquire = api.acquire_admission
+
+        async def recording_acquire(lane, weight=1):
+            requested.append(weight)
+            return await acquire(lane, weight)
+
+        monkeypatch.setattr(api, "acquire_admission", recording_acquire)
+        return requested
+
+    def test_weight_counts_both_chains(self, client, loaded_chatbot, calls, eager, weights):
+        """Le lot réserve deux places par question et ne dépasse pas les places accordées"""
+        response = client.post("/ask/batch", json={"questions": QUESTIONS})
+        assert response.status_code == 200
+        assert response.json()["errors"] == 0
+        assert weights == [2 * len(QUESTIONS)]
+        # Demande plafonnée à 3 places par la voie batch : la génération s'y tient
+        assert calls["max"] == 3
+
+    def test_lazy_weight(self, client, loaded_chatbot, calls, weights):
+        response = client.post("/ask/batch", json={"questions": QUESTIONS[:2]})
+        assert response.status_code == 200
+        assert weights == [2]
+        assert calls["max"] == 2
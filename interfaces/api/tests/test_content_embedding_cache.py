@@ -0,0 +1,146 @@
+import argparse
+import sqlite3
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app import content_embedding_cache
+from app.content_embedding_cache import ContentEmbeddingCache
+from embed_corpus import embed_with_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge du cache contrôlée par le test"""
+    now = [1000.0]
+    monkeypatch.setattr(content_embedding_cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "embeddings.sqlite")
+
+
+def vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+class TestContentEmbeddingCache:
+
+    def test_round_trip(self, path):
+        """Un vecteur enregistré est relu à l'identique, y compris après réouverture"""
+        cache = ContentEmbeddingCache(path, "model")
+        key = cache.key("texte")
+        cache.put_many([(key, vector(1, 2, 3))])
+        cache.close()
+
+        cache = ContentEmbeddingCache(path, "model")
+        found = cache.get_many([key, cache.key("absent")])
+        cache.close()
+        assert list(found) == [key]
+        np.testing.assert_array_equal(found[key], vector(1, 2, 3))
+
+    def test_key_depends_on_model(self, path):
+        """Le même texte n'a pas la même clé pour deux modèles"""
+        first = ContentEmbeddingCache(path, "model-a")
+        second = ContentEmbeddingCache(path, "model-b")
+        assert first.key("texte") != second.key("texte")
+        first.close()
+        second.close()
+
+    def test_prune_keeps_other_models(self, path):
+        """Le cache est partagé entre fournisseurs : prune ne supprime pas les vecteurs récents d'un autre modèle"""
+        other = ContentEmbeddingCache(path, "vertex")
+        other.put_many([(other.key("texte"), vector(1, 2))])
+        other.close()
+
+        cache = ContentEmbeddingCache(path, "hashing")
+        cache.put_many([(cache.key("texte"), vector(3, 4))])
+        assert cache.prune(max_age_seconds=3600) == 0
+        assert len(cache) == 2
+        cache.close()
+
+    def test_purge_other_models(self, path):
+        other = ContentEmbeddingCache(path, "vertex")
+        other.put_many([(other.key("texte"), vector(1, 2))])
+        other.close()
+
+        cache = ContentEmbeddingCache(path, "hashing")
+        cache.put_many([(cache.key("texte"), vector(3, 4))])
+        assert cache.purge_other_models() == 1
+        assert len(cache) == 1
+        assert cache.key("texte") in cache.get_many([cache.key("texte")])
+        cache.close()
+
+    def test_prune_removes_unused_entries(self, path, clock):
+        """Seuls les vecteurs lus ou écrits récemment survivent à prune(max_age_seconds)"""
+        cache = ContentEmbeddingCache(path, "model")
+        kept, read, stale = cache.key("gardé"), cache.key("relu"), cache.key("périmé")
+        cache.put_many([(kept, vector(1)), (read, vector(2)), (stale, vector(3))])
+
+        clock[0] += 100
+        cache.put_many([(kept, vector(1))])
+        cache.get_many([read])
+
+        clock[0] += 50
+        assert cache.prune(max_age_seconds=60) == 1
+        assert set(cache.get_many([kept, read, stale])) == {kept, read}
+        cache.close()
+
+    def test_migrates_previous_schema(self, path, clock):
+        """Un cache sans colonne last_used est migré ; ses entrées datent de leur création"""
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            CREATE TABLE embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, dimension INTEGER NOT NULL,
+                                     vector BLOB NOT NULL, created_at REAL NOT NULL);
+        """)
+        connection.execute("INSERT INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                           ("ancienne", "model", 1, vector(1).tobytes(), 0.0))
+        connection.commit()
+        connection.close()
+
+        cache = ContentEmbeddingCache(path, "model")
+        cache.put_many([("récente", vector(2))])
+        assert cache.prune(max_age_seconds=500) == 1
+        assert list(cache.get_many(["ancienne", "récente"])) == ["récente"]
+        cache.close()
+
+
+class TestEmbedWithCache:
+
+    @pytest.fixture
+    def args(self, tmp_path, path):
+        return argparse.Namespace(embedding_cache=path, work_dir=str(tmp_path / "work"), batch_size=2,
+                                  concurrency=1, requests_per_minute=None, max_retries=0,
+                                  embedding_cache_max_age_days=30, purge_other_models=False)
+
+    def build(self, model_name, args, dimension):
+        documents = [Document(page_content=text) for text in ("TVA", "taxe foncière", "droits de succession")]
+        return embed_with_cache("bofip", documents, DeterministicFakeEmbedding(size=dimension), model_name, args)
+
+    def test_build_with_other_model_keeps_vectors(self, args, path):
+        """Une construction avec le modèle B laisse en place les vecteurs du modèle A"""
+        self.build("vertex", args, dimension=8)
+        self.build("hashing", args, dimension=4)
+
+        vertex = ContentEmbeddingCache(path, "vertex")
+        assert len(vertex.get_many([vertex.key("TVA"), vertex.key("taxe foncière")])) == 2
+        assert len(vertex) == 6
+        vertex.close()
+
+        # Les vecteurs du modèle A sont resservis sans nouvel embedding
+        vectors, embedded = self.build("vertex", args, dimension=8)
+        assert embedded == 0
+        assert vectors.shape == (3, 8)
+
+    def test_purge_other_models_flag(self, args, path):
+        self.build("vertex", args, dimension=8)
+        args.purge_other_models = True
+        self.build("hashing", args, dimension=4)
+
+        cache = ContentEmbeddingCache(path, "hashing")
+        assert len(cache) == 3
+        cache.close()
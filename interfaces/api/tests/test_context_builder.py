@@ -0,0 +1,120 @@
+import pytest
+
+from app import context_builder, tokens
+from app.context_builder import EMPTY_CONTEXT, OMISSION_MARKER, Passage, build_context
+from app.tokens import count_tokens
+
+QUESTION = "Quel est le taux de la taxe foncière sur les propriétés bâties ?"
+
+FILLER = [
+    "Les collectivités territoriales votent chaque année leurs budgets.",
+    "Le contribuable peut consulter son avis dans son espace particulier.",
+    "La date limite de paiement figure en première page de l'avis.",
+    "Une majoration de dix pour cent s'applique en cas de retard.",
+    "Le paiement peut être mensualisé sur demande auprès du centre des finances publiques.",
+    "Les réclamations sont adressées au service des impôts des particuliers.",
+]
+RELEVANT = "Le taux de la taxe foncière sur les propriétés bâties est voté par la commune."
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Décompte estimé (caractères / 4) : pas de téléchargement d'encodage pendant les tests"""
+    monkeypatch.setattr(tokens, "_encoding", None)
+    monkeypatch.setattr(tokens, "_encoding_loaded", True)
+
+
+def passages(*contents):
+    return [Passage(citation=f"(source {number})", content=content) for number, content in enumerate(contents, 1)]
+
+
+class TestBuildContext:
+
+    @pytest.mark.parametrize("contents", [(), ("",), ("   ", "\n")])
+    def test_empty_input(self, contents):
+        context = build_context(QUESTION, passages(*contents), token_budget=100)
+        assert context.text == EMPTY_CONTEXT
+        assert context.passages == ()
+        assert context.tokens == count_tokens(EMPTY_CONTEXT)
+
+    def test_fits_in_budget(self):
+        """Un contexte qui tient dans le budget est envoyé tel quel, chaque passage avec sa citation"""
+        context = build_context(QUESTION, passages(RELEVANT, FILLER[0]), token_budget=1000)
+        assert context.text == f"Document 1 (source 1):\n{RELEVANT}\n\nDocument 2 (source 2):\n{FILLER[0]}"
+        assert not context.compressed
+        assert context.tokens == context.source_tokens == count_tokens(context.text)
+
+    def test_near_duplicates_kept_once(self):
+        """Le même extrait retrouvé dans deux bases (ou deux fenêtres qui se recouvrent) n'est gardé qu'une fois"""
+        text = " ".join(FILLER)
+        near_duplicate = text.replace("dix pour cent", "10 %") + " Voir aussi l'article 1406."
+        context = build_context(QUESTION, passages(text, RELEVANT, near_duplicate, text), token_budget=1000)
+        assert context.duplicates == 2
+        # La version la plus complète prend le rang du premier passage
+        assert [passage.index for passage in context.passages] == [2, 1]
+        assert context.text.count(FILLER[0]) == 1
+        assert "article 1406" in context.text
+
+    def test_distinct_passages_kept(self):
+        context = build_context(QUESTION, passages(*FILLER), token_budget=1000)
+        assert context.duplicates == 0
+        assert len(context.passages) == len(FILLER)
+
+    @pytest.mark.parametrize("budget", [40, 60, 90, 150])
+    def test_over_budget_stays_within_budget(self, budget):
+        """Au-delà du budget, le contexte est réduit et son décompte ne dépasse jamais le budget"""
+        contents = [" ".join(FILLER[:3]) + " " + RELEVANT, " ".join(FILLER[3:]), " ".join(reversed(FILLER))]
+        context = build_context(QUESTION, passages(*contents), token_budget=budget)
+        assert context.source_tokens > budget
+        assert context.tokens <= budget
+        assert context.tokens == count_tokens(context.text)
+        assert context.compressed
+
+    def test_most_relevant_sentence_kept(self):
+        """Les phrases gardées sont les plus pertinentes pour la question, avec la citation de leur passage"""
+        contents = [" ".join(FILLER), " ".join(FILLER[:2]) + " " + RELEVANT + " " + " ".join(FILLER[2:])]
+        context = build_context(QUESTION, passages(*contents), token_budget=60)
+        assert context.tokens <= 60
+        assert RELEVANT in context.text
+        assert "(source 2)" in context.text
+
+    def test_sentences_stay_in_text_order(self):
+        sentences = [RELEVANT] + FILLER + ["La taxe foncière est due par le propriétaire au 1er janvier."]
+        context = build_context(QUESTION, passages(" ".join(sentences)), token_budget=60)
+        body = context.passages[0].text
+        assert body.index(RELEVANT) < body.index("La taxe foncière est due")
+
+    def test_single_sentence_longer_than_budget_is_truncated(self):
+        """Une phrase plus longue que tout le budget est coupée entre deux mots, avec le marqueur"""
+        sentence = "La taxe foncière " + " ".join(["sur les propriétés bâties"] * 60) + "."
+        context = build_context(QUESTION, passages(sentence), token_budget=30)
+        assert context.tokens <= 30
+        assert context.text.endswith(OMISSION_MARKER)
+        assert context.passages[0].compressed
+
+    def test_single_remaining_sentence_over_budget(self, monkeypatch):
+        """La dernière phrase gardée qui dépasse encore le budget une fois assemblée est coupée, pas envoyée entière"""
+        # Décompte par morceaux sous-estimé : un passage réduit et assemblé coûte 20 tokens de plus que prévu
+        estimate = context_builder.count_tokens
+        monkeypatch.setattr(context_builder, "count_tokens",
+                            lambda text: estimate(text) + (20 if ":\n" in text and OMISSION_MARKER in text else 0))
+        sentence = "La taxe foncière " + " ".join(["sur les propriétés bâties"] * 6) + "."
+        context = build_context(QUESTION, passages(sentence + " " + " ".join(FILLER)), token_budget=60)
+        assert context.tokens <= 60
+        assert context.tokens == context_builder.count_tokens(context.text)
+        assert context.text.endswith(OMISSION_MARKER)
+        assert context.passages[0].text.startswith("La taxe foncière")
+
+    @pytest.mark.parametrize("budget", range(8, 80, 3))
+    def test_oversized_sentence_within_any_budget(self, budget):
+        """Une phrase unique plus longue que le budget ne le dépasse jamais, quel que soit le budget"""
+        sentence = "La taxe foncière " + " ".join(["sur les propriétés bâties"] * 20) + "."
+        context = build_context(QUESTION, passages(sentence, RELEVANT), token_budget=budget)
+        assert context.tokens <= budget or context.text == EMPTY_CONTEXT
+        assert context.tokens == count_tokens(context.text)
+
+    def test_zero_budget_keeps_everything(self):
+        contents = [" ".join(FILLER), RELEVANT]
+        context = build_context(QUESTION, passages(*contents), token_budget=0)
+        assert not context.compressed
+        assert all(content in context.text for content in contents)
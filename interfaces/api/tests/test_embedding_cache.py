@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app import embedding_cache
+from app.embedding_cache import CachedQueryEmbeddings, normalize_question
+
+
+class CountingEmbeddings(Embeddings):
+    """Modèle d'embedding déterministe qui compte ses appels"""
+
+    def __init__(self):
+        self.queries = []
+        self.documents = []
+
+    @staticmethod
+    def _vector(text):
+        return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.documents.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge du cache contrôlée par le test"""
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+    return now
+
+
+class TestNormalizeQuestion:
+
+    @pytest.mark.parametrize("text", [
+        "Quel est le taux de TVA ?",
+        "quel est le taux de tva",
+        "  Quel   est le\ttaux de TVA?!  ",
+        "QUEL EST LE TAUX DE TVA.",
+    ])
+    def test_equivalent_forms(self, text):
+        """Casse, espaces et ponctuation finale n'influent pas sur la clé"""
+        assert normalize_question(text) == "quel est le taux de tva"
+
+    def test_composed_accents(self):
+        """Accents composés et décomposés donnent la même clé"""
+        assert normalize_question("Taxe fonci\u00e8re") == normalize_question("Taxe fonci" "e\u0300re")
+
+    def test_keeps_meaningful_differences(self):
+        """Les accents et la ponctuation interne sont conservés"""
+        assert normalize_question("taux réduit") != normalize_question("taux reduit")
+        assert normalize_question("article 278-0 bis") == "article 278-0 bis"
+
+
+class TestCachedQueryEmbeddings:
+
+    def test_hit_on_normalized_question(self):
+        """Une question reformulée à la casse près ne rappelle pas le modèle"""
+        model = CountingEmbeddings()
+        cache = CachedQueryEmbeddings(model, "modele")
+
+        first = cache.embed_query("Taux de TVA ?")
+        second = cache.embed_query("taux de tva")
+
+        assert first == second
+        assert model.queries == ["Taux de TVA ?"]
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_returns_independent_copy(self):
+        """Modifier le vecteur renvoyé ne modifie pas le cache"""
+        cache = CachedQueryEmbeddings(CountingEmbeddings(), "modele")
+        vector = cache.embed_query("q")
+        vector[0] = -1.0
+
+        assert cache.embed_query("q")[0] != -1.0
+
+    def test_lru_eviction(self):
+        """Cache plein : la question la moins récemment utilisée est évincée"""
+        model = CountingEmbeddings()
+        cache = CachedQueryEmbeddings(model, "modele", max_entries=2)
+        cache.embed_query("a")
+        cache.embed_query("b")
+        cache.embed_query("a")
+        cache.embed_query("c")
+
+        cache.embed_query("a")
+        assert model.queries == ["a", "b", "c"]
+        cache.embed_query("b")
+        assert model.queries == ["a", "b", "c", "b"]
+        assert cache.stats()["evictions"] == 2
+
+    def test_ttl_expiry(self, clock):
+        """Un embedding plus ancien que la durée de vie est recalculé"""
+        model = CountingEmbeddings()
+        cache = CachedQueryEmbeddings(model, "modele", ttl_seconds=60)
+        cache.embed_query("q")
+
+        clock[0] += 59
+        cache.embed_query("q")
+        assert len(model.queries) == 1
+        clock[0] += 2
+        cache.embed_query("q")
+        assert len(model.queries) == 2
+
+    def test_embed_queries_only_embeds_misses(self):
+        """Lot de questions : un seul appel au modèle, limité aux questions absentes"""
+        model = CountingEmbeddings()
+        cache = CachedQueryEmbeddings(model, "modele")
+        cache.embed_query("a")
+
+        vectors = cache.embed_queries(["a", "b", "c"])
+
+        assert model.documents == [["b", "c"]]
+        assert vectors == [CountingEmbeddings._vector(t) for t in ("a", "b", "c")]
+        assert cache.embed_queries(["b", "c"]) == vectors[1:]
+        assert model.documents == [["b", "c"]]
+
+    def test_aembed_query(self):
+        """La version asynchrone partage le même cache"""
+        model = CountingEmbeddings()
+        cache = CachedQueryEmbeddings(model, "modele")
+
+        async def run():
+            return await cache.aembed_query("q"), await cache.aembed_query("Q ?")
+
+        first, second = asyncio.run(run())
+        assert first == second
+        assert model.queries == ["q"]
+
+    def test_persistence_round_trip(self, tmp_path):
+        """Les embeddings sauvegardés sont rechargés au démarrage suivant"""
+        path = str(tmp_path / "cache.npz")
+        cache = CachedQueryEmbeddings(CountingEmbeddings(), "modele", persist_path=path)
+        expected = {text: cache.embed_query(text) for text in ("a", "bb", "ccc")}
+        cache.save()
+
+        model = CountingEmbeddings()
+        reloaded = CachedQueryEmbeddings(model, "modele", persist_path=path)
+
+        assert reloaded.stats()["size"] == 3
+        for text, vector in expected.items():
+            assert reloaded.embed_query(text) == pytest.approx(vector)
+        assert model.queries == []
+
+    def test_persistence_ignores_other_model(self, tmp_path):
+        """Un fichier écrit avec un autre modèle n'est pas rechargé"""
+        path = str(tmp_path / "cache.npz")
+        cache = CachedQueryEmbeddings(CountingEmbeddings(), "ancien", persist_path=path)
+        cache.embed_query("q")
+        cache.save()
+
+        reloaded = CachedQueryEmbeddings(CountingEmbeddings(), "nouveau", persist_path=path)
+        assert reloaded.stats()["size"] == 0
+
+    def test_persistence_skips_expired(self, tmp_path, clock):
+        """Les entrées expirées ne sont pas rechargées"""
+        path = str(tmp_path / "cache.npz")
+        cache = CachedQueryEmbeddings(CountingEmbeddings(), "modele", ttl_seconds=60, persist_path=path)
+        cache.embed_query("ancienne")
+        clock[0] += 50
+        cache.embed_query("récente")
+        cache.save()
+
+        clock[0] += 20
+        reloaded = CachedQueryEmbeddings(CountingEmbeddings(), "modele", ttl_seconds=60, persist_path=path)
+        assert reloaded.stats()["size"] == 1
+
+    def test_persist_every(self, tmp_path):
+        """Le fichier est écrit automatiquement toutes les persist_every nouvelles entrées"""
+        path = tmp_path / "cache.npz"
+        cache = CachedQueryEmbeddings(CountingEmbeddings(), "modele", persist_path=str(path), persist_every=2)
+        cache.embed_query("a")
+        assert not path.exists()
+        cache.embed_query("b")
+        assert path.exists()
+
+    def test_corrupted_file_is_ignored(self, tmp_path):
+        """Un fichier de persistance illisible ne bloque pas le démarrage"""
+        path = tmp_path / "cache.npz"
+        path.write_bytes(b"pas un fichier npz")
+
+        cache = CachedQueryEmbeddings(CountingEmbeddings(), "modele", persist_path=str(path))
+        assert cache.stats()["size"] == 0
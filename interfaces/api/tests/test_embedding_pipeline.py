@@ -0,0 +1,106 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.embedding_pipeline import PROGRESS_FILE, VECTORS_FILE, corpus_fingerprint, embed_corpus
+
+TEXTS = [f"Article {number} du code général des impôts" for number in range(10)]
+
+
+class Embeddings:
+    """Embedding déterministe qui compte les textes vectorisés et peut échouer sur un texte donné"""
+
+    def __init__(self, fail_on=None):
+        self.embedded = []
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        if self.fail_on in texts:
+            raise RuntimeError("Connexion interrompue")
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(TEXTS.index(text)) if text in TEXTS else -1.0] for text in texts]
+
+
+def documents(texts=TEXTS):
+    return [Document(page_content=text) for text in texts]
+
+
+def build(embeddings, work_dir, texts=TEXTS, model_name="model"):
+    # Un seul lot à la fois : l'interruption survient toujours après les mêmes lots
+    return embed_corpus(documents(texts), embeddings, str(work_dir), model_name=model_name,
+                        batch_size=3, concurrency=1, max_retries=0, checkpoint_every=1)
+
+
+def expected(texts=TEXTS):
+    return np.array(Embeddings().embed_documents(texts), dtype=np.float32)
+
+
+class TestEmbedCorpus:
+
+    def test_vectors_in_document_order(self, tmp_path):
+        embeddings = Embeddings()
+        vectors = build(embeddings, tmp_path)
+        np.testing.assert_array_equal(vectors, expected())
+        assert sorted(embeddings.embedded) == sorted(TEXTS)
+
+    def test_empty_corpus(self, tmp_path):
+        with pytest.raises(ValueError):
+            build(Embeddings(), tmp_path, texts=[])
+
+    def test_resume_skips_finished_batches(self, tmp_path):
+        """Après une interruption, seuls les lots non terminés sont vectorisés à nouveau"""
+        interrupted = Embeddings(fail_on=TEXTS[7])
+        with pytest.raises(RuntimeError):
+            build(interrupted, tmp_path)
+        with open(tmp_path / PROGRESS_FILE, encoding="utf-8") as f:
+            assert json.load(f)["completed_batches"] == [0, 1]
+
+        resumed = Embeddings()
+        vectors = build(resumed, tmp_path)
+        assert resumed.embedded == TEXTS[6:]
+        np.testing.assert_array_equal(vectors, expected())
+
+    def test_completed_checkpoint_embeds_nothing(self, tmp_path):
+        build(Embeddings(), tmp_path)
+        again = Embeddings()
+        np.testing.assert_array_equal(build(again, tmp_path), expected())
+        assert again.embedded == []
+
+    @pytest.mark.parametrize("change", ["corpus", "model"])
+    def test_changed_fingerprint_restarts(self, tmp_path, caplog, change):
+        """Un corpus ou un modèle différent repart de zéro au lieu de reprendre des vecteurs périmés"""
+        with pytest.raises(RuntimeError):
+            build(Embeddings(fail_on=TEXTS[7]), tmp_path)
+
+        texts, model_name = TEXTS, "model"
+        if change == "corpus":
+            texts = TEXTS[:4] + ["Article 4 modifié par la loi de finances"] + TEXTS[5:]
+        else:
+            model_name = "other-model"
+        restarted = Embeddings()
+        vectors = build(restarted, tmp_path, texts=texts, model_name=model_name)
+
+        assert "ignoré" in caplog.text
+        assert restarted.embedded == texts
+        np.testing.assert_array_equal(vectors, expected(texts))
+        with open(tmp_path / PROGRESS_FILE, encoding="utf-8") as f:
+            assert json.load(f)["fingerprint"] == corpus_fingerprint(texts, model_name, 3)
+        assert os.path.exists(tmp_path / VECTORS_FILE)
+
+
+class TestCorpusFingerprint:
+
+    def test_stable(self):
+        assert corpus_fingerprint(TEXTS, "model", 3) == corpus_fingerprint(list(TEXTS), "model", 3)
+
+    @pytest.mark.parametrize("texts, model_name, batch_size", [
+        (TEXTS[:-1], "model", 3),
+        (TEXTS[::-1], "model", 3),
+        (TEXTS, "other-model", 3),
+        (TEXTS, "model", 4),
+    ])
+    def test_changes_with_work(self, texts, model_name, batch_size):
+        assert corpus_fingerprint(texts, model_name, batch_size) != corpus_fingerprint(TEXTS, "model", 3)
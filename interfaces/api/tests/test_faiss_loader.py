@@ -0,0 +1,49 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app import faiss_loader
+from app.faiss_loader import batch_search_supported, search_by_vectors
+
+TEXTS = ["taux de TVA", "impôt sur le revenu", "taxe foncière", "droits de succession"]
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=8)
+
+
+@pytest.fixture(params=[False, True], ids=["l2", "normalized"])
+def store(request, embeddings):
+    return FAISS.from_texts(TEXTS, embeddings, normalize_L2=request.param)
+
+
+class TestSearchByVectors:
+
+    def test_matches_search_by_vector(self, store, embeddings):
+        """Chaque ligne du lot donne le même résultat que la recherche LangChain d'un seul vecteur"""
+        vectors = [embeddings.embed_query(text) for text in ["TVA", "revenu", "succession"]]
+        results = search_by_vectors(store, vectors, k=2)
+        for vector, result in zip(vectors, results):
+            expected = store.similarity_search_with_score_by_vector(vector, k=2)
+            assert [doc.page_content for doc, _ in result] == [doc.page_content for doc, _ in expected]
+            assert [score for _, score in result] == pytest.approx([float(score) for _, score in expected])
+
+    def test_k_larger_than_store(self, store, embeddings):
+        """Les positions -1 renvoyées par FAISS sont ignorées"""
+        results = search_by_vectors(store, [embeddings.embed_query("TVA")], k=10)
+        assert len(results[0]) == len(TEXTS)
+
+
+class TestBatchSearchSupported:
+
+    def test_supported_store(self, store):
+        assert batch_search_supported(store)
+
+    def test_other_store(self):
+        assert not batch_search_supported(object())
+
+    def test_unverified_version(self, store, monkeypatch):
+        """Une version de langchain-community non vérifiée repasse par la recherche question par question"""
+        monkeypatch.setattr(faiss_loader, "LANGCHAIN_COMMUNITY_VERSION", "1.0.0")
+        assert not batch_search_supported(store)
@@ -0,0 +1,167 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.faiss_loader import configure_search
+from app.index_builder import (INDEX_TYPES, MIN_POINTS_PER_CENTROID, build_faiss_index, default_nlist,
+                               index_parameters, save_store)
+from app.sqlite_docstore import SQLiteDocstore
+
+DIMENSION = 32
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).standard_normal((600, DIMENSION)).astype(np.float32)
+
+
+def self_recall(index, vectors):
+    """Part des vecteurs dont le plus proche voisin est eux-mêmes"""
+    _, positions = index.search(vectors, 1)
+    return float(np.mean(positions[:, 0] == np.arange(len(vectors))))
+
+
+class TestBuildFaissIndex:
+
+    @pytest.mark.parametrize("index_type, options, min_recall", [
+        ("flat", {}, 1.0),
+        ("hnsw", {"hnsw_m": 16}, 0.95),
+        ("ivf_flat", {"nlist": 8}, 1.0),
+        ("ivf_pq", {"nlist": 8, "pq_m": 8, "pq_nbits": 8}, 0.9),
+    ])
+    def test_self_query_recall(self, vectors, index_type, options, min_recall):
+        """Chaque vecteur de l'index se retrouve lui-même (toutes les listes IVF parcourues)"""
+        index = build_faiss_index(vectors, index_type, **options)
+        assert index.ntotal == len(vectors)
+        assert index.d == DIMENSION
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            assert ivf.nlist == options["nlist"]
+            ivf.nprobe = ivf.nlist
+        assert self_recall(index, vectors) >= min_recall
+
+    def test_default_nlist_used(self, vectors):
+        index = build_faiss_index(vectors, "ivf_flat")
+        assert faiss.extract_index_ivf(index).nlist == default_nlist(len(vectors))
+
+    def test_train_size_sample(self, vectors):
+        index = build_faiss_index(vectors, "ivf_flat", nlist=4, train_size=200)
+        assert index.is_trained
+        assert index.ntotal == len(vectors)
+
+    def test_unknown_type(self, vectors):
+        with pytest.raises(ValueError, match="inconnu"):
+            build_faiss_index(vectors, "lsh")
+
+    @pytest.mark.parametrize("options, message", [
+        ({"pq_m": 5}, "divisible"),
+        ({"pq_m": 8, "pq_nbits": 10}, "au moins 1024"),
+    ])
+    def test_ivf_pq_constraints(self, vectors, options, message):
+        with pytest.raises(ValueError, match=message):
+            build_faiss_index(vectors, "ivf_pq", nlist=4, **options)
+
+    def test_index_types(self):
+        assert INDEX_TYPES == ("flat", "hnsw", "ivf_flat", "ivf_pq")
+
+
+class TestDefaultNlist:
+
+    @pytest.mark.parametrize("n_vectors, expected", [
+        (0, 1),
+        (10, 1),
+        (MIN_POINTS_PER_CENTROID * 5, 5),
+        (10_000, 256),
+        (1_000_000, 4000),
+    ])
+    def test_values(self, n_vectors, expected):
+        """~4·√n, sans descendre sous MIN_POINTS_PER_CENTROID points par liste ni sous une liste"""
+        assert default_nlist(n_vectors) == expected
+
+
+class TestConfigureSearch:
+
+    @pytest.fixture(autouse=True)
+    def clean_environment(self, monkeypatch):
+        for name in ("FAISS_NPROBE", "FAISS_NPROBE_BOFIP", "FAISS_EF_SEARCH", "FAISS_EF_SEARCH_BOFIP"):
+            monkeypatch.delenv(name, raising=False)
+
+    @pytest.fixture
+    def ivf(self, vectors):
+        return build_faiss_index(vectors, "ivf_flat", nlist=8)
+
+    @pytest.fixture
+    def hnsw(self, vectors):
+        return build_faiss_index(vectors[:100], "hnsw", hnsw_m=8)
+
+    def test_defaults_unchanged(self, ivf, hnsw):
+        configure_search(ivf, "bofip")
+        configure_search(hnsw, "bofip")
+        assert index_parameters(ivf)["nprobe"] == 1
+        assert index_parameters(hnsw)["ef_search"] == faiss.IndexHNSWFlat(DIMENSION, 8).hnsw.efSearch
+
+    def test_global_settings(self, ivf, hnsw, monkeypatch):
+        monkeypatch.setenv("FAISS_NPROBE", "4")
+        monkeypatch.setenv("FAISS_EF_SEARCH", "64")
+        configure_search(ivf, "cgi")
+        configure_search(hnsw, "cgi")
+        assert index_parameters(ivf) == {"nlist": 8, "nprobe": 4}
+        assert index_parameters(hnsw)["ef_search"] == 64
+
+    def test_store_override(self, vectors, monkeypatch):
+        """FAISS_NPROBE_BOFIP ne s'applique qu'au store bofip, les autres gardent FAISS_NPROBE"""
+        monkeypatch.setenv("FAISS_NPROBE", "2")
+        monkeypatch.setenv("FAISS_NPROBE_BOFIP", "6")
+        monkeypatch.setenv("FAISS_EF_SEARCH", "32")
+        monkeypatch.setenv("FAISS_EF_SEARCH_BOFIP", "128")
+        settings = {}
+        for store_name in ("bofip", "cgi"):
+            ivf = build_faiss_index(vectors, "ivf_flat", nlist=8)
+            hnsw = build_faiss_index(vectors[:100], "hnsw", hnsw_m=8)
+            configure_search(ivf, store_name)
+            configure_search(hnsw, store_name)
+            settings[store_name] = (index_parameters(ivf)["nprobe"], index_parameters(hnsw)["ef_search"])
+        assert settings == {"bofip": (6, 128), "cgi": (2, 32)}
+
+    def test_nprobe_capped_at_nlist(self, ivf, monkeypatch):
+        monkeypatch.setenv("FAISS_NPROBE", "100")
+        configure_search(ivf, "cgi")
+        assert index_parameters(ivf)["nprobe"] == 8
+
+    def test_flat_index_ignored(self, vectors, monkeypatch):
+        monkeypatch.setenv("FAISS_NPROBE", "4")
+        monkeypatch.setenv("FAISS_EF_SEARCH", "64")
+        index = build_faiss_index(vectors, "flat")
+        configure_search(index, "cgi")
+        assert index_parameters(index) == {}
+
+
+class TestSaveStore:
+
+    def documents(self, count):
+        return [(f"id-{position}", Document(page_content=f"Document {position}", metadata={"position": position}))
+                for position in range(count)]
+
+    def test_writes_index_and_docstore(self, tmp_path, vectors):
+        index = build_faiss_index(vectors[:10])
+        save_store(str(tmp_path), index, self.documents(10))
+        assert sorted(os.listdir(tmp_path)) == ["docstore.sqlite", "index.faiss"]
+        assert faiss.read_index(str(tmp_path / "index.faiss")).ntotal == 10
+        docstore = SQLiteDocstore(str(tmp_path / "docstore.sqlite"))
+        assert docstore.index_to_docstore_id()[9] == "id-9"
+        docstore.close()
+
+    def test_removes_stale_pickle(self, tmp_path, vectors):
+        """Un ancien index.pkl ne correspondrait plus au nouvel index : il est supprimé"""
+        (tmp_path / "index.pkl").write_bytes(b"ancien docstore")
+        save_store(str(tmp_path), build_faiss_index(vectors[:5]), self.documents(5))
+        assert not (tmp_path / "index.pkl").exists()
+        assert (tmp_path / "docstore.sqlite").exists()
+
+    def test_count_mismatch(self, tmp_path, vectors):
+        with pytest.raises(ValueError):
+            save_store(str(tmp_path), build_faiss_index(vectors[:5]), self.documents(4))
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import rag_predictor
+
+QUESTION = "Quel est le taux normal de la taxe sur la valeur ajoutée ?"
+
+
+@pytest.fixture
+def starting_chatbot(api, monkeypatch):
+    """Chatbot pas encore chargé (aucun vector store, aucune chaîne), installé à la place de celui de l'API"""
+    chatbot = rag_predictor.FiscalChatbot()
+    monkeypatch.setattr(rag_predictor, "chatbot", chatbot)
+    monkeypatch.setattr(api, "chatbot", chatbot)
+    # ensure_ready n'est pas neutralisé : c'est lui qui est testé
+    api.app.dependency_overrides.clear()
+    return chatbot
+
+
+@pytest.fixture
+def blocked_load(loaded_chatbot, monkeypatch):
+    """Chargement en arrière-plan qui attend d'être libéré par le test"""
+    release = threading.Event()
+    loaded_chatbot.status = "starting"
+
+    def load():
+        loaded_chatbot.status = "loading"
+        release.wait(timeout=5)
+
+    monkeypatch.setattr(loaded_chatbot, "load", load)
+    return release
+
+
+def wait_ready(client, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200:
+            return response
+        time.sleep(0.01)
+    pytest.fail("Le chatbot n'est pas devenu prêt")
+
+
+class TestReadiness:
+
+    def test_not_ready_before_loading(self, client, starting_chatbot):
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert response.json()["status"] == "starting"
+        assert client.get("/health").status_code == 200
+
+    def test_ready_after_background_loading(self, api, blocked_load):
+        """/ready renvoie 503 pendant le chargement lancé par le cycle de vie, puis 200"""
+        api.app.dependency_overrides.clear()
+        with TestClient(api.app) as client:
+            loading = client.get("/ready")
+            assert loading.status_code == 503
+            assert loading.json()["status"] == "loading"
+            assert client.get("/health").status_code == 200
+
+            blocked_load.set()
+            ready = wait_ready(client).json()
+            assert ready["status"] == "ready"
+            assert ready["stores"] == ["cgi"]
+            assert ready["error"] is None
+
+            assert client.post("/ask", json={"question": QUESTION}).status_code == 200
+
+    def test_failed_loading(self, api, starting_chatbot, monkeypatch):
+        def load():
+            raise FileNotFoundError("index.faiss introuvable")
+
+        monkeypatch.setattr(starting_chatbot, "load", load)
+        with TestClient(api.app) as client:
+            deadline = time.monotonic() + 5
+            while starting_chatbot.status != "failed" and time.monotonic() < deadline:
+                time.sleep(0.01)
+            response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "failed"
+        assert "index.faiss introuvable" in response.json()["error"]
+
+
+class TestRequestsWhileLoading:
+
+    @pytest.fixture
+    def calls(self, starting_chatbot, monkeypatch):
+        """Appels au chatbot à moitié initialisé, qui échoueraient s'ils avaient lieu"""
+        calls = []
+
+        async def generate_answer(question):
+            calls.append(question)
+            raise AttributeError("'NoneType' object has no attribute 'ainvoke'")
+
+        monkeypatch.setattr(starting_chatbot, "generate_answer", generate_answer)
+        monkeypatch.setattr(starting_chatbot, "generate_answers", generate_answer)
+        monkeypatch.setattr(starting_chatbot, "stream_answer", generate_answer)
+        starting_chatbot.status = "loading"
+        return calls
+
+    @pytest.mark.parametrize("method, path, body", [
+        ("POST", "/ask", {"question": QUESTION}),
+        ("POST", "/ask/stream", {"question": QUESTION}),
+        ("POST", "/ask/batch", {"questions": [QUESTION]}),
+        ("GET", "/ask/inconnu/reasoning", None),
+        ("GET", "/admin/stores", None),
+        ("GET", "/admin/stores/cgi/metadata", None),
+    ])
+    def test_rejected_with_503(self, client, calls, method, path, body):
+        """Pendant le chargement, les requêtes sont refusées (503) sans atteindre le chatbot"""
+        response = client.request(method, path, json=body)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert "loading" in response.json()["detail"]
+        assert calls == []
@@ -0,0 +1,220 @@
+import asyncio
+
+import pytest
+
+from app import reasoning_store
+from app.reasoning_store import ReasoningStore
+
+
+class Generator:
+    """Génération de raisonnement qui compte ses appels et attend d'être libérée par le test"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+        self.release = None
+
+    async def __call__(self, question, context):
+        self.calls.append((question, context))
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return f"Raisonnement pour « {question} »"
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+async def settle():
+    """Laisse la boucle traiter les générations terminées et les annulations en cours"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge du magasin contrôlée par le test"""
+    now = [1000.0]
+    monkeypatch.setattr(reasoning_store.time, "time", lambda: now[0])
+    return now
+
+
+class TestReasoningStore:
+
+    def test_unknown_response(self):
+        async def scenario():
+            store = ReasoningStore()
+            return store, await store.reasoning("inconnu", Generator())
+
+        store, reasoning = run(scenario)
+        assert reasoning is None
+        assert store.stats()["not_found"] == 1
+        assert "inconnu" not in store
+
+    def test_generated_once_then_served(self):
+        """Le raisonnement est généré au premier appel puis resservi sans nouvelle génération"""
+        async def scenario():
+            store, generator = ReasoningStore(), Generator()
+            generator.release = asyncio.Event()
+            generator.release.set()
+            response_id = store.register("Taux de TVA ?", "Document 1 : 20 %")
+            first = await store.reasoning(response_id, generator)
+            second = await store.reasoning(response_id, generator)
+            return store, generator, first, second
+
+        store, generator, first, second = run(scenario)
+        assert generator.calls == [("Taux de TVA ?", "Document 1 : 20 %")]
+        assert first == second == "Raisonnement pour « Taux de TVA ? »"
+        stats = store.stats()
+        assert (stats["generated"], stats["hits"], stats["misses"]) == (1, 1, 1)
+        assert stats["hit_ratio"] == pytest.approx(0.5)
+
+    def test_concurrent_requests_share_one_generation(self):
+        async def scenario():
+            store, generator = ReasoningStore(), Generator()
+            generator.release = asyncio.Event()
+            response_id = store.register("Taux de TVA ?", "contexte")
+            tasks = [asyncio.create_task(store.reasoning(response_id, generator)) for _ in range(4)]
+            await settle()
+            generator.release.set()
+            return store, generator, await asyncio.gather(*tasks)
+
+        store, generator, reasonings = run(scenario)
+        assert len(generator.calls) == 1
+        assert len(set(reasonings)) == 1
+        assert store.stats()["generated"] == 1
+
+    def test_client_cancellation_does_not_stop_generation(self):
+        """shield : le départ d'un client n'interrompt ni la génération ni les autres clients"""
+        async def scenario():
+            store, generator = ReasoningStore(), Generator()
+            generator.release = asyncio.Event()
+            response_id = store.register("Taux de TVA ?", "contexte")
+            leaving = asyncio.create_task(store.reasoning(response_id, generator))
+            staying = asyncio.create_task(store.reasoning(response_id, generator))
+            await settle()
+            leaving.cancel()
+            await settle()
+            generator.release.set()
+            return generator, leaving, await staying
+
+        generator, leaving, reasoning = run(scenario)
+        assert leaving.cancelled()
+        assert len(generator.calls) == 1
+        assert reasoning == "Raisonnement pour « Taux de TVA ? »"
+
+    def test_generation_completes_after_every_client_left(self):
+        """La génération abandonnée par tous les clients est tout de même conservée"""
+        async def scenario():
+            store, generator = ReasoningStore(), Generator()
+            generator.release = asyncio.Event()
+            response_id = store.register("Taux de TVA ?", "contexte")
+            client = asyncio.create_task(store.reasoning(response_id, generator))
+            await settle()
+            client.cancel()
+            generator.release.set()
+            await settle()
+            return store, generator, await store.reasoning(response_id, generator)
+
+        store, generator, reasoning = run(scenario)
+        assert len(generator.calls) == 1
+        assert reasoning == "Raisonnement pour « Taux de TVA ? »"
+        assert store.stats()["hits"] == 1
+
+    def test_failed_generation_is_retried(self):
+        """Une erreur atteint tous les clients en attente ; l'appel suivant relance la génération"""
+        async def scenario():
+            store, generator = ReasoningStore(), Generator(error=RuntimeError("LLM indisponible"))
+            generator.release = asyncio.Event()
+            response_id = store.register("Taux de TVA ?", "contexte")
+            tasks = [asyncio.create_task(store.reasoning(response_id, generator)) for _ in range(2)]
+            await settle()
+            generator.release.set()
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+            generator.error = None
+            return store, generator, outcomes, await store.reasoning(response_id, generator)
+
+        store, generator, outcomes, reasoning = run(scenario)
+        assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+        assert len(generator.calls) == 2
+        assert reasoning == "Raisonnement pour « Taux de TVA ? »"
+        assert store.stats()["generated"] == 1
+
+    def test_context_dropped_once_generated(self):
+        async def scenario():
+            store, generator = ReasoningStore(), Generator()
+            generator.release = asyncio.Event()
+            generator.release.set()
+            response_id = store.register("Taux de TVA ?", "contexte volumineux")
+            await store.reasoning(response_id, generator)
+            return store._entries[response_id]
+
+        assert run(scenario)["context"] is None
+
+    def test_ttl_expiry(self, clock):
+        """Au-delà de ttl_seconds, l'identifiant est inconnu (404 côté API)"""
+        async def scenario():
+            store, generator = ReasoningStore(ttl_seconds=60), Generator()
+            generator.release = asyncio.Event()
+            generator.release.set()
+            response_id = store.register("Taux de TVA ?", "contexte")
+            clock[0] += 59
+            within = await store.reasoning(response_id, generator)
+            clock[0] += 2
+            expired = await store.reasoning(response_id, generator)
+            return store, within, expired
+
+        store, within, expired = run(scenario)
+        assert within is not None
+        assert expired is None
+        stats = store.stats()
+        assert (stats["size"], stats["evictions"], stats["not_found"]) == (0, 1, 1)
+
+    def test_lru_eviction(self):
+        store = ReasoningStore(max_entries=2)
+        first = store.register("première", "contexte")
+        second = store.register("deuxième", "contexte")
+        # Une consultation rend l'entrée la plus récente
+        assert first in store
+        third = store.register("troisième", "contexte")
+        assert first in store and third in store
+        assert second not in store
+        assert store.stats()["evictions"] == 1
+
+
+class TestReasoningEndpoint:
+
+    @pytest.fixture
+    def chain(self, api, monkeypatch):
+        """Chaîne de raisonnement du chatbot remplacée par une réponse immédiate"""
+        class Chain:
+            def __init__(self):
+                self.calls = []
+
+            async def ainvoke(self, inputs):
+                self.calls.append(inputs)
+                return f"Raisonnement : {inputs['context']}"
+
+        chain = Chain()
+        monkeypatch.setattr(api.chatbot, "reasoning_chain", chain, raising=False)
+        return chain
+
+    def test_unknown_response_is_404(self, client):
+        response = client.get("/ask/inconnu/reasoning")
+        assert response.status_code == 404
+        assert "inconnu" in response.json()["detail"]
+
+    def test_expired_response_is_404(self, api, client, clock):
+        response_id = api.chatbot.reasoning_store.register("Taux de TVA ?", "Document 1")
+        clock[0] += api.chatbot.reasoning_store.ttl_seconds + 1
+        assert client.get(f"/ask/{response_id}/reasoning").status_code == 404
+
+    def test_generated_on_demand(self, api, client, chain):
+        response_id = api.chatbot.reasoning_store.register("Taux de TVA ?", "Document 1")
+        first = client.get(f"/ask/{response_id}/reasoning")
+        second = client.get(f"/ask/{response_id}/reasoning")
+        assert first.status_code == second.status_code == 200
+        assert first.json()["reasoning"] == second.json()["reasoning"] == "Raisonnement : Document 1"
+        assert first.json()["response_id"] == response_id
+        assert chain.calls == [{"question": "Taux de TVA ?", "context": "Document 1"}]
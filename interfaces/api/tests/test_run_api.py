@@ -0,0 +1,83 @@
+import faiss
+import numpy as np
+import pytest
+
+from app import faiss_loader
+from app.faiss_loader import STORE_NAMES, header_supports_mmap, read_index_header
+from run_api import check_vector_stores
+
+DIMENSION = 8
+
+
+def write_store(path, index, docstore="docstore.sqlite"):
+    path.mkdir(parents=True)
+    faiss.write_index(index, str(path / "index.faiss"))
+    (path / docstore).write_bytes(b"")
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).random((200, DIMENSION), dtype=np.float32)
+
+
+def flat(vectors):
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    return index
+
+
+def ivf(vectors):
+    index = faiss.IndexIVFFlat(faiss.IndexFlatL2(DIMENSION), DIMENSION, 4)
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+class TestReadIndexHeader:
+
+    @pytest.mark.parametrize("build, fourcc, mmap", [(flat, "IxF2", False), (ivf, "IwFl", True)])
+    def test_header(self, tmp_path, vectors, build, fourcc, mmap):
+        path = str(tmp_path / "index.faiss")
+        faiss.write_index(build(vectors), path)
+        assert read_index_header(path) == (fourcc, DIMENSION, len(vectors))
+        assert header_supports_mmap(fourcc) is mmap
+
+    @pytest.mark.parametrize("content", [b"", b"IxF2", b"\xff\xfe\x00\x01" + bytes(12), b"pas un index faiss du tout"])
+    def test_invalid_file(self, tmp_path, content):
+        path = tmp_path / "index.faiss"
+        path.write_bytes(content)
+        with pytest.raises(ValueError):
+            read_index_header(str(path))
+
+
+class TestCheckVectorStores:
+
+    @pytest.fixture
+    def stores(self, tmp_path, vectors, monkeypatch):
+        for name in STORE_NAMES:
+            write_store(tmp_path / name, flat(vectors))
+
+        # La vérification ne doit jamais charger un index (l'API le charge ensuite)
+        def no_read(*args, **kwargs):
+            raise AssertionError("index chargé par la vérification")
+
+        monkeypatch.setattr(faiss, "read_index", no_read)
+        monkeypatch.setattr(faiss_loader, "read_faiss_index", no_read)
+        return tmp_path
+
+    @pytest.mark.parametrize("mode", ["memory", "mmap"])
+    def test_valid_stores_checked_without_loading(self, stores, mode):
+        assert check_vector_stores(mode, base_path=str(stores))
+
+    def test_missing_store(self, stores):
+        (stores / STORE_NAMES[0] / "index.faiss").unlink()
+        assert not check_vector_stores("memory", base_path=str(stores))
+
+    def test_corrupted_index(self, stores):
+        (stores / STORE_NAMES[0] / "index.faiss").write_bytes(b"corrompu")
+        assert not check_vector_stores("memory", base_path=str(stores))
+
+    def test_uses_app_vector_stores_path(self):
+        """Par défaut, le lanceur vérifie le répertoire servi par l'API (VECTOR_STORES_PATH)"""
+        from app import rag_predictor
+        assert check_vector_stores.__defaults__[1] == faiss_loader.VECTOR_STORES_PATH == rag_predictor.BASE_PATH
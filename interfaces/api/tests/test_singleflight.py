@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+class Factory:
+    """Calcul asynchrone qui compte ses appels et attend d'être libéré par le test"""
+
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.result = result if result is not None else {"answer": "réponse", "sources": ["BOFiP"]}
+        self.error = error
+        self.release = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def run(coroutine_function):
+    return asyncio.run(coroutine_function())
+
+
+async def started(flight, factory, count, key="question"):
+    """Lance count appels concurrents et attend que tous soient en cours"""
+    factory.release = asyncio.Event()
+    tasks = [asyncio.create_task(flight.do(key, factory)) for _ in range(count)]
+    await asyncio.sleep(0)
+    return tasks
+
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_one_computation(self):
+        """N appels concurrents de même clé : un seul appel à factory, tous reçoivent le résultat"""
+        async def scenario():
+            flight, factory = SingleFlight(), Factory()
+            tasks = await started(flight, factory, 5)
+            assert flight.stats()["in_flight"] == 1
+            factory.release.set()
+            results = await asyncio.gather(*tasks)
+            return flight, factory, results
+
+        flight, factory, results = run(scenario)
+        assert factory.calls == 1
+        assert [coalesced for _, coalesced in results] == [False, True, True, True, True]
+        assert all(result == factory.result for result, _ in results)
+        stats = flight.stats()
+        assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 4, 0)
+        assert stats["coalesced_ratio"] == pytest.approx(0.8)
+
+    def test_distinct_keys_are_not_coalesced(self):
+        async def scenario():
+            flight, factory = SingleFlight(), Factory()
+            factory.release = asyncio.Event()
+            tasks = [asyncio.create_task(flight.do(key, factory)) for key in ("a", "b")]
+            await asyncio.sleep(0)
+            factory.release.set()
+            return factory, await asyncio.gather(*tasks)
+
+        factory, results = run(scenario)
+        assert factory.calls == 2
+        assert [coalesced for _, coalesced in results] == [False, False]
+
+    def test_followers_receive_independent_copies(self):
+        """Modifier le résultat d'un appel n'affecte ni les autres appels ni le résultat du calcul"""
+        async def scenario():
+            flight, factory = SingleFlight(), Factory()
+            tasks = await started(flight, factory, 3)
+            factory.release.set()
+            return factory, [result for result, _ in await asyncio.gather(*tasks)]
+
+        factory, (leader, first, second) = run(scenario)
+        assert leader is factory.result
+        assert first is not leader and second is not first
+        first["sources"].append("CGI")
+        assert leader["sources"] == ["BOFiP"]
+        assert second["sources"] == ["BOFiP"]
+
+    def test_leader_exception_reaches_every_follower(self):
+        async def scenario():
+            flight, factory = SingleFlight(), Factory(error=ValueError("LLM indisponible"))
+            tasks = await started(flight, factory, 4)
+            factory.release.set()
+            return flight, factory, await asyncio.gather(*tasks, return_exceptions=True)
+
+        flight, factory, outcomes = run(scenario)
+        assert factory.calls == 1
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        assert all(str(outcome) == "LLM indisponible" for outcome in outcomes)
+        assert flight.stats()["in_flight"] == 0
+
+    def test_cancelled_leader_hands_over_to_a_follower(self):
+        """L'annulation du premier appel ne laisse pas les appels en attente bloqués"""
+        async def scenario():
+            flight, factory = SingleFlight(), Factory()
+            leader, *followers = await started(flight, factory, 3)
+            leader.cancel()
+            # Attend qu'un appel en attente ait repris le calcul
+            while factory.calls < 2:
+                await asyncio.sleep(0)
+            factory.release.set()
+            results = await asyncio.wait_for(asyncio.gather(*followers), timeout=1)
+            return flight, factory, leader, results
+
+        flight, factory, leader, results = run(scenario)
+        assert leader.cancelled()
+        # Un des appels en attente a repris le calcul, l'autre a partagé son résultat
+        assert factory.calls == 2
+        assert sorted(coalesced for _, coalesced in results) == [False, True]
+        assert all(result == factory.result for result, _ in results)
+        stats = flight.stats()
+        assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (2, 1, 0)
+
+    def test_cancelled_follower_does_not_cancel_computation(self):
+        async def scenario():
+            flight, factory = SingleFlight(), Factory()
+            leader, follower = await started(flight, factory, 2)
+            follower.cancel()
+            await asyncio.sleep(0)
+            factory.release.set()
+            return flight, factory, await leader, follower
+
+        flight, factory, (result, coalesced), follower = run(scenario)
+        assert follower.cancelled()
+        assert factory.calls == 1
+        assert (result, coalesced) == (factory.result, False)
+        assert flight.stats()["in_flight"] == 0
+
+    def test_key_is_released_after_completion(self):
+        """Un appel après la fin du calcul relance factory"""
+        async def scenario():
+            flight, factory = SingleFlight(), Factory()
+            factory.release = asyncio.Event()
+            factory.release.set()
+            first = await flight.do("question", factory)
+            second = await flight.do("question", factory)
+            return flight, factory, first, second
+
+        flight, factory, first, second = run(scenario)
+        assert factory.calls == 2
+        assert first[1] is False and second[1] is False
+        assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,181 @@
+import logging
+import pickle
+import threading
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.faiss_loader import load_faiss_store
+from app.sqlite_docstore import (SQLITE_DOCSTORE_FILE, SQLiteDocstore, convert_pickle_docstore,
+                                 write_sqlite_docstore)
+
+DIMENSION = 8
+DOCUMENTS = [
+    ("id-tva", Document(page_content="Le taux normal de TVA est de 20 %.", metadata={"source": "CGI", "article": "278"})),
+    ("id-foncier", Document(page_content="La taxe foncière est due au 1er janvier.", metadata={"source": "BOFiP"})),
+    ("id-succession", Document(page_content="Droits de succession en ligne directe.",
+                               metadata={"source": "BOFiP", "date": "2024-01-01", "tags": ["DMTG", "é"]})),
+]
+
+
+@pytest.fixture
+def docstore_path(tmp_path):
+    path = str(tmp_path / SQLITE_DOCSTORE_FILE)
+    write_sqlite_docstore(path, DOCUMENTS)
+    return path
+
+
+@pytest.fixture
+def docstore(docstore_path):
+    store = SQLiteDocstore(docstore_path)
+    yield store
+    store.close()
+
+
+def write_index(store_dir, count=len(DOCUMENTS)):
+    embeddings = DeterministicFakeEmbedding(size=DIMENSION)
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(np.array(embeddings.embed_documents([doc.page_content for _, doc in DOCUMENTS[:count]]),
+                       dtype=np.float32))
+    faiss.write_index(index, str(store_dir / "index.faiss"))
+    return embeddings
+
+
+def write_pickle(store_dir, documents=DOCUMENTS, order=None):
+    """Docstore LangChain picklé (index.pkl), au format de FAISS.save_local"""
+    order = order or [doc_id for doc_id, _ in documents]
+    docstore = InMemoryDocstore(dict(documents))
+    with open(store_dir / "index.pkl", "wb") as f:
+        pickle.dump((docstore, dict(enumerate(order))), f)
+
+
+class TestSQLiteDocstore:
+
+    def test_round_trip(self, docstore):
+        """Chaque document écrit est relu à l'identique (contenu, métadonnées, identifiant)"""
+        for doc_id, doc in DOCUMENTS:
+            found = docstore.search(doc_id)
+            assert isinstance(found, Document)
+            assert found.id == doc_id
+            assert found.page_content == doc.page_content
+            assert found.metadata == doc.metadata
+
+    def test_unknown_id(self, docstore):
+        assert docstore.search("absent") == "ID absent not found."
+
+    def test_index_to_docstore_id(self, docstore):
+        assert docstore.index_to_docstore_id() == {0: "id-tva", 1: "id-foncier", 2: "id-succession"}
+
+    @pytest.mark.parametrize("offset, limit, positions", [
+        (0, 2, [0, 1]), (1, 2, [1, 2]), (2, 10, [2]), (3, 5, []), (0, 0, []),
+    ])
+    def test_page(self, docstore, offset, limit, positions):
+        page = docstore.page(offset, limit)
+        assert [position for position, _ in page] == positions
+        assert [doc.id for _, doc in page] == [DOCUMENTS[position][0] for position in positions]
+
+    def test_info(self, docstore):
+        info = docstore.info()
+        assert info["document_count"] == 3
+        assert info["metadata_keys"] == ["article", "date", "source", "tags"]
+
+    def test_read_only(self, docstore):
+        with pytest.raises(Exception):
+            docstore._connection().execute("DELETE FROM documents")
+
+    def test_missing_file(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            SQLiteDocstore(str(tmp_path / "absent.sqlite"))
+
+    def test_rewrite_replaces_file(self, docstore_path):
+        write_sqlite_docstore(docstore_path, DOCUMENTS[:1])
+        store = SQLiteDocstore(docstore_path)
+        assert store.index_to_docstore_id() == {0: "id-tva"}
+        store.close()
+
+    def test_close_all_thread_connections(self, docstore):
+        """close() ferme aussi les connexions ouvertes par les threads de recherche"""
+        threads = [threading.Thread(target=docstore.search, args=("id-tva",)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        connections = list(docstore._connections)
+        assert len(connections) == 3
+
+        docstore.close()
+        for connection in connections:
+            with pytest.raises(Exception):
+                connection.execute("SELECT 1")
+        # Une recherche après close() rouvre une connexion
+        assert isinstance(docstore.search("id-tva"), Document)
+
+
+class TestConvertPickleDocstore:
+
+    def test_keeps_index_to_docstore_id(self, tmp_path):
+        """La conversion suit l'ordre de l'index FAISS du pickle, pas celui du docstore"""
+        order = ["id-succession", "id-tva", "id-foncier"]
+        write_pickle(tmp_path, order=order)
+        output = convert_pickle_docstore(str(tmp_path))
+
+        store = SQLiteDocstore(output)
+        assert store.index_to_docstore_id() == dict(enumerate(order))
+        assert store.search("id-foncier").page_content == "La taxe foncière est due au 1er janvier."
+        store.close()
+
+    def test_missing_document(self, tmp_path):
+        write_pickle(tmp_path, documents=DOCUMENTS[:2], order=["id-tva", "id-foncier", "id-absent"])
+        with pytest.raises(ValueError):
+            convert_pickle_docstore(str(tmp_path))
+
+
+class TestLoadFaissStore:
+
+    def test_sqlite_store(self, tmp_path):
+        embeddings = write_index(tmp_path)
+        write_sqlite_docstore(str(tmp_path / SQLITE_DOCSTORE_FILE), DOCUMENTS)
+        store = load_faiss_store(str(tmp_path), embeddings, mode="memory")
+        assert isinstance(store.docstore, SQLiteDocstore)
+
+        (doc, _), = store.similarity_search_with_score("Le taux normal de TVA est de 20 %.", k=1)
+        assert doc.id == "id-tva"
+        store.docstore.close()
+
+    def test_pickle_fallback_with_warning(self, tmp_path, caplog):
+        """Sans docstore.sqlite, le pickle est lu et un avertissement invite à le convertir"""
+        embeddings = write_index(tmp_path)
+        write_pickle(tmp_path)
+        with caplog.at_level(logging.WARNING, logger="app.faiss_loader"):
+            store = load_faiss_store(str(tmp_path), embeddings, mode="memory")
+        assert isinstance(store.docstore, InMemoryDocstore)
+        assert "convert_docstore.py" in caplog.text
+        assert store.index_to_docstore_id == {0: "id-tva", 1: "id-foncier", 2: "id-succession"}
+
+    def test_sqlite_preferred_over_pickle(self, tmp_path, caplog):
+        embeddings = write_index(tmp_path)
+        write_pickle(tmp_path)
+        write_sqlite_docstore(str(tmp_path / SQLITE_DOCSTORE_FILE), DOCUMENTS)
+        with caplog.at_level(logging.WARNING, logger="app.faiss_loader"):
+            store = load_faiss_store(str(tmp_path), embeddings, mode="memory")
+        assert isinstance(store.docstore, SQLiteDocstore)
+        assert "convert_docstore.py" not in caplog.text
+        store.docstore.close()
+
+    @pytest.mark.parametrize("indexed", [2, 4])
+    def test_id_map_length_checked(self, tmp_path, indexed):
+        """Un docstore dont la table de correspondance ne couvre pas exactement l'index est refusé"""
+        if indexed > len(DOCUMENTS):
+            embeddings = DeterministicFakeEmbedding(size=DIMENSION)
+            index = faiss.IndexFlatL2(DIMENSION)
+            index.add(np.random.default_rng(0).random((indexed, DIMENSION), dtype=np.float32))
+            faiss.write_index(index, str(tmp_path / "index.faiss"))
+        else:
+            embeddings = write_index(tmp_path, count=indexed)
+        write_sqlite_docstore(str(tmp_path / SQLITE_DOCSTORE_FILE), DOCUMENTS)
+        with pytest.raises(ValueError, match="incohérent"):
+            load_faiss_store(str(tmp_path), embeddings, mode="memory")
@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import pytest
+
+from app import rag_predictor
+from app.admission import AdmissionController
+
+QUESTION = "Quel est le taux normal de la taxe sur la valeur ajoutée ?"
+
+
+def parse_events(body):
+    """Liste des (événement, données) d'un flux server-sent events"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def names(events):
+    """Séquence des événements, les morceaux de réponse successifs réduits à un seul"""
+    sequence = []
+    for event, _ in events:
+        if not sequence or sequence[-1] != event or event != "answer":
+            sequence.append(event)
+    return sequence
+
+
+@pytest.fixture
+def admission(api, monkeypatch):
+    """Contrôle d'admission propre au test, pour suivre les places occupées"""
+    gate = AdmissionController(max_in_flight=2, batch_max_in_flight=1, interactive_queue_size=4,
+                               interactive_queue_timeout=5, batch_queue_size=4, batch_queue_timeout=5,
+                               retry_after=1)
+    monkeypatch.setattr(api, "admission", gate)
+    return gate
+
+
+class FailingChain:
+    """Chaîne de réponse qui échoue pendant la diffusion"""
+
+    async def astream(self, inputs):
+        yield "Début de réponse"
+        raise RuntimeError("LLM indisponible")
+
+
+class BlockedChain:
+    """Chaîne de réponse qui produit un morceau puis attend indéfiniment ; note son arrêt"""
+
+    def __init__(self):
+        self.stopped = False
+
+    async def astream(self, inputs):
+        try:
+            yield "Début de réponse"
+            await asyncio.Event().wait()
+        finally:
+            self.stopped = True
+
+
+class TestStreamContract:
+
+    def stream(self, client, question=QUESTION):
+        response = client.post("/ask/stream", json={"question": question})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return parse_events(response.text)
+
+    def test_lazy_event_order(self, client, loaded_chatbot, admission):
+        """Mode lazy : sources, morceaux de réponse puis done avec le response_id du raisonnement"""
+        events = self.stream(client)
+        assert names(events) == ["sources", "answer", "done"]
+
+        sources = events[0][1]["sources"]
+        assert sources and sources[0]["metadata"]["title"] == "278"
+        done = events[-1][1]
+        assert done["answer"] == "".join(data["token"] for event, data in events if event == "answer")
+        assert done["answer"].startswith("Réponse simulée")
+        assert done["response_id"] in loaded_chatbot.reasoning_store
+        assert not done["error"]
+        assert {"retrieval_time", "time_to_first_token", "answer_time", "processing_time"} <= set(done["timings"])
+        assert admission.in_flight == 0
+
+    def test_eager_event_order(self, client, loaded_chatbot, admission, monkeypatch):
+        """Mode eager : le raisonnement est émis avant done"""
+        monkeypatch.setattr(rag_predictor, "REASONING_MODE", "eager")
+        events = self.stream(client)
+        assert names(events) == ["sources", "answer", "reasoning", "done"]
+        done = events[-1][1]
+        assert done["reasoning"] == events[-2][1]["reasoning"]
+        assert "reasoning_time" in done["timings"]
+
+    def test_generation_failure(self, client, loaded_chatbot, admission, monkeypatch):
+        """Un échec de génération produit un événement error puis done marqué en erreur"""
+        monkeypatch.setattr(loaded_chatbot, "answer_chain", FailingChain())
+        events = self.stream(client)
+        assert names(events) == ["sources", "answer", "error", "done"]
+        assert "LLM indisponible" in events[-2][1]["detail"]
+        done = events[-1][1]
+        assert done["error"]
+        assert done["answer"] == "Début de réponse"
+        assert admission.in_flight == 0
+
+    def test_not_ready(self, api, client, loaded_chatbot, admission):
+        api.app.dependency_overrides.clear()
+        loaded_chatbot.status = "loading"
+        response = client.post("/ask/stream", json={"question": QUESTION})
+        assert response.status_code == 503
+        assert admission.in_flight == 0
+
+    def test_disconnect_releases_admission(self, api, loaded_chatbot, admission, monkeypatch):
+        """Un client qui se déconnecte en cours de flux rend sa place et arrête la génération"""
+        chain = BlockedChain()
+        monkeypatch.setattr(loaded_chatbot, "answer_chain", chain)
+        body = json.dumps({"question": QUESTION}).encode("utf-8")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0", "spec_version": "2.3"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": "/ask/stream", "raw_path": b"/ask/stream",
+            "root_path": "", "query_string": b"", "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+
+        async def scenario():
+            received, streamed, gone = [], [], asyncio.Event()
+            in_flight = []
+
+            async def receive():
+                if not received:
+                    received.append(True)
+                    return {"type": "http.request", "body": body, "more_body": False}
+                await gone.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.body":
+                    streamed.append(message.get("body", b"").decode("utf-8"))
+                    # Départ du client dès le premier morceau de réponse
+                    if "event: answer" in streamed[-1]:
+                        in_flight.append(admission.in_flight)
+                        gone.set()
+
+            await asyncio.wait_for(api.app(scope, receive, send), timeout=5)
+            return "".join(streamed), in_flight
+
+        streamed, in_flight = asyncio.run(scenario())
+        assert in_flight == [1]
+        assert "event: done" not in streamed
+        assert chain.stopped
+        assert admission.in_flight == 0
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Script d'apprentissage du modèle d'embedding local TF-IDF + SVD.
+
+Le modèle est appris sur les exports JSONL du corpus puis enregistré dans
+TFIDF_MODEL_PATH (par défaut app/local_models/tfidf_svd.npz). Il est ensuite
+utilisé avec EMBEDDING_PROVIDER=tfidf, aussi bien pour construire les vector
+stores (embed_corpus.py) que pour vectoriser les questions dans l'API.
+
+Exemple :
+    python train_tfidf_embeddings.py bofip_documents.jsonl bofip_bareme.jsonl cgi_documents.jsonl
+    EMBEDDING_PROVIDER=tfidf python embed_corpus.py bofip_documents.jsonl bofip_bareme.jsonl cgi_documents.jsonl
+"""
+
+import sys
+import time
+import logging
+import argparse
+
+from app.index_builder import read_jsonl_documents
+from app.local_embeddings import TfidfSvdEmbeddings
+from app.providers import TFIDF_MODEL_PATH
+
+# Configuration du logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger("train_tfidf_embeddings")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apprentissage du modèle d'embedding TF-IDF + SVD")
+    parser.add_argument("sources", nargs="+", help="Fichiers JSONL du corpus")
+    parser.add_argument("--output", default=TFIDF_MODEL_PATH, help="Fichier .npz du modèle")
+    parser.add_argument("--dimension", type=int, default=256, help="Dimension des embeddings")
+    parser.add_argument("--max-features", type=int, default=20000, help="Taille maximale du vocabulaire")
+    parser.add_argument("--min-df", type=int, default=2, help="Nombre minimal de documents par terme")
+    parser.add_argument("--sample-size", type=int, default=20000, help="Documents utilisés pour la SVD")
+    parser.add_argument("--seed", type=int, default=0, help="Graine de l'échantillonnage")
+    args = parser.parse_args()
+
+    texts = []
+    for path in args.sources:
+        documents = [doc.page_content for doc in read_jsonl_documents(path)]
+        logger.info(f"{len(documents)} documents lus dans {path}")
+        texts.extend(documents)
+
+    start = time.perf_counter()
+    model = TfidfSvdEmbeddings.fit(texts, dimension=args.dimension, max_features=args.max_features,
+                                   min_df=args.min_df, sample_size=args.sample_size, seed=args.seed)
+    model.save(args.output)
+
+    print(f"✅ Modèle TF-IDF + SVD appris en {time.perf_counter() - start:.1f}s sur {len(texts)} documents "
+          f"({len(model.vocabulary)} termes, {model.dimension} dimensions) -> {args.output}")
+    print(f"   Identifiant du modèle: tfidf-svd-{model.fingerprint}")
+
+
+if __name__ == "__main__":
+    main()
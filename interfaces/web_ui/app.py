@@ -3,12 +3,13 @@ import os
 import time
 import requests
 from components.sidebar import render_sidebar
-from utils.utils import call_private_api
+from utils.utils import call_private_api, fetch_reasoning
 
 # Configuration
 API_URL = os.getenv("API_URL", "http://api:8080/ask")
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 RETRY_DELAY = int(os.getenv("RETRY_DELAY", "10"))
+REASONING_TIMEOUT = int(os.getenv("REASONING_TIMEOUT", "60"))
 
 
 if "request_timestamps" not in st.session_state:
@@ -50,11 +51,37 @@ if not st.session_state.messages:
     st.title("💬 Fiscalia")
     st.write("Posez vos questions sur la fiscalité française et obtenez des réponses précises basées sur les textes officiels.")
 
+def render_reasoning(msg, key):
+    """Bloc dépliant du raisonnement ; s'il n'a pas encore été généré, un bouton le demande à l'API."""
+    if not msg.get("reasoning") and not msg.get("response_id"):
+        return
+    with st.expander("🧠 Raisonnement détaillé", expanded=False):
+        if not msg.get("reasoning"):
+            if not st.button("Afficher le raisonnement", key=f"reasoning_{key}"):
+                return
+            try:
+                with st.spinner("Génération du raisonnement..."):
+                    res = fetch_reasoning(msg["response_id"], API_URL, REASONING_TIMEOUT)
+                if res.status_code == 404:
+                    st.info("Ce raisonnement n'est plus disponible, posez à nouveau la question pour l'obtenir.")
+                    return
+                res.raise_for_status()
+                msg["reasoning"] = res.json()["reasoning"]
+            except RuntimeError as rate_error:
+                st.warning(str(rate_error))
+                return
+            except Exception:
+                st.warning("Le raisonnement n'a pas pu être généré, veuillez réessayer.")
+                return
+        st.markdown(msg["reasoning"], unsafe_allow_html=True)
+
+
 # Affiche l'historique des messages avec le style par défaut de Streamlit
-for msg in st.session_state.messages:
+for index, msg in enumerate(st.session_state.messages):
     role = msg["role"]
     content = msg["content"]
     st.chat_message(role).markdown(content, unsafe_allow_html=True)
+    render_reasoning(msg, index)
 
 # Toujours afficher le champ de saisie
 question_from_input = st.chat_input("Posez votre question fiscale ici...")
@@ -76,6 +103,7 @@ if question:
 
     # Appelle l'API avec retry
     with st.spinner("Recherche en cours..."):
+        response_id = None
         retry_count = 0
         success = False
         error_message = None
@@ -104,6 +132,8 @@ if question:
                 
                 answer = data["answer"]
                 reasoning = data.get("reasoning", "")
+                # Raisonnement généré à la demande : l'API renvoie son identifiant
+                response_id = data.get("response_id")
                 sources = data.get("sources", [])
 
                 # Format réponse + sources
@@ -178,7 +208,14 @@ if question:
                     time.sleep(RETRY_DELAY)
 
             except RuntimeError as rate_error:
-                st.warning(str(rate_error))
+                # API saturée (429) : on patiente le délai indiqué avant de réessayer
+                retry_count += 1
+                error_message = "Notre assistant fiscal est très sollicité"
+                
+                if retry_count < MAX_RETRIES:
+                    delay = getattr(rate_error, "retry_after", RETRY_DELAY)
+                    status_container.warning(str(rate_error))
+                    time.sleep(delay)
                     
             except Exception as e:
                 # Autres erreurs
@@ -205,9 +242,8 @@ if question:
 
     # Affiche la réponse principale dans le chat
     st.chat_message("assistant").markdown(full_answer, unsafe_allow_html=True)
-    st.session_state.messages.append({"role": "assistant", "content": full_answer})
+    message = {"role": "assistant", "content": full_answer, "reasoning": reasoning, "response_id": response_id}
+    st.session_state.messages.append(message)
 
     # Affiche le raisonnement dans un bloc dépliant
-    if reasoning:
-        with st.expander("🧠 Raisonnement détaillé", expanded=False):
-            st.markdown(reasoning, unsafe_allow_html=True)
\ No newline at end of file
+    render_reasoning(message, len(st.session_state.messages) - 1)
\ No newline at end of file
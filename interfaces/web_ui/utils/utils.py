@@ -4,13 +4,41 @@ import os
 import requests
 
 USE_AUTH = os.getenv("USE_AUTH", "false").lower() == "true"
+# Délai d'attente par défaut si l'API ne précise pas de Retry-After (secondes)
+DEFAULT_RETRY_AFTER = 5
+
+
+class RateLimitError(RuntimeError):
+    """L'API refuse la question faute de capacité (429) ; retry_after en secondes."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"L'assistant est très sollicité, nouvelle tentative dans {retry_after}s ⏳")
+        self.retry_after = retry_after
+
+
+def _auth_headers(API_URL):
+    if not USE_AUTH:
+        return {}
+    from google.auth.transport.requests import Request
+    from google.oauth2 import id_token
+    token = id_token.fetch_id_token(Request(), API_URL)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _check_rate_limit(response):
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        raise RateLimitError(int(retry_after) if retry_after.isdigit() else DEFAULT_RETRY_AFTER)
+
 
 def call_private_api(question, API_URL, timeout):
-    headers = {}
-    if USE_AUTH:
-        from google.auth.transport.requests import Request
-        from google.oauth2 import id_token
-        token = id_token.fetch_id_token(Request(), API_URL)
-        headers = {"Authorization": f"Bearer {token}"}
-    response = requests.post(API_URL, headers=headers, json={"question": question}, timeout=timeout)
-    return response
\ No newline at end of file
+    response = requests.post(API_URL, headers=_auth_headers(API_URL), json={"question": question}, timeout=timeout)
+    _check_rate_limit(response)
+    return response
+
+
+def fetch_reasoning(response_id, API_URL, timeout):
+    """Demande le raisonnement détaillé d'une réponse (généré à la demande par l'API)."""
+    response = requests.get(f"{API_URL}/{response_id}/reasoning", headers=_auth_headers(API_URL), timeout=timeout)
+    _check_rate_limit(response)
+    return response